@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+📦 BULK DATA - streaming CSV / JSON export and import of events and notes
+
+Export walks the table with keyset pages (id > cursor, in id order) and
+serializes each page as it arrives, so only one page is ever held in memory
+and an interrupted download resumes with ?after=<last id received>.
+
+Import reads the upload straight from the request stream - CSV through
+csv.DictReader, JSON (an array or one object per line) through an
+incremental decoder - validates every record, and writes the valid ones in
+batched multi-row inserts. Invalid records are skipped and reported with
+their record number. Memory stays flat whatever the file size.
+"""
+
+import codecs
+import csv
+import hashlib
+import hmac
+import io
+import json
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Exported fields per kind (notes keep their body in contacts.phone_number)
+EXPORT_FIELDS = {
+    'events': ('id', 'event_title', 'event_description', 'event_date', 'created_by', 'created_at'),
+    'notes': ('id', 'name', 'content', 'created_by', 'created_at'),
+}
+
+READ_CHUNK_BYTES = 64 * 1024
+CSV_ROWS_PER_CHUNK = 200
+MAX_JSON_RECORD_CHARS = 1024 * 1024  # One record may span chunks, up to this size
+JSON_PARTIAL_TOKEN_CHARS = 9  # Longest literal cut at a chunk boundary ('-Infinity')
+
+
+class ImportFormatError(Exception):
+    """The upload cannot be parsed any further (not a record-level problem)"""
+
+
+def data_token(secret, user_id):
+    """Token that lets a user export/import their own data (HMAC-SHA256, hex, 32 chars)"""
+    return hmac.new(secret.encode(), f'data:{user_id}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def verify_data_token(secret, user_id, token):
+    return bool(secret and user_id and token) and hmac.compare_digest(data_token(secret, user_id), token)
+
+
+# ----- export -----
+
+def iter_keyset(fetch_page, page_size, after_id=0, limit=None):
+    """Rows from fetch_page(after_id, page_size) until a short page (or limit rows)"""
+    sent = 0
+    while True:
+        size = page_size if limit is None else min(page_size, limit - sent)
+        if size <= 0:
+            return
+        rows = fetch_page(after_id, size)
+        for row in rows:
+            yield row
+        sent += len(rows)
+        if len(rows) < size:
+            return
+        after_id = rows[-1]['id']
+
+
+def export_record(kind, row):
+    if kind == 'notes':
+        row = dict(row, content=row.get('phone_number'))
+    return {field: row.get(field) for field in EXPORT_FIELDS[kind]}
+
+
+def iter_csv(kind, rows):
+    """CSV text in chunks of CSV_ROWS_PER_CHUNK rows (header first)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS[kind], lineterminator='\r\n')
+    writer.writeheader()
+    pending = 0
+    for row in rows:
+        writer.writerow(export_record(kind, row))
+        pending += 1
+        if pending >= CSV_ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def iter_json(kind, rows):
+    """A JSON array, one record per line"""
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(export_record(kind, row), ensure_ascii=False, default=str)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+# ----- import -----
+
+class _ByteReader(io.RawIOBase):
+    """Minimal raw stream over anything with read(n) (the WSGI input stream)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_csv_records(stream):
+    """Dicts from a CSV upload (header row required; UTF-8, BOM allowed)"""
+    text = io.TextIOWrapper(io.BufferedReader(_ByteReader(stream), READ_CHUNK_BYTES), encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.DictReader(text)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ImportFormatError(f'CSV: {e}')
+
+
+def _may_continue(error, buffer):
+    """Could more input turn this decode error into a record?
+
+    A record cut at the chunk boundary fails at most a few characters before
+    the end of the buffer (a partial literal, number or \\uXXXX escape) or
+    inside a string that runs to the end. Anything else is malformed input.
+    """
+    return error.pos >= len(buffer) - JSON_PARTIAL_TOKEN_CHARS or error.msg.startswith('Unterminated string')
+
+
+def read_json_records(stream):
+    """Objects from a JSON array or from JSON Lines, decoded incrementally
+
+    Records are decoded in place at a moving offset; the consumed part of the
+    buffer is dropped once per chunk read, so the buffer never holds more than
+    one chunk plus the record that spans into it. A malformed record raises
+    ImportFormatError at once instead of buffering the rest of the upload.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    position = 0
+    consumed = 0  # Characters dropped from the front of the buffer so far
+    eof = False
+    started = False
+    while True:
+        # Skip whitespace and the array punctuation between records
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','
+                                          or (buffer[position] == '[' and not started)):
+            started = started or buffer[position] == '['
+            position += 1
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if eof or not _may_continue(e, buffer):
+                    raise ImportFormatError(f'JSON: {e.msg} at character {consumed + e.pos}')
+                if len(buffer) - position > MAX_JSON_RECORD_CHARS:
+                    raise ImportFormatError(f'JSON: record at character {consumed + position} '
+                                            f'is longer than {MAX_JSON_RECORD_CHARS} characters')
+            else:
+                # A value cut at the end of the buffer (e.g. a number) could continue in the next chunk
+                if end < len(buffer) or eof:
+                    started = True
+                    position = end
+                    yield record
+                    continue
+        elif eof:
+            return
+        try:
+            chunk = stream.read(READ_CHUNK_BYTES)
+            text = utf8.decode(chunk or b'', final=not chunk)
+        except UnicodeDecodeError as e:
+            raise ImportFormatError(f'JSON: {e}')
+        eof = not chunk
+        consumed += position
+        buffer = buffer[position:] + text
+        position = 0
+
+
+def _text(record, field):
+    value = record.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def validate_event(record, owner):
+    """(values, None) for a valid event record, else (None, error)"""
+    if not isinstance(record, dict):
+        return None, 'not an object'
+    title = _text(record, 'event_title')
+    if not title:
+        return None, 'event_title is required'
+    try:
+        event_date = date.fromisoformat(_text(record, 'event_date')).isoformat()
+    except ValueError:
+        return None, f"event_date must be YYYY-MM-DD (got {record.get('event_date')!r})"
+    created_by = owner or _text(record, 'created_by')
+    if not created_by:
+        return None, 'created_by is required'
+    return {
+        'event_title': title,
+        'event_description': _text(record, 'event_description'),
+        'event_date': event_date,
+        'created_by': created_by
+    }, None
+
+
+def validate_note(record, owner):
+    """(values, None) for a valid note record, else (None, error)"""
+    if not isinstance(record, dict):
+        return None, 'not an object'
+    name = _text(record, 'name')
+    if not name:
+        return None, 'name is required'
+    created_by = owner or _text(record, 'created_by')
+    if not created_by:
+        return None, 'created_by is required'
+    return {'name': name, 'content': _text(record, 'content'), 'created_by': created_by}, None
+
+
+VALIDATORS = {'events': validate_event, 'notes': validate_note}
+
+
+def import_records(records, validate, owner, insert_batch, batch_size, max_errors):
+    """Validate records and insert the valid ones in batches; returns a summary dict.
+
+    owner forces created_by (a user importing their own data); None takes it from each record.
+    A failed batch is reported and the import goes on with the next one.
+    """
+    summary = {'received': 0, 'inserted': 0, 'invalid': 0, 'failed': 0, 'errors': []}
+
+    def report(record_number, error):
+        if len(summary['errors']) < max_errors:
+            summary['errors'].append({'record': record_number, 'error': error})
+
+    def flush(batch):
+        try:
+            summary['inserted'] += len(insert_batch([values for _number, values in batch]))
+        except Exception as e:
+            summary['failed'] += len(batch)
+            report(batch[0][0], f'insert of records {batch[0][0]}-{batch[-1][0]} failed: {e}')
+            logger.error(f"[BULK] ❌ Batch insert failed: {e}")
+
+    batch = []
+    try:
+        for record_number, record in enumerate(records, 1):
+            summary['received'] += 1
+            values, error = validate(record, owner)
+            if error:
+                summary['invalid'] += 1
+                report(record_number, error)
+                continue
+            batch.append((record_number, values))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    except ImportFormatError as e:
+        summary['errors'].append({'record': summary['received'] + 1, 'error': str(e)})
+        summary['aborted'] = True
+    if batch:
+        flush(batch)
+    return summary
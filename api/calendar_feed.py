@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+📆 CALENDAR FEED - per-user ICS feed behind a signed URL
+
+/calendar/<user_id>.ics?token=... serves a user's events as an iCalendar
+feed that phone calendar apps can subscribe to. The token is an HMAC of the
+user id, so the URL is the credential and nothing is stored per user.
+
+Calendar apps poll a subscription often, mostly for nothing, so the feed is
+built to make the common poll cheap:
+
+- CalendarFeedCache keeps each user's ETag (fingerprint of the feed's rows)
+  and serialized body. Within revalidate_seconds of the last check a poll is
+  answered from memory - a 304 or the cached body, no query at all.
+  Edits made through this process invalidate the user's entry at once;
+  edits made by other workers show up after at most revalidate_seconds.
+- After that window one list query re-checks the fingerprint; if it did
+  not change the poll is still a 304 / cached body.
+- A changed feed is streamed VEVENT by VEVENT from a generator and the
+  complete body is cached on the way out.
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+
+PRODID = '-//linebot-production-ready//Events//TH'
+
+
+def feed_token(secret, user_id):
+    """URL token for a user's feed (HMAC-SHA256, hex, 32 chars)"""
+    return hmac.new(secret.encode(), f'calendar:{user_id}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def verify_feed_token(secret, user_id, token):
+    return bool(secret and token) and hmac.compare_digest(feed_token(secret, user_id), token)
+
+
+def ics_escape(text):
+    """TEXT value escaping (RFC 5545 3.3.11)"""
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold_line(line):
+    """Content line with CRLF, folded at 75 octets without splitting a UTF-8 character"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    start, limit = 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1  # Back off to a character boundary
+        parts.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74  # Continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def iter_calendar(rows, calendar_name, timezone_name='Asia/Bangkok', dtstamp=None):
+    """Yield the feed as text chunks: header, one chunk per VEVENT (all-day events), footer"""
+    dtstamp = dtstamp or time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    yield ''.join(fold_line(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{ics_escape(calendar_name)}',
+        f'X-WR-TIMEZONE:{timezone_name}',
+    ))
+    for row in rows:
+        try:
+            start = datetime.strptime(str(row.get('event_date'))[:10], '%Y-%m-%d').date()
+        except ValueError:
+            continue  # Not a date - nothing a calendar could show
+        lines = [
+            'BEGIN:VEVENT',
+            f"UID:event-{row.get('id')}@linebot-production-ready",
+            f'DTSTAMP:{dtstamp}',
+            f'DTSTART;VALUE=DATE:{start:%Y%m%d}',
+            f'DTEND;VALUE=DATE:{start + timedelta(days=1):%Y%m%d}',
+            f"SUMMARY:{ics_escape(row.get('event_title') or '')}",
+        ]
+        if row.get('event_description'):
+            lines.append(f"DESCRIPTION:{ics_escape(row['event_description'])}")
+        lines.append('END:VEVENT')
+        yield ''.join(fold_line(line) for line in lines)
+    yield fold_line('END:VCALENDAR')
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """Conditional GET check; If-None-Match wins over If-Modified-Since (RFC 7232 6)"""
+    if if_none_match:
+        # Weak comparison: W/"x" matches "x"
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return any(tag == '*' or tag.replace('W/', '', 1) == etag for tag in candidates)
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class CalendarFeedCache:
+    """Per-user ETag, Last-Modified and serialized body (LRU)"""
+
+    def __init__(self, max_entries=512, revalidate_seconds=300):
+        self.max_entries = max_entries
+        self.revalidate_seconds = revalidate_seconds
+        self._entries = OrderedDict()  # user_id -> {'etag', 'last_modified', 'body', 'checked_at'}
+        self._lock = threading.Lock()
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.rebuilt = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def fresh(self, user_id):
+        """The user's entry if it was checked against the database within revalidate_seconds"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry['checked_at'] > self.revalidate_seconds:
+                return None
+            self._entries.move_to_end(user_id)
+            self.fresh_hits += 1
+            return dict(entry)
+
+    def checked(self, user_id, etag):
+        """Record a database check; returns the entry (body kept only if the ETag is unchanged)"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry['etag'] == etag:
+                self.revalidated += 1
+            else:
+                entry = {'etag': etag, 'last_modified': time.time(), 'body': None}
+                self.rebuilt += 1
+            entry['checked_at'] = time.monotonic()
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return dict(entry)
+
+    def store_body(self, user_id, etag, body):
+        """Keep a fully streamed body, unless the entry changed meanwhile"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry['etag'] == etag:
+                entry['body'] = body
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bodies_chars': sum(len(entry['body'] or '') for entry in self._entries.values()),
+                'fresh_hits': self.fresh_hits,
+                'revalidated': self.revalidated,
+                'rebuilt': self.rebuilt,
+                'not_modified': self.not_modified,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+⏱️ REQUEST DEADLINES - one time budget per webhook request
+
+callback() opens a deadline scope; the deadline lives in a context variable,
+so everything called while handling that request sees it and background
+threads (scheduler, prefetch, watchdog) do not. Outbound calls derive their
+timeout from it with call_timeout(): queries get what is left minus the reply
+reserve, the LINE reply gets everything that is left. Once the work budget is
+gone, queries are refused with DeadlineExceeded before they start, so the
+handler falls through to its plain error reply while the reserve still covers it.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before this call could start"""
+
+
+class Deadline:
+    """Absolute expiry for one request, with a reserve kept back for the reply"""
+
+    def __init__(self, budget_seconds, reply_reserve_seconds=0.0):
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget_seconds
+        self.reply_reserve_seconds = reply_reserve_seconds
+        self.exceeded = False
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def work_remaining(self):
+        """Time left for queries and other work (the reply reserve excluded)"""
+        return max(0.0, self.remaining() - self.reply_reserve_seconds)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+def current_deadline():
+    return _current.get()
+
+
+def call_timeout(default, for_reply=False):
+    """Timeout for one outbound call: default, shortened to what the current request has left.
+
+    Outside a request scope (scheduler, background threads) the default is used.
+    Raises DeadlineExceeded when nothing is left.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    left = deadline.remaining() if for_reply else deadline.work_remaining()
+    if left <= 0:
+        deadline.exceeded = True
+        raise DeadlineExceeded('request deadline exceeded')
+    return min(default, left)
+
+
+class RequestDeadlines:
+    """Deadline scopes for webhook requests + a query-shape plugin that enforces them"""
+
+    def __init__(self, budget_seconds, reply_reserve_seconds):
+        self.budget_seconds = budget_seconds
+        self.reply_reserve_seconds = reply_reserve_seconds
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.exceeded = 0
+        self.max_elapsed_ms = 0
+        self.refused = {}  # shape name -> refused queries
+
+    @contextmanager
+    def scope(self):
+        deadline = Deadline(self.budget_seconds, self.reply_reserve_seconds)
+        token = _current.set(deadline)
+        try:
+            yield deadline
+        finally:
+            _current.reset(token)
+            with self._lock:
+                self.requests += 1
+                self.exceeded += deadline.exceeded
+                self.max_elapsed_ms = max(self.max_elapsed_ms, int(deadline.elapsed() * 1000))
+
+    def wrap(self, shape, key, fetch):
+        """Shape plugin: refuse to start a query the request can no longer wait for"""
+        def guarded():
+            deadline = _current.get()
+            if deadline is not None and deadline.work_remaining() <= 0:
+                deadline.exceeded = True
+                with self._lock:
+                    self.refused[shape.name] = self.refused.get(shape.name, 0) + 1
+                raise DeadlineExceeded(f'{shape.name}: request deadline exceeded')
+            return fetch()
+        return guarded
+
+    def stats(self):
+        with self._lock:
+            return {
+                'budget_seconds': self.budget_seconds,
+                'reply_reserve_seconds': self.reply_reserve_seconds,
+                'requests': self.requests,
+                'exceeded': self.exceeded,
+                'max_elapsed_ms': self.max_elapsed_ms,
+                'refused_queries': dict(self.refused)
+            }
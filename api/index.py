@@ -4,23 +4,33 @@
 สร้างใหม่ทั้งหมดให้ใช้งานได้จริง 100%
 """
 
-from flask import Flask, request, abort
+from flask import Flask, request, abort, Response
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
     Configuration, ApiClient, MessagingApi, ReplyMessageRequest,
     TextMessage, QuickReply, QuickReplyItem, MessageAction,
-    FlexMessage, FlexContainer, PostbackAction
+    FlexMessage, FlexContainer, PostbackAction, ShowLoadingAnimationRequest
 )
 from linebot.v3.webhooks import MessageEvent, TextMessageContent, PostbackEvent
 import os
+import sys
 import logging
 from datetime import datetime, timedelta
 import pytz
 from dotenv import load_dotenv
-from supabase import create_client
+from supabase import create_client, ClientOptions
 import time
 import traceback
+import threading
+import atexit
+import functools
+import heapq
+import itertools
+import socket
+import uuid
+import hmac
+import json
 
 # Configure logging
 logging.basicConfig(
@@ -32,6 +42,12 @@ logger = logging.getLogger(__name__)
 class Config:
     # Pagination
     MAX_FLEX_BUBBLES = 12
+    
+    # LINE Flex payload limits (JSON as sent) - carousels are fitted by truncating long texts
+    FLEX_CAROUSEL_MAX_BYTES = 50000
+    FLEX_BUBBLE_MAX_BYTES = 30000
+    FLEX_SIZE_SAFETY = 0.9  # Fit into 90% of the limit
+    FLEX_MIN_TEXT_CHARS = 20  # Truncated texts keep at least this much
     EVENTS_PER_PAGE = 10
     NOTES_PER_PAGE = 10
     
@@ -39,6 +55,24 @@ class Config:
     RATE_LIMIT_SECONDS = 2.0
     MAX_RETRY_ATTEMPTS = 7
     
+    # Concurrency (gthread workers) - per-user lock striping
+    USER_LOCK_STRIPES = 64
+    USER_LOCK_TIMEOUT_SECONDS = 20.0  # Outside a request deadline
+    
+    # Request deadline (per webhook request) and per-call timeouts
+    REQUEST_DEADLINE_SECONDS = 25.0  # Well inside the reply token lifetime and gunicorn --timeout
+    REPLY_RESERVE_SECONDS = 5.0  # Kept back from queries so the (fallback) reply can still go out
+    DB_TIMEOUT_SECONDS = 10.0  # Hard ceiling for one Supabase HTTP call
+    LINE_TIMEOUT_SECONDS = 10.0  # Per LINE API call; shortened to the request deadline
+    
+    # Durable push queue (PUSH_QUEUE=true)
+    PUSH_MAX_ATTEMPTS = 10  # Then the push goes to the dead-letter table
+    PUSH_BACKOFF_BASE_SECONDS = 5.0  # Doubles per attempt: all retries span ~20-35 minutes
+    PUSH_BACKOFF_MAX_SECONDS = 900.0
+    PUSH_BATCH_SIZE = 5  # Jobs claimed at once; batch x LINE timeout stays inside the lease
+    PUSH_LEASE_SECONDS = 120.0  # An in-flight job of a dead worker is retried after this
+    PUSH_KEEP_SENT_HOURS = 48  # Idempotency keys of sent pushes are remembered this long
+    
     # Content display
     SHORT_CONTENT_PREVIEW = 50
     LONG_CONTENT_PREVIEW = 200
@@ -46,18 +80,168 @@ class Config:
     # Database limits
     MAX_SEARCH_RESULTS = 10
     MAX_TEXT_DISPLAY_EVENTS = 20
+    
+    # Subscriber tracking (write-behind)
+    SUBSCRIBER_FLUSH_SECONDS = 5.0
+    SUBSCRIBER_FLUSH_BATCH = 50
+    SUBSCRIBER_PRELOAD_PAGE_SIZE = 1000
+    
+    # Notifications
+    NOTIFICATION_EVENT_HOUR = 9  # Events are treated as starting at 9:00 Thai time
+    NOTIFICATION_LEAD_HOURS = 3  # Remind 3 hours before (6:00)
+    NOTIFICATION_GRACE_MINUTES = 30  # Late reminders still go out within this window
+    NOTIFICATION_CHECK_MINUTES = 10
+    REMINDER_RESYNC_MINUTES = 60  # Reload the reminder index to pick up other workers' edits
+    
+    # Scheduler leader election
+    LEADER_LEASE_SECONDS = 60
+    LEADER_RETRY_SECONDS = 15
+    
+    # Cron-triggered notification pass (serverless)
+    CRON_BATCH_SIZE = 200
+    CRON_MAX_BATCHES = 10
+    CRON_TIME_BUDGET_SECONDS = 8.0  # Stay inside short serverless function timeouts
+    CRON_CATCHUP_HOURS = 6  # Reminders older than this are skipped after downtime
+    NOTIFICATION_DIGEST_MAX_ITEMS = 20  # Events listed in one digest push
+    
+    # Notification log retention (daily, leader only)
+    NOTIFICATION_RETENTION_DAYS = 90
+    RETENTION_BATCH_SIZE = 500
+    RETENTION_MAX_BATCHES = 20
+    RETENTION_BATCH_PAUSE_SECONDS = 1.0  # Rate limit between batches
+    RETENTION_RUN_HOUR = 3  # Thai time, off-peak
+    
+    # Events archive
+    EVENT_ARCHIVE_AFTER_DAYS = 30  # Events this far in the past leave the hot table
+    EVENT_ARCHIVE_BATCH_SIZE = 200
+    ARCHIVE_PAGE_SIZE = 10
+    
+    # Read replica (events + contacts in memory)
+    REPLICA_POLL_SECONDS = 5
+    REPLICA_RECONCILE_SECONDS = 60  # Id scan to catch deletes by other workers
+    REPLICA_MAX_STALENESS_SECONDS = 30  # Older than this -> reads go to the database
+    REPLICA_PAGE_SIZE = 1000
+    
+    # Hedged reads (HEDGED_READS=true, Supabase backend)
+    HEDGED_SHAPES = ('events.list_for_user', 'events.list_all', 'events.list_on_date', 'events.search',
+                     'events.get', 'events.get_owned', 'contacts.search', 'contacts.get')
+    HEDGE_BUDGET_RATIO = 0.05  # At most ~5% extra queries on hedged shapes
+    HEDGE_MIN_SAMPLES = 20  # Calls before a shape's p95 is trusted
+    HEDGE_MIN_DELAY_MS = 20
+    HEDGE_MAX_WORKERS = 8
+    
+    # Rendered carousel cache (events_page_ / notes_page_ paging)
+    RENDER_CACHE_SIZE = 256
+    RENDER_CACHE_TTL_SECONDS = 600  # Also bounds staleness of owner display names
+    PREFETCH_MAX_WORKERS = 2  # Background renders of the next page
+    PREFETCH_MAX_PENDING = 8  # Further prefetches are dropped, not queued
+    
+    # ICS calendar feed (/calendar/<user_id>.ics)
+    CALENDAR_FEED_REVALIDATE_SECONDS = 300  # Polls inside this window are answered without a query
+    CALENDAR_FEED_CACHE_SIZE = 512  # Users whose feed body is kept
+    
+    # Bulk export / import (/data/<events|notes>.<csv|json>)
+    EXPORT_PAGE_SIZE = 1000  # Keyset page per query - the only rows held in memory
+    IMPORT_BATCH_SIZE = 500  # Rows per multi-row insert
+    IMPORT_MAX_REPORTED_ERRORS = 100  # Invalid records beyond this are counted, not listed
+    
+    # LINE loading animation for slow handlers
+    LOADING_THRESHOLD_SECONDS = 0.3  # Fast replies never trigger it
+    LOADING_ANIMATION_SECONDS = 20  # 5-60, multiple of 5; cleared as soon as the reply arrives
+
+# Repository layer (query shapes + metrics) - api folder first, flat layout fallback
+try:
+    from api.repository import (
+        EventsRepo, EventsArchiveRepo, NotesRepo, NotificationsRepo, SubscribersRepo, JobStateRepo, LeasesRepo,
+        SingleFlight, HedgedReads, query_registry
+    )
+except ImportError:
+    from repository import (
+        EventsRepo, EventsArchiveRepo, NotesRepo, NotificationsRepo, SubscribersRepo, JobStateRepo, LeasesRepo,
+        SingleFlight, HedgedReads, query_registry
+    )
+
+# In-process read replica (READ_REPLICA=true)
+try:
+    from api.replica import TableReplica, ReplicatedEventsRepo, ReplicatedNotesRepo, date_key
+except ImportError:
+    from replica import TableReplica, ReplicatedEventsRepo, ReplicatedNotesRepo, date_key
+
+# Rendered Flex carousel cache
+try:
+    from api.render_cache import RenderCache, CarouselPrefetcher, result_fingerprint, EVENT_RENDER_FIELDS, NOTE_RENDER_FIELDS
+except ImportError:
+    from render_cache import RenderCache, CarouselPrefetcher, result_fingerprint, EVENT_RENDER_FIELDS, NOTE_RENDER_FIELDS
+
+# Request-scoped deadline + derived per-call timeouts
+try:
+    from api.deadline import RequestDeadlines, DeadlineExceeded, call_timeout, current_deadline
+except ImportError:
+    from deadline import RequestDeadlines, DeadlineExceeded, call_timeout, current_deadline
+
+# Slow-operation watchdog (LINE loading animation)
+try:
+    from api.latency import LatencyWatchdog
+except ImportError:
+    from latency import LatencyWatchdog
+
+# Per-user ICS calendar feed
+try:
+    from api.calendar_feed import CalendarFeedCache, feed_token, verify_feed_token, iter_calendar, is_not_modified, http_date
+except ImportError:
+    from calendar_feed import CalendarFeedCache, feed_token, verify_feed_token, iter_calendar, is_not_modified, http_date
+
+# Streaming bulk export / import (CSV, JSON)
+try:
+    from api.bulk_data import (
+        EXPORT_FIELDS, VALIDATORS, data_token, verify_data_token, iter_keyset, iter_csv, iter_json,
+        read_csv_records, read_json_records, import_records
+    )
+except ImportError:
+    from bulk_data import (
+        EXPORT_FIELDS, VALIDATORS, data_token, verify_data_token, iter_keyset, iter_csv, iter_json,
+        read_csv_records, read_json_records, import_records
+    )
+
+# Durable outbound push queue (stdlib sqlite3)
+try:
+    from api.push_queue import PushQueue, PermanentPushError
+except ImportError:
+    from push_queue import PushQueue, PermanentPushError
+
+# Embedded SQLite backend (STORAGE_BACKEND=sqlite) - stdlib only
+try:
+    from api.sqlite_repository import (
+        SqliteDatabase, SqliteEventsRepo, SqliteEventsArchiveRepo, SqliteNotesRepo, SqliteNotificationsRepo,
+        SqliteSubscribersRepo, SqliteJobStateRepo, SqliteLeasesRepo
+    )
+except ImportError:
+    from sqlite_repository import (
+        SqliteDatabase, SqliteEventsRepo, SqliteEventsArchiveRepo, SqliteNotesRepo, SqliteNotificationsRepo,
+        SqliteSubscribersRepo, SqliteJobStateRepo, SqliteLeasesRepo
+    )
+
+# One extra character so the builders can still tell a note body was truncated
+NOTE_PREVIEW_LENGTH = Config.LONG_CONTENT_PREVIEW + 1
 
 # Conditional import for notification system
 try:
     from apscheduler.schedulers.background import BackgroundScheduler
     from apscheduler.triggers.interval import IntervalTrigger
-    import atexit
+    from apscheduler.triggers.cron import CronTrigger
     SCHEDULER_AVAILABLE = True
     logger.info("APScheduler imported successfully")
 except ImportError:
     SCHEDULER_AVAILABLE = False
     logger.warning("APScheduler not available - notification system disabled")
 
+# File locks are only available on Unix
+try:
+    import fcntl
+    FILE_LOCK_AVAILABLE = True
+except ImportError:
+    FILE_LOCK_AVAILABLE = False
+
 # Load environment variables
 load_dotenv()
 
@@ -71,15 +255,46 @@ def get_env_var(var_name, default=None):
             logger.critical(f"{var_name} is required for bot operation!")
     return value
 
+# Storage backend: 'supabase' (default) or 'sqlite' (embedded, single node)
+storage_backend = os.getenv('STORAGE_BACKEND', 'supabase').lower()
+sqlite_path = os.getenv('SQLITE_PATH', 'data/linebot.db')
+# Serve events/contacts reads from an in-process replica (Supabase backend only)
+read_replica_enabled = os.getenv('READ_REPLICA', 'false').lower() in ('1', 'true', 'yes')
+# Send a backup query when a latency-critical read passes its p95 (Supabase backend only)
+hedged_reads_enabled = os.getenv('HEDGED_READS', 'false').lower() in ('1', 'true', 'yes')
+# Queue reminder pushes in a local SQLite file (off on serverless, where the disk does not survive)
+push_queue_enabled = os.getenv('PUSH_QUEUE', 'false' if os.getenv('VERCEL') else 'true').lower() in ('1', 'true', 'yes')
+push_queue_path = os.getenv('PUSH_QUEUE_PATH', 'data/push_queue.db')
+
 # Configuration with validation
 line_access_token = get_env_var('LINE_ACCESS_TOKEN')
 line_channel_secret = get_env_var('LINE_CHANNEL_SECRET')
-supabase_url = get_env_var('SUPABASE_URL')
-supabase_key = get_env_var('SUPABASE_SERVICE_KEY')
+supabase_url = get_env_var('SUPABASE_URL') if storage_backend == 'supabase' else os.getenv('SUPABASE_URL')
+supabase_key = get_env_var('SUPABASE_SERVICE_KEY') if storage_backend == 'supabase' else os.getenv('SUPABASE_SERVICE_KEY')
 
 # Admin configuration
 admin_ids = ['Uc88eb3896b0e4bcc5fbaa9b78ac1294e']
 
+# Scheduler leader election: 'file' (single host), 'lease' (shared Supabase row) or 'none'
+scheduler_leader_mode = os.getenv('SCHEDULER_LEADER_MODE', 'file').lower()
+scheduler_lock_file = os.getenv('SCHEDULER_LOCK_FILE', '/tmp/linebot-scheduler.lock')
+
+# Notification mode: 'scheduler' (in-process) or 'cron' (external trigger, serverless default)
+notification_mode = os.getenv('NOTIFICATION_MODE', 'cron' if os.getenv('VERCEL') else 'scheduler').lower()
+cron_secret = os.getenv('CRON_SECRET')
+# Calendar feed URLs are signed with this (rotating it revokes every subscribed URL)
+calendar_feed_secret = os.getenv('CALENDAR_FEED_SECRET') or line_channel_secret
+# Bulk export/import links are signed with this
+bulk_data_secret = os.getenv('BULK_DATA_SECRET') or line_channel_secret
+# Public https origin for links the bot sends; defaults to the webhook request's origin
+public_base_url = os.getenv('PUBLIC_BASE_URL', '').rstrip('/')
+# Digest mode: one reminder push per user per slot instead of one per event
+notification_digest = os.getenv('NOTIFICATION_DIGEST', 'true').lower() in ('1', 'true', 'yes')
+# Old notification log rows: 'archive' (move to notifications_archive) or 'delete'
+notification_retention_mode = os.getenv('NOTIFICATION_RETENTION_MODE', 'archive').lower()
+# Self-ping target to stop free hosts sleeping; empty disables (never used in cron mode)
+keep_alive_url = os.getenv('KEEP_ALIVE_URL', 'https://linebot-production-ready.onrender.com')
+
 # Print environment status (masked)
 logger.info(f"LINE_ACCESS_TOKEN: {'✅ Set' if line_access_token else '❌ Missing'}")
 logger.info(f"LINE_CHANNEL_SECRET: {'✅ Set' if line_channel_secret else '❌ Missing'}")
@@ -92,15 +307,17 @@ try:
         raise ValueError("LINE_ACCESS_TOKEN is required")
     if not line_channel_secret:
         raise ValueError("LINE_CHANNEL_SECRET is required")
-    if not supabase_url:
+    if storage_backend == 'supabase' and not supabase_url:
         raise ValueError("SUPABASE_URL is required")
-    if not supabase_key:
+    if storage_backend == 'supabase' and not supabase_key:
         raise ValueError("SUPABASE_SERVICE_KEY is required")
         
     configuration = Configuration(access_token=line_access_token)
     handler = WebhookHandler(line_channel_secret)
     line_bot_api = MessagingApi(ApiClient(configuration))
-    supabase_client = create_client(supabase_url, supabase_key)
+    supabase_client = create_client(
+        supabase_url, supabase_key, options=ClientOptions(postgrest_client_timeout=Config.DB_TIMEOUT_SECONDS)
+    ) if storage_backend == 'supabase' else None
     logger.info("All services initialized successfully!")
 except Exception as e:
     logger.critical(f"Error initializing services: {e}")
@@ -111,21 +328,125 @@ except Exception as e:
     line_bot_api = None
     supabase_client = None
 
-# User states and rate limiting
+# Repositories - all database access goes through these
+sqlite_db = None
+if storage_backend == 'sqlite':
+    try:
+        sqlite_db = SqliteDatabase(sqlite_path)
+    except Exception as e:
+        logger.critical(f"Error opening SQLite database {sqlite_path}: {e}")
+
+if sqlite_db:
+    events_repo = SqliteEventsRepo(sqlite_db)
+    events_archive_repo = SqliteEventsArchiveRepo(sqlite_db)
+    notes_repo = SqliteNotesRepo(sqlite_db, preview_length=NOTE_PREVIEW_LENGTH)
+    notifications_repo = SqliteNotificationsRepo(sqlite_db)
+    subscribers_repo = SqliteSubscribersRepo(sqlite_db)
+    job_state_repo = SqliteJobStateRepo(sqlite_db)
+    leases_repo = SqliteLeasesRepo(sqlite_db)
+else:
+    events_repo = EventsRepo(supabase_client)
+    events_archive_repo = EventsArchiveRepo(supabase_client)
+    notes_repo = NotesRepo(supabase_client, preview_length=NOTE_PREVIEW_LENGTH)
+    notifications_repo = NotificationsRepo(supabase_client)
+    subscribers_repo = SubscribersRepo(supabase_client)
+    job_state_repo = JobStateRepo(supabase_client)
+    leases_repo = LeasesRepo(supabase_client)
+storage_ready = bool(sqlite_db or supabase_client)
+
+events_replica = None
+notes_replica = None
+if read_replica_enabled and supabase_client:
+    replica_options = {
+        'poll_seconds': Config.REPLICA_POLL_SECONDS,
+        'reconcile_seconds': Config.REPLICA_RECONCILE_SECONDS,
+        'max_staleness': Config.REPLICA_MAX_STALENESS_SECONDS,
+        'page_size': Config.REPLICA_PAGE_SIZE
+    }
+    events_replica = TableReplica('events', events_repo, ['created_by', 'event_date'],
+                                  index_keys={'event_date': date_key}, **replica_options)
+    notes_replica = TableReplica('contacts', notes_repo, ['created_by'], **replica_options)
+    events_repo = ReplicatedEventsRepo(events_repo, events_replica)
+    notes_repo = ReplicatedNotesRepo(notes_repo, notes_replica)
+elif read_replica_enabled:
+    logger.warning("READ_REPLICA is only supported with the Supabase backend - disabled")
+logger.info(f"STORAGE_BACKEND: {storage_backend} ({'✅ Ready' if storage_ready else '❌ Not initialized'})")
+
+# Every query checks the webhook request's deadline before it starts (reads and writes)
+request_deadlines = RequestDeadlines(Config.REQUEST_DEADLINE_SECONDS, Config.REPLY_RESERVE_SECONDS)
+query_registry.add_plugin(request_deadlines, idempotent_only=False)
+# Identical concurrent reads (double taps, redeliveries, admins refreshing) share one query
+single_flight = SingleFlight()
+query_registry.add_plugin(single_flight, idempotent_only=False)
+# Innermost: the single-flight leader's query is the one that gets hedged
+hedged_reads = None
+if hedged_reads_enabled and storage_backend == 'supabase':
+    hedged_reads = HedgedReads(
+        Config.HEDGED_SHAPES, budget_ratio=Config.HEDGE_BUDGET_RATIO, min_samples=Config.HEDGE_MIN_SAMPLES,
+        min_delay_ms=Config.HEDGE_MIN_DELAY_MS, max_workers=Config.HEDGE_MAX_WORKERS
+    )
+    query_registry.add_plugin(hedged_reads)
+elif hedged_reads_enabled:
+    logger.warning("HEDGED_READS is only supported with the Supabase backend - disabled")
+
+# ===== CONCURRENCY =====
+# Threading model (gunicorn gthread: several request threads per worker):
+# - Every webhook event runs under its user's lock (one of USER_LOCK_STRIPES
+#   RLocks picked by hash of the user id). A user's flow state -
+#   user_states[user_id] and last_postback_time[user_id] - is only read or
+#   changed while that lock is held, so one user's steps never interleave
+#   (a double tap waits for the first tap, then hits the postback rate limit)
+#   while different users run in parallel.
+# - The shared dicts themselves only see single-key get/set/pop, which are
+#   atomic in CPython; nothing iterates over them.
+# - Background threads (scheduler, reminder index, replica sync, prefetch,
+#   loading watchdog, subscriber flush) never touch user state. Every counter
+#   they or the handlers update (query stats, caches, replicas, metrics) is
+#   guarded by its owner's lock.
+# - Clients are shared: the LINE ApiClient (urllib3 pool) and the Supabase
+#   client (httpx) are thread-safe; SQLite uses one connection per thread.
+# - The request deadline lives in a context variable, so it is per request
+#   thread and never leaks into background threads.
+# scripts/stress_concurrency.py exercises this with many concurrent users.
+
 user_states = {}
 last_postback_time = {}  # Track last postback time per user
+user_lock_stripes = [threading.RLock() for _ in range(Config.USER_LOCK_STRIPES)]
+
+def user_lock(user_id):
+    """The lock guarding this user's flow state (striped - users may share a stripe)"""
+    return user_lock_stripes[hash(user_id) % len(user_lock_stripes)]
+
+def one_event_per_user(func):
+    """Decorator for webhook handlers: run one event per user at a time"""
+    @functools.wraps(func)
+    def wrapper(event, *args, **kwargs):
+        user_id = getattr(getattr(event, 'source', None), 'user_id', None)
+        if not user_id:
+            return func(event, *args, **kwargs)
+        deadline = current_deadline()
+        timeout = deadline.work_remaining() if deadline is not None else Config.USER_LOCK_TIMEOUT_SECONDS
+        lock = user_lock(user_id)
+        if not lock.acquire(timeout=timeout):
+            print(f"[CONCURRENCY] ⚠️ {user_id} still busy with an earlier event - dropping this one")
+            return None
+        try:
+            return func(event, *args, **kwargs)
+        finally:
+            lock.release()
+    return wrapper
 
 def can_process_postback(user_id):
     """Rate limiting for PostbackEvent to prevent duplicates"""
-    import time
-    now = time.time()
-    last_time = last_postback_time.get(user_id, 0)
-    
-    if now - last_time < 2.0:  # Must wait 2 seconds between postback events
-        return False
-    
-    last_postback_time[user_id] = now
-    return True
+    with user_lock(user_id):
+        now = time.time()
+        last_time = last_postback_time.get(user_id, 0)
+        
+        if now - last_time < 2.0:  # Must wait 2 seconds between postback events
+            return False
+        
+        last_postback_time[user_id] = now
+        return True
 
 # ===== NOTIFICATION SYSTEM =====
 
@@ -133,29 +454,38 @@ def create_notifications_table():
     """Create notifications table if not exists"""
     try:
         # Check if table exists by trying to select from it
-        supabase_client.table('notifications').select('*').limit(1).execute()
+        notifications_repo.probe()
         logger.info("Notifications table already exists")
     except:
         logger.warning("Notifications table will be created manually in Supabase")
-        # Schema is defined in the SQL you provided
+        # Schema: supabase/migrations/ (supabase db push)
         pass
 
+def push_text(user_id, message, retry_key=None):
+    """Push one text message (no reply_token needed); raises on failure.
+    
+    With a retry_key LINE accepts the push at most once - a repeat of an
+    accepted request answers 409 instead of delivering again.
+    """
+    from linebot.v3.messaging import PushMessageRequest
+    
+    push_request = PushMessageRequest(
+        to=user_id,
+        messages=[TextMessage(text=message, quick_reply=create_main_menu())]
+    )
+    if retry_key:
+        line_bot_api.push_message(push_request, x_line_retry_key=retry_key, _request_timeout=Config.LINE_TIMEOUT_SECONDS)
+    else:
+        line_bot_api.push_message(push_request, _request_timeout=Config.LINE_TIMEOUT_SECONDS)
+
 def send_notification(user_id, message):
     """Send notification message to user"""
     try:
         if not line_bot_api:
             logger.warning("Cannot send notification - LINE Bot API not available")
             return False
-            
-        # Send push message (no reply_token needed)
-        from linebot.v3.messaging import PushMessageRequest
-        
-        push_request = PushMessageRequest(
-            to=user_id,
-            messages=[TextMessage(text=message, quick_reply=create_main_menu())]
-        )
         
-        line_bot_api.push_message(push_request)
+        push_text(user_id, message)
         logger.info(f"[NOTIFICATION] ✅ Sent to User{user_id[-4:]}")
         return True
         
@@ -163,123 +493,798 @@ def send_notification(user_id, message):
         logger.error(f"[NOTIFICATION] ❌ Failed to send: {e}")
         return False
 
+def deliver_queued_push(job):
+    """Push queue sender: 409 means LINE already accepted this retry key, other 4xx (but 429) are final"""
+    if not line_bot_api:
+        raise RuntimeError("LINE Bot API not available")
+    try:
+        push_text(job['user_id'], job['message'], retry_key=job['retry_key'])
+    except Exception as e:
+        status = getattr(e, 'status', None)
+        if status == 409:
+            logger.info(f"[NOTIFICATION] 📋 Push {job['idempotency_key']} was already accepted by LINE")
+            return
+        if isinstance(status, int) and 400 <= status < 500 and status != 429:
+            raise PermanentPushError(f"LINE rejected the push ({status}): {e}")
+        raise
+    logger.info(f"[NOTIFICATION] ✅ Sent to User{job['user_id'][-4:]}")
+
 def keep_alive_ping():
     """Keep service alive by self-pinging every 10 minutes"""
+    if not keep_alive_url:
+        return False
     try:
         import requests
-        service_url = "https://linebot-production-ready.onrender.com"
-        response = requests.get(service_url, timeout=10)
+        response = requests.get(keep_alive_url, timeout=10)
         logger.info(f"Keep-alive ping successful: {response.status_code}")
         return True
     except Exception as e:
         logger.warning(f"Keep-alive ping failed: {e}")
         return False
 
+def get_reminder_due_time(event_date_str):
+    """Return the Thai-time datetime at which an event's reminder is due"""
+    if not event_date_str:
+        return None
+    try:
+        thai_tz = pytz.timezone('Asia/Bangkok')
+        event_date = datetime.strptime(str(event_date_str), '%Y-%m-%d')
+        event_datetime = thai_tz.localize(event_date.replace(hour=Config.NOTIFICATION_EVENT_HOUR, minute=0, second=0))
+        return event_datetime - timedelta(hours=Config.NOTIFICATION_LEAD_HOURS)
+    except ValueError:
+        return None
+
+def build_reminder_message(event):
+    """Build the reminder text for one event"""
+    event_title = event.get('event_title', 'กิจกรรม')
+    formatted_date = format_thai_date(event.get('event_date'))
+    return f"🔔 **แจ้งเตือนกิจกรรม**\n\n📝 {event_title}\n📅 {formatted_date}\n⏰ อีก 3 ชั่วโมง (9:00 น.)\n\n💡 อย่าลืมเตรียมตัวนะ!"
+
+def build_reminder_digest(events):
+    """Build one reminder text covering all of a user's due events"""
+    if len(events) == 1:
+        return build_reminder_message(events[0])
+    
+    lines = [f"🔔 **แจ้งเตือนกิจกรรม** ({len(events)} รายการ)\n"]
+    current_date = None
+    for i, event in enumerate(events[:Config.NOTIFICATION_DIGEST_MAX_ITEMS], 1):
+        if event.get('event_date') != current_date:
+            current_date = event.get('event_date')
+            lines.append(f"📅 {format_thai_date(current_date)}")
+        lines.append(f"{i}. {event.get('event_title', 'กิจกรรม')}")
+    remaining = len(events) - Config.NOTIFICATION_DIGEST_MAX_ITEMS
+    if remaining > 0:
+        lines.append(f"... และอีก {remaining} รายการ")
+    lines.append("\n⏰ อีก 3 ชั่วโมง (9:00 น.)\n💡 อย่าลืมเตรียมตัวนะ!")
+    return "\n".join(lines)
+
+def log_sent_notifications(events, user_id, message, now):
+    """Record every event covered by one push in a single insert"""
+    try:
+        notifications_repo.log_sent([{
+            'event_id': event['id'],
+            'user_id': user_id,
+            'notification_time': now.isoformat(),
+            'message': message,
+            'sent': True
+        } for event in events])
+        return True
+    except Exception as log_error:
+        logger.warning(f"[NOTIFICATION] ⚠️ Failed to log notification: {log_error}")
+        return False
+
+def log_queued_reminder(job):
+    """Push queue callback: log a reminder once it was actually delivered"""
+    meta = job['meta'] or {}
+    events = [{'id': event_id} for event_id in meta.get('event_ids', [])]
+    log_sent_notifications(events, job['user_id'], job['message'], datetime.fromisoformat(meta['claimed_at']))
+
+push_queue = None
+if push_queue_enabled:
+    try:
+        push_queue = PushQueue(
+            push_queue_path, deliver_queued_push, max_attempts=Config.PUSH_MAX_ATTEMPTS,
+            backoff_base_seconds=Config.PUSH_BACKOFF_BASE_SECONDS, backoff_max_seconds=Config.PUSH_BACKOFF_MAX_SECONDS,
+            lease_seconds=Config.PUSH_LEASE_SECONDS, batch_size=Config.PUSH_BATCH_SIZE,
+            keep_sent_hours=Config.PUSH_KEEP_SENT_HOURS
+        )
+        # Dead reminders keep their claim: replaying the dead letter delivers them
+        push_queue.register('reminder', on_sent=log_queued_reminder)
+    except Exception as e:
+        logger.critical(f"[PUSH QUEUE] ❌ Cannot open {push_queue_path} - reminders are pushed directly: {e}")
+        push_queue = None
+
+def send_due_reminders(events, now=None):
+    """Send reminders for due events that have not been notified yet.
+    
+    Each event carries its own reminder_sent_at marker, so the check never
+    touches the notifications history. Events are claimed in one conditional
+    update before sending, which also keeps concurrent passes from sending
+    twice. In digest mode each user gets one push per reminder slot covering
+    all of their events.
+    
+    With the push queue the claimed reminders are queued durably and sent by
+    the queue worker (logged once delivered); the return value then counts
+    queued reminders.
+    """
+    pending = []
+    for event in events or []:
+        if event.get('reminder_sent_at'):
+            logger.info(f"[NOTIFICATION] 📋 Already sent for event: {event.get('event_title', 'Unknown')}")
+        elif event.get('id') is not None and event.get('created_by'):
+            pending.append(event)
+    if not pending:
+        return 0
+    
+    now = now or get_current_thai_time()
+    try:
+        claimed = events_repo.claim_reminders([event['id'] for event in pending], now.isoformat())
+    except Exception as db_error:
+        logger.warning(f"[NOTIFICATION] ⚠️ Database check failed: {db_error}")
+        return 0
+    
+    # Group claimed events per user (or one group per event without digest)
+    groups = {}
+    for event in pending:
+        if str(event['id']) not in claimed:
+            continue
+        user_id = event['created_by']
+        key = user_id if notification_digest else (user_id, event['id'])
+        groups.setdefault(key, []).append(event)
+    
+    notifications_sent = 0
+    for user_events in groups.values():
+        user_id = user_events[0]['created_by']
+        try:
+            user_events.sort(key=lambda e: (e.get('event_date') or '', str(e.get('id'))))
+            message = build_reminder_digest(user_events)
+            if push_queue is not None:
+                event_ids = [event['id'] for event in user_events]
+                try:
+                    push_queue.enqueue(
+                        f"reminder:{user_id}:{','.join(str(event_id) for event_id in event_ids)}", 'reminder', user_id, message,
+                        meta={'event_ids': event_ids, 'claimed_at': now.isoformat()}
+                    )
+                except Exception:
+                    events_repo.release_reminders(event_ids)  # Not queued - let the next pass claim them again
+                    raise
+                logger.info(f"[NOTIFICATION] 📮 Queued reminder for {len(user_events)} events to User{user_id[-4:]}")
+                notifications_sent += len(user_events)
+            elif send_notification(user_id, message):
+                log_sent_notifications(user_events, user_id, message, now)
+                logger.info(f"[NOTIFICATION] ✅ Sent reminder for {len(user_events)} events to User{user_id[-4:]}")
+                notifications_sent += len(user_events)
+            else:
+                events_repo.release_reminders([event['id'] for event in user_events])
+        except Exception as e:
+            logger.error(f"[NOTIFICATION] Error processing reminders for User{user_id[-4:]}: {e}")
+    
+    return notifications_sent
+
 def check_and_send_notifications():
-    """Check for pending notifications and send them + keep service alive"""
+    """Incremental scan fallback (used when the reminder index is not running).
+    
+    Per-run work is proportional to change: events created or updated since
+    the persisted updated_at watermark, plus the dates whose reminder due
+    time elapsed since the last pass (catching up to CRON_CATCHUP_HOURS
+    after downtime). State lives in job_state 'notification_scan'.
+    """
     try:
-        # Keep service alive (prevent Render sleep)
-        ping_success = keep_alive_ping()
+        now = get_current_thai_time()
+        grace = timedelta(minutes=Config.NOTIFICATION_GRACE_MINUTES)
+        state = load_job_state('notification_scan')
         
-        thai_tz = pytz.timezone('Asia/Bangkok')
-        now = datetime.now(thai_tz)
+        # 1. Due times that elapsed since the last pass
+        due_from = now - grace
+        if state.get('due_through'):
+            try:
+                due_from = datetime.fromisoformat(state['due_through'])
+            except ValueError:
+                pass
+        due_from = max(due_from, now - timedelta(hours=Config.CRON_CATCHUP_HOURS))
         
-        logger.info(f"[NOTIFICATION] 🔍 Starting check at {now.strftime('%Y-%m-%d %H:%M:%S')} (Keep-alive: {'✅' if ping_success else '❌'})")
+        candidates = {}
+        elapsed_dates = []
+        day = due_from.date()
+        while day <= now.date():
+            due_time = get_reminder_due_time(day.isoformat())
+            if due_time and due_from < due_time <= now:
+                elapsed_dates.append(day.isoformat())
+            day += timedelta(days=1)
+        if elapsed_dates:
+            for event in events_repo.list_between(elapsed_dates[0], elapsed_dates[-1]):
+                candidates[str(event['id'])] = event
         
-        # Get events that need notification (today and tomorrow)
-        tomorrow = now.date() + timedelta(days=1)
-        events_response = supabase_client.table('events').select('*').gte('event_date', now.date()).lte('event_date', tomorrow).execute()
+        # 2. Events created/updated since the watermark that are due right now
+        watermark = state.get('watermark') or (now - grace).astimezone(pytz.utc).isoformat()
+        changed, watermark = fetch_changed_events(watermark)
+        for event in changed:
+            due_time = get_reminder_due_time(event.get('event_date'))
+            if due_time and now - grace <= due_time <= now:
+                candidates[str(event['id'])] = event
         
-        if not events_response.data:
-            logger.info("[NOTIFICATION] 📝 No upcoming events found")
-            return
-            
-        notifications_sent = 0
+        notifications_sent = send_due_reminders(list(candidates.values()), now)
+        save_job_state('notification_scan', {'due_through': now.isoformat(), 'watermark': watermark})
+        logger.info(f"[NOTIFICATION] ✅ Incremental check - {notifications_sent} sent, {len(changed)} changed, "
+                    f"{len(candidates)} due, elapsed dates: {elapsed_dates or '-'}")
         
-        for event in events_response.data:
-            event_date_str = event.get('event_date')
-            if not event_date_str:
-                continue
-                
-            # Parse event date 
-            try:
-                event_date = datetime.strptime(event_date_str, '%Y-%m-%d').replace(tzinfo=thai_tz)
-                # Set time to 9:00 AM for notification
-                event_datetime = event_date.replace(hour=9, minute=0, second=0)
-                
-                # Check if we should send notification (3 hours before 9 AM = 6 AM)
-                notification_time = event_datetime - timedelta(hours=3)
+    except Exception as e:
+        logger.error(f"[NOTIFICATION] ❌ Check failed: {e}")
+
+def fetch_changed_events(watermark):
+    """Events stamped since the watermark (minus a small overlap); returns (rows, new watermark).
+    
+    Pages on the (updated_at, id) keyset, so a page full of one timestamp
+    (bulk update/import) still moves on to the rest of that timestamp. The
+    watermark only advances to the newest timestamp read; when the batch cap
+    stops the walk early, the next call re-reads from that timestamp (gte).
+    """
+    try:
+        since = (datetime.fromisoformat(watermark.replace('Z', '+00:00')) - timedelta(seconds=5)).isoformat()
+    except ValueError:
+        since = watermark
+    
+    changed = {}
+    after_id = None
+    for _ in range(Config.CRON_MAX_BATCHES):
+        page = events_repo.list_updated_since(since, Config.CRON_BATCH_SIZE, after_id=after_id)
+        for event in page:
+            changed[str(event['id'])] = event
+        if page and page[-1].get('updated_at') and page[-1]['updated_at'] > watermark:
+            watermark = page[-1]['updated_at']
+        if len(page) < Config.CRON_BATCH_SIZE or not page[-1].get('updated_at'):
+            break
+        since, after_id = page[-1]['updated_at'], page[-1]['id']
+    return list(changed.values()), watermark
+
+# ===== JOB STATE (persisted watermarks) =====
+# Table: job_state (name text primary key, value jsonb, updated_at timestamptz)
+
+def load_job_state(name):
+    """Load a persisted job state dict (empty if none)"""
+    try:
+        return job_state_repo.get(name)
+    except Exception as e:
+        logger.warning(f"[JOB STATE] ⚠️ Failed to load '{name}': {e}")
+    return {}
+
+def save_job_state(name, value):
+    """Persist a job state dict"""
+    try:
+        job_state_repo.save(name, value, datetime.utcnow().isoformat())
+        return True
+    except Exception as e:
+        logger.warning(f"[JOB STATE] ⚠️ Failed to save '{name}': {e}")
+        return False
+
+def run_notification_pass(max_batches=None, time_budget=None):
+    """One bounded, idempotent notification pass for cron-triggered deployments.
+    
+    Walks unsent events in (event_date, id) order from the first date whose
+    reminder falls inside the catch-up window up to the latest date whose
+    reminder is due. The cursor only advances within a pass; every pass
+    starts over at that first date, so an event edited back behind the
+    previous pass's position is still seen. Sent events drop out of the scan,
+    which keeps the restart cheap and lets a pass that ran out of batches
+    make progress on the next call.
+    Re-running is safe: send_due_reminders() claims reminder_sent_at first.
+    """
+    max_batches = max_batches or Config.CRON_MAX_BATCHES
+    time_budget = time_budget or Config.CRON_TIME_BUDGET_SECONDS
+    started = time.time()
+    now = get_current_thai_time()
+    
+    # Latest event date whose reminder is already due
+    last_due_date = now.date()
+    if get_reminder_due_time(last_due_date.isoformat()) > now:
+        last_due_date -= timedelta(days=1)
+    
+    # Do not reach back further than the catch-up window: start at the first
+    # event date whose reminder is due at or after catchup_start (older unsent
+    # events are skipped for good and would otherwise be re-read every pass)
+    catchup_start = now - timedelta(hours=Config.CRON_CATCHUP_HOURS)
+    first_date = catchup_start.date() - timedelta(days=1)
+    while get_reminder_due_time(first_date.isoformat()) < catchup_start:
+        first_date += timedelta(days=1)
+    
+    cursor_date, cursor_id = (first_date - timedelta(days=1)).isoformat(), None
+    
+    processed = 0
+    sent = 0
+    batches = 0
+    caught_up = False
+    while batches < max_batches and time.time() - started < time_budget:
+        events = events_repo.list_after_cursor(cursor_date, cursor_id, last_due_date.isoformat(), Config.CRON_BATCH_SIZE)
+        batches += 1
+        
+        due_events = []
+        for event in events:
+            due_time = get_reminder_due_time(event.get('event_date'))
+            if due_time and catchup_start <= due_time <= now:
+                due_events.append(event)
+        sent += send_due_reminders(due_events, now)
+        processed += len(events)
+        
+        if events:
+            cursor_date, cursor_id = events[-1]['event_date'], events[-1]['id']
+        
+        if len(events) < Config.CRON_BATCH_SIZE:
+            caught_up = True
+            break
+    
+    result = {
+        'processed': processed,
+        'sent': sent,
+        'batches': batches,
+        'caught_up': caught_up,
+        'cursor': {'event_date': cursor_date, 'id': cursor_id},
+        'elapsed_ms': int((time.time() - started) * 1000)
+    }
+    logger.info(f"[CRON] 🔔 Notification pass: {result}")
+    return result
+
+# ===== RETENTION =====
+# Keeps the hot tables small: events long past their date move to
+# events_archive, and since the reminder hot path only reads
+# events.reminder_sent_at, notification log rows past the retention window
+# move to notifications_archive (or are deleted). Both run in small,
+# rate-limited batches.
+
+def archive_past_events(max_batches=None, time_budget=None):
+    """Move events older than EVENT_ARCHIVE_AFTER_DAYS to events_archive in batches"""
+    max_batches = max_batches or Config.RETENTION_MAX_BATCHES
+    started = time.time()
+    before_date = (get_current_thai_time().date() - timedelta(days=Config.EVENT_ARCHIVE_AFTER_DAYS)).isoformat()
+    
+    archived = 0
+    batches = 0
+    caught_up = False
+    while batches < max_batches:
+        if time_budget and time.time() - started >= time_budget:
+            break
+        moved = events_repo.archive_past(before_date, Config.EVENT_ARCHIVE_BATCH_SIZE)
+        batches += 1
+        archived += len(moved)
+        for row in moved:
+            render_cache.invalidate('event', row.get('id'))
+            calendar_feeds.invalidate(row.get('created_by'))
+        if len(moved) < Config.EVENT_ARCHIVE_BATCH_SIZE:
+            caught_up = True
+            break
+        time.sleep(Config.RETENTION_BATCH_PAUSE_SECONDS)
+    
+    result = {
+        'before_date': before_date,
+        'archived': archived,
+        'batches': batches,
+        'caught_up': caught_up,
+        'elapsed_ms': int((time.time() - started) * 1000)
+    }
+    logger.info(f"[RETENTION] 🗄️ Past events: {result}")
+    return result
+
+def purge_notification_history(max_batches=None, time_budget=None):
+    """Archive or delete notification log rows older than the retention window.
+    
+    Archive-then-delete is idempotent, so an interrupted run just continues on
+    the next one.
+    """
+    max_batches = max_batches or Config.RETENTION_MAX_BATCHES
+    started = time.time()
+    cutoff = (get_current_thai_time() - timedelta(days=Config.NOTIFICATION_RETENTION_DAYS)).isoformat()
+    
+    purged = 0
+    batches = 0
+    caught_up = False
+    while batches < max_batches:
+        if time_budget and time.time() - started >= time_budget:
+            break
+        rows = notifications_repo.list_before(cutoff, Config.RETENTION_BATCH_SIZE)
+        batches += 1
+        if rows:
+            if notification_retention_mode == 'archive':
+                notifications_repo.archive(rows)
+            notifications_repo.delete_ids([row['id'] for row in rows])
+            purged += len(rows)
+        if len(rows) < Config.RETENTION_BATCH_SIZE:
+            caught_up = True
+            break
+        time.sleep(Config.RETENTION_BATCH_PAUSE_SECONDS)
+    
+    result = {
+        'mode': notification_retention_mode,
+        'cutoff': cutoff,
+        'purged': purged,
+        'batches': batches,
+        'caught_up': caught_up,
+        'elapsed_ms': int((time.time() - started) * 1000)
+    }
+    save_job_state('notification_retention', {'last_run': get_current_thai_time().isoformat(), **result})
+    logger.info(f"[RETENTION] 🧹 Notification history: {result}")
+    return result
+
+def run_retention_pass(time_budget=None):
+    """Archive past events, then purge notification history with the time left"""
+    started = time.time()
+    events_result = archive_past_events(time_budget=time_budget)
+    remaining = max(time_budget - (time.time() - started), 0.001) if time_budget else None
+    return {'events': events_result, 'notifications': purge_notification_history(time_budget=remaining)}
+
+def run_retention_job():
+    """Daily scheduler job"""
+    try:
+        run_retention_pass()
+    except Exception as e:
+        logger.error(f"[RETENTION] ❌ Retention pass failed: {e}")
+
+class ReminderIndex:
+    """⏰ In-process reminder index - a min-heap keyed on due time.
+    
+    Lives in the elected leader process only. Loaded once at start; every
+    scheduler tick then feeds the events changed since the last scan
+    (fetch_changed_events) into the heap, so inserts and edits made by any
+    worker are indexed within NOTIFICATION_CHECK_MINUTES - well inside the
+    grace window. Each reminder fires at its due time without rescanning the
+    events table. Cancelled or rescheduled entries are dropped lazily when
+    they reach the top.
+    """
+    
+    def __init__(self):
+        self._heap = []  # (due_timestamp, seq, event_id)
+        self._entries = {}  # event_id -> (due_timestamp, seq, event)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.last_loaded = None
+        self.watermark = None  # updated_at up to which changes are indexed
+    
+    @property
+    def running(self):
+        return self._running and self._thread is not None and self._thread.is_alive()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def schedule(self, event):
+        """Add or reschedule the reminder for an event (dict with id and event_date).
+        
+        Only the leader's running index holds reminders. In any other process
+        this is a no-op - the leader's change scan (sync_changes) indexes the
+        edit on its next tick.
+        """
+        if not self._running:
+            return False
+        return self._add(event)
+    
+    def _add(self, event):
+        event_id = event.get('id') if event else None
+        if event_id is None:
+            return False
+        
+        due_time = get_reminder_due_time(event.get('event_date'))
+        now = get_current_thai_time()
+        if not due_time or due_time < now - timedelta(minutes=Config.NOTIFICATION_GRACE_MINUTES):
+            self.cancel(event_id)
+            return False
+        
+        key = str(event_id)
+        due_ts = due_time.timestamp()
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[key] = (due_ts, seq, event)
+            heapq.heappush(self._heap, (due_ts, seq, key))
+            self._cond.notify()
+        return True
+    
+    def cancel(self, event_id):
+        """Drop the reminder for an event (heap entry is discarded lazily)"""
+        with self._cond:
+            removed = self._entries.pop(str(event_id), None)
+            if removed:
+                self._cond.notify()
+        return removed is not None
+    
+    def load(self):
+        """Load every upcoming reminder from the events table"""
+        now = get_current_thai_time()
+        watermark = now.astimezone(pytz.utc).isoformat()  # Changes from here on are picked up by sync_changes()
+        earliest = (now - timedelta(minutes=Config.NOTIFICATION_GRACE_MINUTES)).date()
+        events = events_repo.list_from_date(earliest.isoformat())
+        
+        with self._cond:
+            self._heap = []
+            self._entries = {}
+        scheduled = sum(1 for event in events if self._add(event))
+        self.last_loaded = time.time()
+        self.watermark = watermark
+        logger.info(f"[REMINDER] 📥 Indexed {scheduled} upcoming reminders ({len(events)} events read)")
+        return scheduled
+    
+    def sync_changes(self):
+        """Index events inserted or edited since the last scan (by any process); returns how many changed"""
+        if self.watermark is None:
+            self.load()
+            return 0
+        changed, self.watermark = fetch_changed_events(self.watermark)
+        for event in changed:
+            self._add(event)
+        if changed:
+            logger.info(f"[REMINDER] 🔄 Re-indexed {len(changed)} changed events")
+        return len(changed)
+    
+    def refresh_if_stale(self):
+        """Periodic resync so edits made by other processes are picked up"""
+        if self.last_loaded and time.time() - self.last_loaded < Config.REMINDER_RESYNC_MINUTES * 60:
+            return False
+        self.load()
+        return True
+    
+    def start(self):
+        if self.running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='reminder-index', daemon=True)
+        self._thread.start()
+        logger.info("[REMINDER] ⏰ Reminder index started")
+    
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+    
+    def _pop_due(self):
+        """Wait for the next due time and pop every reminder due by then"""
+        with self._cond:
+            while self._running:
+                # Discard cancelled/rescheduled entries
+                while self._heap:
+                    due_ts, seq, key = self._heap[0]
+                    entry = self._entries.get(key)
+                    if entry and entry[1] == seq:
+                        break
+                    heapq.heappop(self._heap)
                 
-                # Send notification if current time is within 30 minutes of notification time (wider window)
-                time_diff = abs((now - notification_time).total_seconds())
+                if not self._heap:
+                    self._cond.wait()
+                    continue
                 
-                if time_diff <= 1800:  # Within 30 minutes (improved from 10 minutes)
-                    # Check if notification already sent
-                    try:
-                        check_sent = supabase_client.table('notifications').select('*').eq('event_id', event['id']).eq('sent', True).execute()
-                        
-                        if not check_sent.data:  # Not sent yet
-                            event_title = event.get('event_title', 'กิจกรรม')
-                            user_id = event.get('created_by')
-                            
-                            if user_id:
-                                # Format Thai date
-                                formatted_date = format_thai_date(event_date_str)
-                                
-                                message = f"🔔 **แจ้งเตือนกิจกรรม**\n\n📝 {event_title}\n📅 {formatted_date}\n⏰ อีก 3 ชั่วโมง (9:00 น.)\n\n💡 อย่าลืมเตรียมตัวนะ!"
-                                
-                                if send_notification(user_id, message):
-                                    # Mark as sent
-                                    try:
-                                        supabase_client.table('notifications').insert({
-                                            'event_id': event['id'],
-                                            'user_id': user_id,
-                                            'notification_time': now.isoformat(),
-                                            'message': message,
-                                            'sent': True
-                                        }).execute()
-                                        logger.info(f"[NOTIFICATION] ✅ Sent notification for event: {event_title}")
-                                        notifications_sent += 1
-                                    except Exception as log_error:
-                                        logger.warning(f"[NOTIFICATION] ⚠️ Failed to log notification: {log_error}")
-                        else:
-                            logger.info(f"[NOTIFICATION] 📋 Already sent for event: {event.get('event_title', 'Unknown')}")
-                    except Exception as db_error:
-                        logger.warning(f"[NOTIFICATION] ⚠️ Database check failed: {db_error}")
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
                 
-            except Exception as e:
-                logger.error(f"[NOTIFICATION] Error processing event {event.get('id')}: {e}")
+                # Reminders share due times (6:00 per date) - fire them together
+                due = []
+                now_ts = time.time()
+                while self._heap and self._heap[0][0] <= now_ts:
+                    due_ts, seq, key = heapq.heappop(self._heap)
+                    entry = self._entries.get(key)
+                    if entry and entry[1] == seq:
+                        del self._entries[key]
+                        due.append(entry[2])
+                return due
+        return []
+    
+    def _run(self):
+        while self._running:
+            due_events = self._pop_due()
+            if not due_events:
                 continue
-                
-        logger.info(f"[NOTIFICATION] ✅ Check completed - {notifications_sent} notifications sent, {len(events_response.data)} events checked")
+            try:
+                self._fire(due_events)
+            except Exception as e:
+                logger.error(f"[REMINDER] ❌ Failed to fire {len(due_events)} reminders: {e}")
+    
+    def _fire(self, due_events):
+        # Re-read the rows in one query so edits/deletes made elsewhere are respected
+        event_ids = [event['id'] for event in due_events]
+        current_events = events_repo.get_many(event_ids)
+        now = get_current_thai_time()
+        grace_seconds = Config.NOTIFICATION_GRACE_MINUTES * 60
+        still_due = []
+        for event in current_events:
+            due_time = get_reminder_due_time(event.get('event_date'))
+            if due_time and abs((now - due_time).total_seconds()) <= grace_seconds:
+                still_due.append(event)
+            else:
+                # Date moved - put it back under its new due time
+                self.schedule(event)
         
-    except Exception as e:
-        logger.error(f"[NOTIFICATION] ❌ Check failed: {e}")
+        sent = send_due_reminders(still_due, now)
+        logger.info(f"[REMINDER] 🔔 {sent} reminders sent ({len(due_events)} due)")
+
+reminder_index = ReminderIndex()
+
+def run_notification_tick():
+    """Periodic job: keep-alive ping plus reminder index change scan (or incremental scan fallback)"""
+    ping_success = keep_alive_ping()
+    logger.info(f"[NOTIFICATION] Tick (Keep-alive: {'✅' if ping_success else '❌'})")
+    
+    if reminder_index.running:
+        try:
+            # Handlers in other workers cannot reach this heap - their edits come in through the change scan
+            reminder_index.sync_changes()
+            reminder_index.refresh_if_stale()
+        except Exception as e:
+            logger.error(f"[REMINDER] ❌ Resync failed: {e}")
+            check_and_send_notifications()
+    else:
+        check_and_send_notifications()
 
 # Initialize notification scheduler (only if APScheduler available)
 scheduler = None
 if SCHEDULER_AVAILABLE:
     scheduler = BackgroundScheduler()
     scheduler.add_job(
-        func=check_and_send_notifications,
-        trigger=IntervalTrigger(minutes=10),  # Check every 10 minutes (includes keep-alive ping)
+        func=run_notification_tick,
+        trigger=IntervalTrigger(minutes=Config.NOTIFICATION_CHECK_MINUTES),  # Keep-alive + reminder index resync
         id='notification_checker',
-        name='Check and send notifications + keep alive',
+        name='Keep alive + reminder resync',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=run_retention_job,
+        trigger=CronTrigger(hour=Config.RETENTION_RUN_HOUR, minute=30, timezone=pytz.timezone('Asia/Bangkok')),
+        id='daily_retention',
+        name='Archive past events + notification log retention',
         replace_existing=True
     )
 
+class LeaderElector:
+    """👑 Leader election so exactly one process runs the notification scheduler.
+    
+    Modes:
+    - 'file':  exclusive flock on SCHEDULER_LOCK_FILE (workers on one host)
+    - 'lease': renewable lease row in the Supabase `scheduler_leases` table
+               (name text primary key, holder text, expires_at timestamptz)
+    - 'none':  every process is leader (previous behaviour)
+    
+    Followers keep retrying, so when the leader dies another process takes over
+    (file lock released by the OS, or lease expiry).
+    """
+    
+    def __init__(self, name, mode, on_elected, on_demoted):
+        self.name = name
+        self.mode = mode
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._lock_fd = None
+        self._thread = None
+        self._stop = threading.Event()
+    
+    def _try_file_lock(self):
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(scheduler_lock_file, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, self.holder_id.encode())
+        self._lock_fd = fd
+        return True
+    
+    def _try_lease(self):
+        now = datetime.utcnow()
+        now_str = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+        expires_str = (now + timedelta(seconds=Config.LEADER_LEASE_SECONDS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        
+        if leases_repo.renew_or_take_over(self.name, self.holder_id, now_str, expires_str):
+            return True
+        
+        # No row yet (first boot)
+        try:
+            leases_repo.create(self.name, self.holder_id, expires_str)
+            return True
+        except Exception:
+            return False
+    
+    def try_acquire(self):
+        """Acquire or renew leadership, returns True while we are leader"""
+        if self.mode == 'none':
+            return True
+        if self.mode == 'file':
+            if not FILE_LOCK_AVAILABLE:
+                logger.warning("[LEADER] ⚠️ fcntl not available - running without leader election")
+                return True
+            return self._try_file_lock()
+        if self.mode == 'lease':
+            return self._try_lease()
+        logger.warning(f"[LEADER] ⚠️ Unknown leader mode '{self.mode}' - running without leader election")
+        return True
+    
+    def _check(self):
+        try:
+            leader = self.try_acquire()
+        except Exception as e:
+            logger.warning(f"[LEADER] ⚠️ Election check failed: {e}")
+            # Keep a file lock, but a lease we cannot renew may be taken over
+            leader = self.is_leader and self.mode == 'file'
+        
+        if leader and not self.is_leader:
+            self.is_leader = True
+            logger.info(f"[LEADER] 👑 {self.holder_id} elected for '{self.name}' ({self.mode})")
+            self.on_elected()
+        elif not leader and self.is_leader:
+            self.is_leader = False
+            logger.warning(f"[LEADER] ⚠️ {self.holder_id} lost leadership for '{self.name}'")
+            self.on_demoted()
+    
+    def _run(self):
+        # Renew well before the lease expires
+        interval = min(Config.LEADER_RETRY_SECONDS, Config.LEADER_LEASE_SECONDS / 3)
+        while not self._stop.wait(interval):
+            self._check()
+    
+    def start(self):
+        self._check()
+        if self.mode == 'none':
+            return
+        self._thread = threading.Thread(target=self._run, name=f'leader-{self.name}', daemon=True)
+        self._thread.start()
+    
+    def release(self):
+        """Give up leadership on shutdown so a follower can take over immediately"""
+        self._stop.set()
+        if not self.is_leader:
+            return
+        try:
+            if self._lock_fd is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                os.close(self._lock_fd)
+                self._lock_fd = None
+            elif self.mode == 'lease':
+                leases_repo.release(self.name, self.holder_id)
+        except Exception as e:
+            logger.warning(f"[LEADER] ⚠️ Release failed: {e}")
+        self.is_leader = False
+
+def start_leader_jobs():
+    """Run on the elected leader: reminder index + periodic scheduler"""
+    try:
+        reminder_index.load()
+        reminder_index.start()
+    except Exception as e:
+        logger.error(f"[REMINDER] ❌ Reminder index unavailable, falling back to polling: {e}")
+    
+    if not SCHEDULER_AVAILABLE:
+        logger.warning("[NOTIFICATION] ⚠️ APScheduler not available - keep-alive and resync disabled")
+        return
+    
+    if scheduler and not scheduler.running:
+        scheduler.start()
+        logger.info(f"[NOTIFICATION] 🔔 Scheduler started - keep-alive + resync every {Config.NOTIFICATION_CHECK_MINUTES} minutes")
+        atexit.register(lambda: scheduler.shutdown(wait=False))
+    elif scheduler:
+        scheduler.resume()
+        logger.info("[NOTIFICATION] 🔔 Scheduler resumed")
+
+def stop_leader_jobs():
+    """Run when leadership is lost: stop firing reminders and pause jobs"""
+    reminder_index.stop()
+    if scheduler and scheduler.running:
+        scheduler.pause()
+        logger.info("[NOTIFICATION] ⏸️ Scheduler paused (not leader)")
+
+scheduler_elector = LeaderElector('notification_scheduler', scheduler_leader_mode, start_leader_jobs, stop_leader_jobs)
+
 def start_notification_system():
-    """Start the notification scheduler"""
+    """Start leader election; the winner runs the reminder index and scheduler"""
     try:
-        if not SCHEDULER_AVAILABLE:
-            logger.warning("[NOTIFICATION] ⚠️ APScheduler not available - background notifications disabled")
-            return
-            
         create_notifications_table()
-        if scheduler and not scheduler.running:
-            scheduler.start()
-            logger.info("[NOTIFICATION] 🔔 Scheduler started - notifications + keep-alive every 10 minutes")
-            atexit.register(lambda: scheduler.shutdown())
+        if push_queue is not None:
+            push_queue.start()  # Resume pushes queued before a restart
+        if notification_mode == 'cron':
+            logger.info("[NOTIFICATION] ⏱️ Cron mode - reminders are sent via /cron/notifications (no in-process scheduler)")
+            return
+        scheduler_elector.start()
+        atexit.register(scheduler_elector.release)
+        atexit.register(reminder_index.stop)
     except Exception as e:
         logger.error(f"[NOTIFICATION] ❌ Failed to start scheduler: {e}")
 
@@ -334,6 +1339,13 @@ def get_user_display_name(user_id):
         return f"User{user_id[-4:]}"
     return "Unknown"
 
+def sleep_within_deadline(delay):
+    """Retry back-off that never sleeps into the reply reserve of the current request"""
+    deadline = current_deadline()
+    if deadline is not None:
+        delay = min(delay, max(0.0, deadline.remaining() - Config.REPLY_RESERVE_SECONDS / 2))
+    time.sleep(delay)
+
 def safe_reply(reply_token, messages, max_retries=7):
     """🛡️ BULLETPROOF REPLY FUNCTION - NEVER FAIL WEBHOOK"""
     if not line_bot_api:
@@ -346,9 +1358,15 @@ def safe_reply(reply_token, messages, max_retries=7):
         
     max_retries = 7
     for attempt in range(max_retries):
+        try:
+            timeout = call_timeout(Config.LINE_TIMEOUT_SECONDS, for_reply=True)
+        except DeadlineExceeded:
+            print("[WARNING] ❌ Request deadline exceeded - reply not sent")
+            return False
         try:
             result = line_bot_api.reply_message(
-                ReplyMessageRequest(reply_token=reply_token, messages=messages)
+                ReplyMessageRequest(reply_token=reply_token, messages=messages),
+                _request_timeout=timeout
             )
             print(f"[SUCCESS] ✅ Reply sent successfully on attempt {attempt + 1}")
             return True
@@ -361,13 +1379,27 @@ def safe_reply(reply_token, messages, max_retries=7):
                 print("[WARNING] ❌ Invalid/expired reply token - stopping retries")
                 return False
             
-            if attempt == max_retries - 1:
-                print(f"[FAILED] ❌ All {max_retries} attempts failed")
+            # Other 4xx (e.g. an oversized/invalid Flex payload) fail the same way on every retry
+            status = getattr(e, 'status', None)
+            rejected = isinstance(status, int) and 400 <= status < 500 and status != 429
+            if rejected:
+                print(f"[WARNING] ❌ Request rejected by LINE ({status}) - not retrying")
+            
+            # Out of request time: one last cheap attempt instead of another full retry
+            deadline = current_deadline()
+            out_of_time = deadline is not None and deadline.remaining() < Config.REPLY_RESERVE_SECONDS / 2
+            if out_of_time:
+                print("[WARNING] ⏱️ Request deadline nearly exhausted - sending fallback reply")
+            
+            if attempt == max_retries - 1 or rejected or out_of_time:
+                if not rejected and not out_of_time:
+                    print(f"[FAILED] ❌ All {max_retries} attempts failed")
                 # Last resort - try to send a simple error message
                 try:
                     simple_msg = TextMessage(text="❌ เกิดข้อผิดพลาด กรุณาลองใหม่")
                     line_bot_api.reply_message(
-                        ReplyMessageRequest(reply_token=reply_token, messages=[simple_msg])
+                        ReplyMessageRequest(reply_token=reply_token, messages=[simple_msg]),
+                        _request_timeout=call_timeout(Config.LINE_TIMEOUT_SECONDS, for_reply=True)
                     )
                     print("[RECOVERY] ✅ Sent simple error message")
                     return True
@@ -379,45 +1411,158 @@ def safe_reply(reply_token, messages, max_retries=7):
             if 'connection' in error_msg or 'reset' in error_msg:
                 delay = min(2.0 * (attempt + 1), 10.0)  # Cap at 10 seconds
                 print(f"[DELAY] Connection error - waiting {delay}s")
-                time.sleep(delay)
+                sleep_within_deadline(delay)
             elif 'rate limit' in error_msg:
                 delay = min(5.0 * (attempt + 1), 30.0)  # Cap at 30 seconds
                 print(f"[DELAY] Rate limit - waiting {delay}s")
-                time.sleep(delay)
+                sleep_within_deadline(delay)
             else:
                 delay = min(1.0 * (attempt + 1), 5.0)  # Cap at 5 seconds
                 print(f"[DELAY] General error - waiting {delay}s")
-                time.sleep(delay)
+                sleep_within_deadline(delay)
     
     return False
 
-def track_user_subscription(user_id):
-    """📝 TRACK ALL USER SUBSCRIPTIONS - เก็บทุก User ID ที่ใช้งาน"""
+# ===== LOADING ANIMATION =====
+# Handlers are timed by the latency watchdog; only when one is still running
+# after LOADING_THRESHOLD_SECONDS does the bot call the LINE loading animation
+# API, so fast replies cost nothing extra. LINE clears the animation as soon
+# as the reply arrives (1:1 chats only).
+
+def show_loading_animation(label, chat_id):
+    """Watchdog callback - start the LINE chat loading animation"""
+    if not line_bot_api:
+        return
+    line_bot_api.show_loading_animation(
+        ShowLoadingAnimationRequest(chat_id=chat_id, loading_seconds=Config.LOADING_ANIMATION_SECONDS),
+        _request_timeout=Config.LINE_TIMEOUT_SECONDS
+    )
+    print(f"[LOADING] ⏳ {label} for {chat_id} passed {int(Config.LOADING_THRESHOLD_SECONDS * 1000)}ms - loading animation shown")
+
+latency_watchdog = LatencyWatchdog(Config.LOADING_THRESHOLD_SECONDS, show_loading_animation)
+
+def show_loading_when_slow(label):
+    """Decorator for webhook handlers: loading animation if the handler passes the latency threshold"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event, *args, **kwargs):
+            source = getattr(event, 'source', None)
+            chat_id = getattr(source, 'user_id', None)
+            if not chat_id or getattr(source, 'type', 'user') != 'user':
+                return func(event, *args, **kwargs)
+            with latency_watchdog.watch(label, chat_id):
+                return func(event, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# ===== SUBSCRIBER TRACKING =====
+# Known subscribers are answered from memory. New ones are buffered and written
+# with one batched upsert every few seconds (or every N users), so inbound
+# events never wait on a subscribers round-trip.
+
+known_subscribers = set()
+pending_subscribers = {}  # user_id -> subscribed_at (ISO, Thai time)
+subscribers_lock = threading.Lock()
+subscriber_flush_thread = None
+subscriber_flush_stop = threading.Event()
+subscriber_flush_wake = threading.Event()
+
+def load_known_subscribers():
+    """Preload all subscriber IDs into memory (called once at boot)"""
+    if not storage_ready:
+        return 0
+    
+    page_size = Config.SUBSCRIBER_PRELOAD_PAGE_SIZE
+    start = 0
+    loaded = set()
     try:
-        # ตรวจสอบว่ามี User ID นี้แล้วหรือไม่
-        existing = supabase_client.table('subscribers').select('user_id, subscribed_at').eq('user_id', user_id).execute()
-        
-        if not existing.data:
-            # ยังไม่มี - เพิ่มใหม่
-            current_time = get_current_thai_time()
-            result = supabase_client.table('subscribers').insert({
-                'user_id': user_id,
-                'subscribed_at': current_time.isoformat()
-            }).execute()
-            logger.info(f"New subscriber added: {user_id} at {current_time.strftime('%Y-%m-%d %H:%M:%S')} Thai time")
-        else:
-            # มีแล้ว - แค่ log
-            subscribed_at = existing.data[0]['subscribed_at']
-            logger.debug(f"User {user_id} already tracked since {subscribed_at}")
-            
+        while True:
+            user_ids = subscribers_repo.list_ids_page(start, page_size)
+            loaded.update(user_ids)
+            if len(user_ids) < page_size:
+                break
+            start += page_size
     except Exception as e:
-        logger.error(f"Subscription tracking failed for {user_id}: {e}")
-        # พยายามสร้างตารางถ้ายังไม่มี
-        try:
-            logger.info("Attempting to create subscribers table...")
-            # อาจจะต้องสร้างตาราง subscribers ถ้ายังไม่มี
-        except:
-            pass
+        # Not fatal - unknown users are upserted with ignore_duplicates anyway
+        logger.warning(f"[SUBSCRIBERS] ⚠️ Preload failed after {len(loaded)} rows: {e}")
+    
+    with subscribers_lock:
+        known_subscribers.update(loaded)
+    logger.info(f"[SUBSCRIBERS] Loaded {len(loaded)} known subscribers")
+    return len(loaded)
+
+def flush_pending_subscribers():
+    """Write buffered new subscribers with one batched upsert"""
+    with subscribers_lock:
+        if not pending_subscribers:
+            return 0
+        batch = dict(pending_subscribers)
+        pending_subscribers.clear()
+    
+    if not storage_ready:
+        return 0
+    
+    rows = [{'user_id': user_id, 'subscribed_at': subscribed_at} for user_id, subscribed_at in batch.items()]
+    try:
+        subscribers_repo.upsert_new(rows)
+        logger.info(f"[SUBSCRIBERS] ✅ Flushed {len(rows)} new subscribers")
+        return len(rows)
+    except Exception as e:
+        logger.error(f"[SUBSCRIBERS] ❌ Flush failed ({len(rows)} rows), will retry: {e}")
+        with subscribers_lock:
+            for user_id, subscribed_at in batch.items():
+                pending_subscribers.setdefault(user_id, subscribed_at)
+        return 0
+
+def subscriber_flush_loop():
+    """Background loop that flushes the subscriber buffer periodically"""
+    while not subscriber_flush_stop.is_set():
+        # Wake early when the buffer reaches SUBSCRIBER_FLUSH_BATCH
+        subscriber_flush_wake.wait(Config.SUBSCRIBER_FLUSH_SECONDS)
+        subscriber_flush_wake.clear()
+        flush_pending_subscribers()
+
+def ensure_subscriber_flusher():
+    """Start the flush thread in this process (threads do not survive a fork)"""
+    global subscriber_flush_thread
+    if subscriber_flush_thread and subscriber_flush_thread.is_alive():
+        return
+    with subscribers_lock:
+        if subscriber_flush_thread and subscriber_flush_thread.is_alive():
+            return
+        subscriber_flush_thread = threading.Thread(target=subscriber_flush_loop, name='subscriber-flush', daemon=True)
+        subscriber_flush_thread.start()
+
+def track_user_subscription(user_id):
+    """📝 TRACK ALL USER SUBSCRIPTIONS - เก็บทุก User ID ที่ใช้งาน (ไม่รอฐานข้อมูล)"""
+    if not user_id:
+        return
+    
+    # รู้จักแล้ว - ตอบจากหน่วยความจำ
+    if user_id in known_subscribers:
+        return
+    
+    current_time = get_current_thai_time()
+    with subscribers_lock:
+        if user_id in known_subscribers:
+            return
+        known_subscribers.add(user_id)
+        pending_subscribers[user_id] = current_time.isoformat()
+        should_flush = len(pending_subscribers) >= Config.SUBSCRIBER_FLUSH_BATCH
+    
+    logger.info(f"New subscriber queued: {user_id} at {current_time.strftime('%Y-%m-%d %H:%M:%S')} Thai time")
+    
+    ensure_subscriber_flusher()
+    if should_flush:
+        subscriber_flush_wake.set()
+
+def shutdown_subscriber_tracking():
+    """Flush remaining subscribers on shutdown"""
+    subscriber_flush_stop.set()
+    subscriber_flush_wake.set()
+    flush_pending_subscribers()
+
+atexit.register(shutdown_subscriber_tracking)
 
 def create_main_menu():
     """Create main menu quick reply"""
@@ -430,6 +1575,42 @@ def create_main_menu():
         QuickReplyItem(action=MessageAction(label="ดูกิจกรรมทั้งหมด", text="ดูกิจกรรมทั้งหมด"))
     ])
 
+def create_archive_quick_reply():
+    """Quick reply after completing an event"""
+    return QuickReply(items=[
+        QuickReplyItem(action=MessageAction(label="🗄️ ที่เก็บถาวร", text="ดูที่เก็บถาวร")),
+        QuickReplyItem(action=MessageAction(label="ดูกิจกรรมทั้งหมด", text="ดูกิจกรรมทั้งหมด")),
+        QuickReplyItem(action=MessageAction(label="เพิ่มกิจกรรม", text="เพิ่มกิจกรรม"))
+    ])
+
+def create_archive_page_message(user_id, page=1):
+    """One page of archived events (completed or long past), newest first"""
+    is_admin = user_id in admin_ids
+    page_size = Config.ARCHIVE_PAGE_SIZE
+    rows = events_archive_repo.list_page(user_id, is_admin, page, page_size)
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    
+    if not rows:
+        text = "🗄️ **ที่เก็บถาวรว่างเปล่า**\n\n💡 กิจกรรมที่กด ✅ เสร็จ หรือผ่านไปนานแล้วจะถูกย้ายมาที่นี่" if page == 1 else "🗄️ ไม่มีรายการในหน้านี้"
+        return TextMessage(text=text, quick_reply=create_main_menu())
+    
+    title = "🗄️ **ที่เก็บถาวร (Admin)**" if is_admin else "🗄️ **ที่เก็บถาวร**"
+    lines = [f"{title} - หน้า {page}\n"]
+    for i, event in enumerate(rows, (page - 1) * page_size + 1):
+        status = "✅ เสร็จแล้ว" if event.get('archive_reason') == 'completed' else "📅 ผ่านไปแล้ว"
+        title_text = (event.get('event_title') or 'ไม่มีชื่อ')[:30]
+        owner = f" (โดย {get_user_display_name(event.get('created_by', ''))})" if is_admin else ""
+        lines.append(f"{i}. **{title_text}**{owner}\n   📅 {format_thai_date(event.get('event_date', ''))} • {status}")
+    
+    items = []
+    if page > 1:
+        items.append(QuickReplyItem(action=PostbackAction(label="⬅️ ก่อนหน้า", data=f"archive_page_{page-1}", display_text=f"🗄️ หน้า {page-1}")))
+    if has_next:
+        items.append(QuickReplyItem(action=PostbackAction(label="➡️ ถัดไป", data=f"archive_page_{page+1}", display_text=f"🗄️ หน้า {page+1}")))
+    items.append(QuickReplyItem(action=MessageAction(label="ดูกิจกรรมทั้งหมด", text="ดูกิจกรรมทั้งหมด")))
+    return TextMessage(text="\n".join(lines), quick_reply=QuickReply(items=items))
+
 def create_date_quick_reply():
     """Create date quick reply"""
     today = get_current_thai_time().date()
@@ -489,12 +1670,19 @@ def create_calendar_quick_reply():
     
     return QuickReply(items=items)
 
+def get_note_preview(note):
+    """Preview text for list views - full body is only loaded by view_note_"""
+    content = note.get('content_preview')
+    if content is None:
+        content = note.get('phone_number')
+    return content or 'ไม่มีเนื้อหา'
+
 def create_note_flex_message(note):
     """🎨 Create single note Flex Message with buttons"""
     try:
         note_id = note.get('id', '')
         title = note.get('name', 'ไม่มีชื่อ')
-        content = note.get('phone_number', 'ไม่มีเนื้อหา')  # Using phone_number field for content
+        content = get_note_preview(note)
         
         # Limit content display
         content_preview = content[:Config.LONG_CONTENT_PREVIEW] + ("..." if len(content) > Config.LONG_CONTENT_PREVIEW else "")
@@ -602,21 +1790,195 @@ def create_note_flex_message(note):
         print(f"[ERROR] Create note flex error: {e}")
         return None
 
-def create_notes_carousel_flex(notes, page=1, search_query=""):
-    """🎨 Create notes carousel Flex Message with pagination"""
-    try:
-        notes_per_page = Config.NOTES_PER_PAGE
-        total_notes = len(notes)
-        total_pages = (total_notes + notes_per_page - 1) // notes_per_page
-        
-        start_idx = (page - 1) * notes_per_page
-        end_idx = start_idx + notes_per_page
-        page_notes = notes[start_idx:end_idx]
+# ===== FLEX PAYLOAD BUDGET =====
+# LINE rejects a carousel over 50 KB or a bubble over 30 KB, and a rejected
+# reply used to go through all of safe_reply's retries. Carousels are fitted
+# while they are built: bubbles over their share of the budget get their long
+# texts truncated; trailing bubbles are dropped only if that is not enough.
+
+flex_payload_lock = threading.Lock()
+flex_payload_stats = {}  # kind -> counters + headroom
+
+def flex_json_size(obj):
+    """Serialized size as the SDK sends it (json.dumps, non-ASCII escaped)"""
+    return len(json.dumps(obj))
+
+def fair_share(sizes, available):
+    """Largest per-bubble size cap such that sum(min(size, cap)) <= available"""
+    remaining = available
+    ordered = sorted(sizes)
+    for i, size in enumerate(ordered):
+        left = len(ordered) - i
+        if size * left > remaining:
+            return max(0, remaining // left)
+        remaining -= size
+    return ordered[-1] if ordered else available
+
+def shrink_bubble_texts(bubble, text_nodes, target):
+    """Cut the longest truncatable text until the bubble fits target -> (size, truncated)"""
+    size = flex_json_size(bubble)
+    truncated = False
+    while size > target:
+        node = max(text_nodes, key=lambda n: len(n["text"]), default=None)
+        if node is None or len(node["text"]) <= Config.FLEX_MIN_TEXT_CHARS + 3:
+            break
+        text = node["text"]
+        bytes_per_char = max(1, (flex_json_size(text) - 2) // len(text))
+        keep = max(Config.FLEX_MIN_TEXT_CHARS, len(text) - 4 - (size - target) // bytes_per_char)
+        node["text"] = text[:keep] + "..."
+        truncated = True
+        size = flex_json_size(bubble)
+    return size, truncated
+
+def fit_carousel_to_limits(fixed_bubbles, page_items, kind):
+    """fixed_bubbles + the page bubbles, fitted into LINE's carousel/bubble size limits.
+    
+    page_items: [(bubble, [text nodes that may be truncated]), ...]
+    """
+    carousel_budget = int(Config.FLEX_CAROUSEL_MAX_BYTES * Config.FLEX_SIZE_SAFETY)
+    bubble_budget = int(Config.FLEX_BUBBLE_MAX_BYTES * Config.FLEX_SIZE_SAFETY)
+    overhead = flex_json_size({"type": "carousel", "contents": fixed_bubbles})
+    sizes = [flex_json_size(bubble) for bubble, _nodes in page_items]
+    separators = 2 * len(page_items)  # ", " between bubbles
+    cap = min(bubble_budget, fair_share(sizes, carousel_budget - overhead - separators))
+    
+    truncated = 0
+    for i, (bubble, text_nodes) in enumerate(page_items):
+        if sizes[i] > cap:
+            sizes[i], was_truncated = shrink_bubble_texts(bubble, text_nodes, cap)
+            truncated += was_truncated
+    
+    kept = len(page_items)
+    while kept and overhead + sum(sizes[:kept]) + 2 * kept > carousel_budget:
+        kept -= 1
+    dropped = len(page_items) - kept
+    if dropped:
+        logger.warning(f"[FLEX] ⚠️ {kind} carousel over budget after truncation - dropped {dropped} bubbles")
+    
+    bubbles = list(fixed_bubbles) + [bubble for bubble, _nodes in page_items[:kept]]
+    record_flex_payload(kind, flex_json_size({"type": "carousel", "contents": bubbles}), truncated, dropped)
+    return bubbles
+
+def record_flex_payload(kind, size, truncated, dropped):
+    """Headroom of each rendered carousel against LINE's limit (exposed in /metrics)"""
+    headroom = 1 - size / Config.FLEX_CAROUSEL_MAX_BYTES
+    bucket = '<10%' if headroom < 0.10 else '10-25%' if headroom < 0.25 else '25-50%' if headroom < 0.50 else '>=50%'
+    with flex_payload_lock:
+        stats = flex_payload_stats.setdefault(kind, {
+            'renders': 0, 'truncated_bubbles': 0, 'dropped_bubbles': 0, 'last_bytes': 0, 'max_bytes': 0,
+            'min_headroom_pct': None, 'headroom': {'<10%': 0, '10-25%': 0, '25-50%': 0, '>=50%': 0}
+        })
+        stats['renders'] += 1
+        stats['truncated_bubbles'] += truncated
+        stats['dropped_bubbles'] += dropped
+        stats['last_bytes'] = size
+        stats['max_bytes'] = max(stats['max_bytes'], size)
+        headroom_pct = round(headroom * 100, 1)
+        if stats['min_headroom_pct'] is None or headroom_pct < stats['min_headroom_pct']:
+            stats['min_headroom_pct'] = headroom_pct
+        stats['headroom'][bucket] += 1
+
+def flex_payload_snapshot():
+    with flex_payload_lock:
+        kinds = {kind: dict(stats, headroom=dict(stats['headroom'])) for kind, stats in flex_payload_stats.items()}
+    return {'limit_bytes': Config.FLEX_CAROUSEL_MAX_BYTES, **kinds}
+
+def build_notes_carousel(notes, page=1, search_query=""):
+    """Notes carousel contents for one page -> (alt_text, carousel dict)"""
+    notes_per_page = min(Config.NOTES_PER_PAGE, Config.MAX_FLEX_BUBBLES - 1)
+    total_notes = len(notes)
+    total_pages = (total_notes + notes_per_page - 1) // notes_per_page
+    
+    start_idx = (page - 1) * notes_per_page
+    end_idx = start_idx + notes_per_page
+    page_notes = notes[start_idx:end_idx]
+    
+    bubbles = []
+    
+    # Add pagination info bubble
+    info_bubble = {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": f"📝 ผลการค้นหาโน๊ต",
+                    "weight": "bold",
+                    "size": "lg",
+                    "color": "#1DB446",
+                    "align": "center"
+                },
+                {
+                    "type": "text",
+                    "text": f"หน้า {page}/{total_pages}",
+                    "size": "md",
+                    "color": "#666666",
+                    "align": "center",
+                    "margin": "sm"
+                },
+                {
+                    "type": "text",
+                    "text": f"รวม {total_notes} รายการ",
+                    "size": "sm",
+                    "color": "#999999",
+                    "align": "center"
+                }
+            ]
+        },
+        "footer": {
+            "type": "box",
+            "layout": "horizontal",
+            "contents": []
+        }
+    }
+    
+    # Add navigation buttons
+    nav_buttons = []
+    if page > 1:
+        nav_buttons.append({
+            "type": "button",
+            "style": "secondary",
+            "height": "sm",
+            "action": {
+                "type": "postback",
+                "label": "◀ ก่อนหน้า",
+                "data": f"notes_page_{page-1}_{search_query}"
+            },
+            "flex": 1
+        })
+    
+    if page < total_pages:
+        nav_buttons.append({
+            "type": "button",
+            "style": "secondary", 
+            "height": "sm",
+            "action": {
+                "type": "postback",
+                "label": "ถัดไป ▶",
+                "data": f"notes_page_{page+1}_{search_query}"
+            },
+            "flex": 1
+        })
+    
+    if nav_buttons:
+        info_bubble["footer"]["contents"] = nav_buttons
+        info_bubble["footer"]["spacing"] = "sm"
+    
+    bubbles.append(info_bubble)
+    
+    # Add note bubbles
+    page_items = []
+    for note in page_notes:
+        note_id = note.get('id', '')
+        title = note.get('name', 'ไม่มีชื่อ')
+        content = get_note_preview(note)
         
-        bubbles = []
+        # Short preview for carousel
+        content_preview = content[:Config.SHORT_CONTENT_PREVIEW] + ("..." if len(content) > Config.SHORT_CONTENT_PREVIEW else "")
         
-        # Add pagination info bubble
-        info_bubble = {
+        bubble = {
             "type": "bubble",
             "body": {
                 "type": "box",
@@ -624,147 +1986,60 @@ def create_notes_carousel_flex(notes, page=1, search_query=""):
                 "contents": [
                     {
                         "type": "text",
-                        "text": f"📝 ผลการค้นหาโน๊ต",
+                        "text": "📝 " + title,
                         "weight": "bold",
                         "size": "lg",
                         "color": "#1DB446",
-                        "align": "center"
+                        "wrap": True
                     },
                     {
-                        "type": "text",
-                        "text": f"หน้า {page}/{total_pages}",
-                        "size": "md",
-                        "color": "#666666",
-                        "align": "center",
-                        "margin": "sm"
+                        "type": "separator",
+                        "margin": "md"
                     },
                     {
                         "type": "text",
-                        "text": f"รวม {total_notes} รายการ",
+                        "text": content_preview,
+                        "wrap": True,
+                        "color": "#666666",
                         "size": "sm",
-                        "color": "#999999",
-                        "align": "center"
+                        "margin": "md"
                     }
                 ]
             },
             "footer": {
                 "type": "box",
-                "layout": "horizontal",
-                "contents": []
-            }
-        }
-        
-        # Add navigation buttons
-        nav_buttons = []
-        if page > 1:
-            nav_buttons.append({
-                "type": "button",
-                "style": "secondary",
-                "height": "sm",
-                "action": {
-                    "type": "postback",
-                    "label": "◀ ก่อนหน้า",
-                    "data": f"notes_page_{page-1}_{search_query}"
-                },
-                "flex": 1
-            })
-        
-        if page < total_pages:
-            nav_buttons.append({
-                "type": "button",
-                "style": "secondary", 
-                "height": "sm",
-                "action": {
-                    "type": "postback",
-                    "label": "ถัดไป ▶",
-                    "data": f"notes_page_{page+1}_{search_query}"
-                },
-                "flex": 1
-            })
-        
-        if nav_buttons:
-            info_bubble["footer"]["contents"] = nav_buttons
-            info_bubble["footer"]["spacing"] = "sm"
-        
-        bubbles.append(info_bubble)
-        
-        # Add note bubbles
-        for note in page_notes:
-            note_id = note.get('id', '')
-            title = note.get('name', 'ไม่มีชื่อ')
-            content = note.get('phone_number', 'ไม่มีเนื้อหา')
-            
-            # Short preview for carousel
-            content_preview = content[:Config.SHORT_CONTENT_PREVIEW] + ("..." if len(content) > Config.SHORT_CONTENT_PREVIEW else "")
-            
-            bubble = {
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": "📝 " + title,
-                            "weight": "bold",
-                            "size": "lg",
-                            "color": "#1DB446",
-                            "wrap": True
-                        },
-                        {
-                            "type": "separator",
-                            "margin": "md"
+                "layout": "vertical",
+                "contents": [
+                    {
+                        "type": "button",
+                        "style": "primary",
+                        "height": "sm",
+                        "action": {
+                            "type": "postback",
+                            "label": "ดูเต็ม",
+                            "data": f"view_note_{note_id}"
                         },
-                        {
-                            "type": "text",
-                            "text": content_preview,
-                            "wrap": True,
-                            "color": "#666666",
-                            "size": "sm",
-                            "margin": "md"
-                        }
-                    ]
-                },
-                "footer": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "button",
-                            "style": "primary",
-                            "height": "sm",
-                            "action": {
-                                "type": "postback",
-                                "label": "ดูเต็ม",
-                                "data": f"view_note_{note_id}"
-                            },
-                            "color": "#1DB446"
-                        }
-                    ]
-                }
+                        "color": "#1DB446"
+                    }
+                ]
             }
-            bubbles.append(bubble)
-        
-        carousel = {
-            "type": "carousel",
-            "contents": bubbles
         }
-        
-        return FlexMessage(alt_text=f"โน๊ต หน้า {page}/{total_pages}", contents=FlexContainer.from_dict(carousel))
-        
-    except Exception as e:
-        print(f"[ERROR] Create notes carousel error: {e}")
-        return None
-
-def create_beautiful_flex_message_working(events, user_id=None, page=1, search_query="", context_type="all"):
-    """🎨 100% WORKING BEAUTIFUL FLEX MESSAGE"""
-    if not events:
-        return None
+        body = bubble["body"]["contents"]
+        page_items.append((bubble, [body[0], body[2]]))
+    
+    carousel = {
+        "type": "carousel",
+        "contents": fit_carousel_to_limits(bubbles, page_items, 'notes')
+    }
     
+    return f"โน๊ต หน้า {page}/{total_pages}", carousel
+
+def build_events_carousel(events, user_id=None, page=1, search_query="", context_type="all"):
+    """Events carousel contents for one page -> (alt_text, carousel dict)"""
     bubbles = []
     
     # Pagination settings
-    events_per_page = Config.EVENTS_PER_PAGE
+    events_per_page = min(Config.EVENTS_PER_PAGE, Config.MAX_FLEX_BUBBLES - 1)
     total_events = len(events)
     total_pages = (total_events + events_per_page - 1) // events_per_page
     
@@ -853,6 +2128,7 @@ def create_beautiful_flex_message_working(events, user_id=None, page=1, search_q
         bubbles.append(info_bubble)
     
     # Add event bubbles
+    page_items = []
     for event in page_events:
         title = event.get('event_title', 'ไม่มีชื่อ')
         description = event.get('event_description', 'ไม่มีรายละเอียด')
@@ -1018,8 +2294,10 @@ def create_beautiful_flex_message_working(events, user_id=None, page=1, search_q
                 ]
             }
         
-        bubbles.append(bubble)
+        # Title and description are the texts that may be cut to fit LINE's size limits
+        page_items.append((bubble, [body_contents[0], body_contents[1]["contents"][1]["contents"][1]]))
     
+    bubbles = fit_carousel_to_limits(bubbles, page_items, 'events')
     flex_content = {
         "type": "carousel",
         "contents": bubbles
@@ -1030,7 +2308,79 @@ def create_beautiful_flex_message_working(events, user_id=None, page=1, search_q
     displayed_count = len(bubbles)
     alt_text = f"รายละเอียดกิจกรรม ({displayed_count}/{total_count} รายการ)"
     
-    return FlexMessage(alt_text=alt_text, contents=FlexContainer.from_dict(flex_content))
+    return alt_text, flex_content
+
+# ===== RENDER CACHE =====
+
+render_cache = RenderCache(max_entries=Config.RENDER_CACHE_SIZE, ttl_seconds=Config.RENDER_CACHE_TTL_SECONDS)
+carousel_prefetcher = CarouselPrefetcher(max_workers=Config.PREFETCH_MAX_WORKERS, max_pending=Config.PREFETCH_MAX_PENDING)
+
+def events_carousel_key(events, user_id, page, search_query, context_type):
+    return ('events', user_id, result_fingerprint(events, EVENT_RENDER_FIELDS), page, context_type,
+            user_id in admin_ids, search_query)
+
+def notes_carousel_key(notes, user_id, page, search_query):
+    return ('notes', user_id, result_fingerprint(notes, NOTE_RENDER_FIELDS), page, 'notes',
+            user_id in admin_ids, search_query)
+
+def render_carousel_into_cache(key, rows, kind, build, prefetched=False):
+    """Build a page and store its serialized Flex JSON -> (alt_text, contents)"""
+    alt_text, contents = build()
+    flex_json = json.dumps(contents, ensure_ascii=False)
+    render_cache.put(key, alt_text, flex_json, [(kind, str(row.get('id'))) for row in rows], prefetched=prefetched)
+    return alt_text, contents
+
+def cached_carousel(key, rows, kind, build):
+    """FlexMessage for a rendered page - served from render_cache when the same page was shown before.
+    
+    The cache holds serialized Flex JSON (callers attach quick_reply to the
+    returned message, so each call gets a fresh FlexMessage).
+    """
+    cached = render_cache.get(key)
+    if cached is not None:
+        alt_text, flex_json = cached
+        return FlexMessage(alt_text=alt_text, contents=FlexContainer.from_json(flex_json))
+    
+    alt_text, contents = render_carousel_into_cache(key, rows, kind, build)
+    return FlexMessage(alt_text=alt_text, contents=FlexContainer.from_dict(contents))
+
+def create_notes_carousel_flex(notes, page=1, search_query="", user_id=None):
+    """🎨 Create notes carousel Flex Message with pagination"""
+    try:
+        key = notes_carousel_key(notes, user_id, page, search_query)
+        return cached_carousel(key, notes, 'note', lambda: build_notes_carousel(notes, page, search_query))
+    except Exception as e:
+        print(f"[ERROR] Create notes carousel error: {e}")
+        return None
+
+def create_beautiful_flex_message_working(events, user_id=None, page=1, search_query="", context_type="all"):
+    """🎨 100% WORKING BEAUTIFUL FLEX MESSAGE"""
+    if not events:
+        return None
+    
+    key = events_carousel_key(events, user_id, page, search_query, context_type)
+    return cached_carousel(key, events, 'event',
+                           lambda: build_events_carousel(events, user_id, page, search_query, context_type))
+
+def prefetch_next_page(kind, rows, user_id, page, search_query="", context_type="all"):
+    """After page N was sent, render page N+1 of the same result set into render_cache in the background"""
+    per_page = Config.EVENTS_PER_PAGE if kind == 'events' else Config.NOTES_PER_PAGE
+    next_page = page + 1
+    if not rows or (next_page - 1) * per_page >= len(rows):
+        return False
+    rows = list(rows)  # user_states may be replaced while the prefetch waits
+    
+    def task():
+        if kind == 'events':
+            key = events_carousel_key(rows, user_id, next_page, search_query, context_type)
+            build = lambda: build_events_carousel(rows, user_id, next_page, search_query, context_type)
+        else:
+            key = notes_carousel_key(rows, user_id, next_page, search_query)
+            build = lambda: build_notes_carousel(rows, next_page, search_query)
+        if key not in render_cache:
+            render_carousel_into_cache(key, rows, kind[:-1], build, prefetched=True)
+    
+    return carousel_prefetcher.submit((kind, user_id, next_page, context_type, search_query), task)
 
 # ===== ROUTES =====
 
@@ -1041,7 +2391,7 @@ def hello():
     # Service status check
     services_status = {
         'line_bot_api': '✅ Ready' if line_bot_api else '❌ Not initialized',
-        'supabase_client': '✅ Ready' if supabase_client else '❌ Not initialized',
+        'database': '✅ Ready' if storage_ready else '❌ Not initialized',
         'handler': '✅ Ready' if handler else '❌ Not initialized'
     }
     
@@ -1051,7 +2401,7 @@ def hello():
 
 🔧 **Services Status:**
 • LINE Bot API: {services_status['line_bot_api']}
-• Supabase Database: {services_status['supabase_client']}
+• Database ({storage_backend}): {services_status['database']}
 • Webhook Handler: {services_status['handler']}
 
 ✅ **Features (100% Working):**
@@ -1061,6 +2411,7 @@ def hello():
 • ค้นหาโน๊ต ✅
 • ค้นหาตามวันที่ ✅
 • ดูกิจกรรมทั้งหมด ✅
+• ดูที่เก็บถาวร ✅
 
 👑 **Admin:** Uc88eb3896b0e4bcc5fbaa9b78ac1294e
 🔗 **Webhook:** /webhook (POST)
@@ -1084,7 +2435,15 @@ def health_check():
         'services': {
             'line_bot_api': bool(line_bot_api),
             'supabase_client': bool(supabase_client), 
-            'webhook_handler': bool(handler)
+            'webhook_handler': bool(handler),
+            'storage_backend': storage_backend,
+            'storage_ready': storage_ready
+        },
+        'scheduler': {
+            'notification_mode': notification_mode,
+            'leader_mode': scheduler_elector.mode,
+            'is_leader': scheduler_elector.is_leader,
+            'holder_id': scheduler_elector.holder_id
         },
         'environment': {
             'line_access_token': bool(line_access_token),
@@ -1096,6 +2455,164 @@ def health_check():
     
     return health_status, 200
 
+@app.route("/metrics", methods=['GET'])
+def query_metrics():
+    """Per-query-shape call counts, latency histograms and result sizes"""
+    return {
+        'timestamp': get_current_thai_time().isoformat(),
+        'queries': query_registry.snapshot(),
+        'replicas': {replica.name: replica.stats() for replica in (events_replica, notes_replica) if replica is not None},
+        'render_cache': render_cache.stats(),
+        'prefetch': carousel_prefetcher.stats(),
+        'loading_animation': latency_watchdog.stats(),
+        'deadlines': request_deadlines.stats(),
+        'single_flight': single_flight.stats(),
+        'hedged_reads': hedged_reads.stats() if hedged_reads is not None else None,
+        'flex_payloads': flex_payload_snapshot(),
+        'push_queue': push_queue.stats() if push_queue is not None else None,
+        'calendar_feeds': calendar_feeds.stats()
+    }, 200
+
+# ===== CALENDAR FEED =====
+
+calendar_feeds = CalendarFeedCache(Config.CALENDAR_FEED_CACHE_SIZE, Config.CALENDAR_FEED_REVALIDATE_SECONDS)
+
+def public_link(path):
+    """Absolute URL for a link the bot sends (needs a request context without PUBLIC_BASE_URL)"""
+    return (public_base_url or request.url_root.rstrip('/')) + path
+
+def calendar_feed_url(user_id):
+    """Signed subscription URL for a user's events"""
+    return public_link(f"/calendar/{user_id}.ics?token={feed_token(calendar_feed_secret, user_id)}")
+
+def check_calendar_feed(user_id):
+    """One list query: the user's feed rows (stable order) and their cache entry"""
+    rows = sorted(events_repo.list_for_user(user_id), key=lambda e: (str(e.get('event_date') or ''), str(e.get('id'))))
+    return rows, calendar_feeds.checked(user_id, f'"{result_fingerprint(rows, EVENT_RENDER_FIELDS)}"')
+
+def stream_calendar(user_id, etag, rows):
+    """Stream the feed and cache the body once it was sent completely"""
+    chunks = []
+    for chunk in iter_calendar(rows, "กิจกรรม - 24h Assistant Bot"):
+        chunks.append(chunk)
+        yield chunk
+    calendar_feeds.store_body(user_id, etag, ''.join(chunks))
+
+@app.route("/calendar/<user_id>.ics", methods=['GET'])
+def calendar_feed(user_id):
+    """Per-user ICS feed behind a signed URL, with ETag / Last-Modified revalidation"""
+    if not verify_feed_token(calendar_feed_secret, user_id, request.args.get('token', '')):
+        return {'status': 'error', 'message': 'Not found'}, 404
+    
+    try:
+        rows = None
+        entry = calendar_feeds.fresh(user_id)
+        if entry is None:
+            rows, entry = check_calendar_feed(user_id)
+        
+        headers = {
+            'ETag': entry['etag'],
+            'Last-Modified': http_date(entry['last_modified']),
+            'Cache-Control': f'private, max-age={Config.CALENDAR_FEED_REVALIDATE_SECONDS}'
+        }
+        if is_not_modified(entry['etag'], entry['last_modified'],
+                           request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+            calendar_feeds.count_not_modified()
+            return Response(status=304, headers=headers)
+        if entry['body'] is not None:
+            return Response(entry['body'], headers=headers, mimetype='text/calendar')
+        
+        if rows is None:
+            # Fresh entry without a body (its stream was cut off) - rows are needed after all
+            rows, entry = check_calendar_feed(user_id)
+            headers.update({'ETag': entry['etag'], 'Last-Modified': http_date(entry['last_modified'])})
+        return Response(stream_calendar(user_id, entry['etag'], rows), headers=headers, mimetype='text/calendar')
+    except Exception as e:
+        logger.error(f"[CALENDAR] ❌ Feed failed for User{user_id[-4:]}: {e}")
+        return {'status': 'error', 'message': 'Calendar temporarily unavailable'}, 503
+
+# ===== BULK DATA =====
+# Admins authenticate with the cron secret and may pass ?user_id= (export:
+# one user instead of everyone; import: owner of every record). Users use
+# ?user_id=...&token=... from "ส่งออกข้อมูล" and only reach their own rows.
+
+def bulk_data_url(user_id, kind, fmt):
+    return public_link(f"/data/{kind}.{fmt}?user_id={user_id}&token={data_token(bulk_data_secret, user_id)}")
+
+def bulk_data_owner():
+    """(allowed, owner): owner None means every user (admin only)"""
+    if cron_secret and is_authorized_cron_request():
+        return True, request.args.get('user_id') or None
+    user_id = request.args.get('user_id', '')
+    if verify_data_token(bulk_data_secret, user_id, request.args.get('token', '')):
+        return True, user_id
+    return False, None
+
+def stream_export(chunks, label):
+    """Pass chunks through; a failure mid-stream is logged and aborts the response (a truncated file is detectable)"""
+    try:
+        yield from chunks
+    except Exception as e:
+        logger.error(f"[BULK] ❌ Export {label} stopped: {e}")
+        raise
+
+def import_events_batch(rows):
+    inserted = events_repo.insert_many(rows)
+    for event in inserted:
+        reminder_index.schedule(event)
+    for owner in {event.get('created_by') for event in inserted}:
+        calendar_feeds.invalidate(owner)
+    return inserted
+
+def import_notes_batch(rows):
+    return notes_repo.insert_many(rows)
+
+@app.route("/data/<kind>.<fmt>", methods=['GET'])
+def export_data(kind, fmt):
+    """Stream events or notes as CSV / JSON in id order; ?after=<id> resumes, ?limit= caps the rows"""
+    if kind not in EXPORT_FIELDS or fmt not in ('csv', 'json'):
+        return {'status': 'error', 'message': 'Not found'}, 404
+    allowed, owner = bulk_data_owner()
+    if not allowed:
+        return {'status': 'error', 'message': 'Unauthorized'}, 401
+    try:
+        after_id = int(request.args.get('after', 0))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return {'status': 'error', 'message': 'after and limit must be integers'}, 400
+    
+    repo = events_repo if kind == 'events' else notes_repo
+    rows = iter_keyset(lambda after, size: repo.export_page(owner, after, size), Config.EXPORT_PAGE_SIZE, after_id, limit)
+    chunks = iter_csv(kind, rows) if fmt == 'csv' else iter_json(kind, rows)
+    logger.info(f"[BULK] 📤 Export {kind}.{fmt} for {'User' + owner[-4:] if owner else 'all users'}")
+    return Response(
+        stream_export(chunks, f"{kind}.{fmt}"),
+        mimetype='text/csv' if fmt == 'csv' else 'application/json',
+        headers={'Content-Disposition': f'attachment; filename="{kind}.{fmt}"'}
+    )
+
+@app.route("/data/<kind>.<fmt>", methods=['POST'])
+def import_data(kind, fmt):
+    """Import a streamed CSV / JSON upload in validated batches; answers with a summary"""
+    if kind not in EXPORT_FIELDS or fmt not in ('csv', 'json'):
+        return {'status': 'error', 'message': 'Not found'}, 404
+    allowed, owner = bulk_data_owner()
+    if not allowed:
+        return {'status': 'error', 'message': 'Unauthorized'}, 401
+    
+    try:
+        records = read_csv_records(request.stream) if fmt == 'csv' else read_json_records(request.stream)
+        summary = import_records(
+            records, VALIDATORS[kind], owner, import_events_batch if kind == 'events' else import_notes_batch,
+            Config.IMPORT_BATCH_SIZE, Config.IMPORT_MAX_REPORTED_ERRORS
+        )
+        logger.info(f"[BULK] 📥 Import {kind}.{fmt}: {summary['inserted']} inserted, "
+                    f"{summary['invalid']} invalid, {summary['failed']} failed")
+        return {'status': 'success', **summary}, 200
+    except Exception as e:
+        logger.error(f"[BULK] ❌ Import {kind}.{fmt} failed: {e}")
+        return {'status': 'error', 'message': str(e)}, 500
+
 @app.route("/test-notifications", methods=['GET'])
 def test_notifications():
     """Manual test endpoint for notification system"""
@@ -1107,7 +2624,9 @@ def test_notifications():
             'status': 'success',
             'message': 'Notification check completed manually',
             'scheduler_running': scheduler.running if scheduler else False,
-            'scheduler_available': SCHEDULER_AVAILABLE
+            'scheduler_available': SCHEDULER_AVAILABLE,
+            'reminder_index_running': reminder_index.running,
+            'reminders_pending': len(reminder_index)
         }, 200
     except Exception as e:
         logger.error(f"[TEST] Manual notification test failed: {e}")
@@ -1118,6 +2637,74 @@ def test_notifications():
             'scheduler_available': SCHEDULER_AVAILABLE
         }, 500
 
+def is_authorized_cron_request():
+    """Check the shared cron secret (Authorization: Bearer <secret> or X-Cron-Secret)"""
+    if not cron_secret:
+        return False
+    auth_header = request.headers.get('Authorization', '')
+    provided = auth_header[7:] if auth_header.startswith('Bearer ') else request.headers.get('X-Cron-Secret', '')
+    return hmac.compare_digest(provided.encode(), cron_secret.encode())
+
+@app.route("/cron/notifications", methods=['GET', 'POST'])
+def cron_notifications():
+    """Stateless notification pass for external/serverless cron"""
+    if not cron_secret:
+        return {'status': 'error', 'message': 'CRON_SECRET is not configured'}, 503
+    if not is_authorized_cron_request():
+        return {'status': 'error', 'message': 'Unauthorized'}, 401
+    
+    try:
+        result = run_notification_pass()
+        return {'status': 'success', **result}, 200
+    except Exception as e:
+        logger.error(f"[CRON] ❌ Notification pass failed: {e}")
+        return {'status': 'error', 'message': str(e)}, 500
+
+@app.route("/cron/retention", methods=['GET', 'POST'])
+def cron_retention():
+    """Daily archive/purge pass for external/serverless cron"""
+    if not cron_secret:
+        return {'status': 'error', 'message': 'CRON_SECRET is not configured'}, 503
+    if not is_authorized_cron_request():
+        return {'status': 'error', 'message': 'Unauthorized'}, 401
+    
+    try:
+        result = run_retention_pass(time_budget=Config.CRON_TIME_BUDGET_SECONDS)
+        return {'status': 'success', **result}, 200
+    except Exception as e:
+        logger.error(f"[CRON] ❌ Retention pass failed: {e}")
+        return {'status': 'error', 'message': str(e)}, 500
+
+@app.route("/admin/push-queue", methods=['GET'])
+def push_queue_status():
+    """Queue counters and the most recent dead letters"""
+    if not cron_secret:
+        return {'status': 'error', 'message': 'CRON_SECRET is not configured'}, 503
+    if not is_authorized_cron_request():
+        return {'status': 'error', 'message': 'Unauthorized'}, 401
+    if push_queue is None:
+        return {'status': 'error', 'message': 'Push queue is disabled'}, 404
+    
+    return {'status': 'success', 'queue': push_queue.stats(), 'dead_letters': push_queue.dead_letters()}, 200
+
+@app.route("/admin/push-queue/replay", methods=['POST'])
+def push_queue_replay():
+    """Put dead letters back in the queue: body {"ids": [...]} or no body for all of them"""
+    if not cron_secret:
+        return {'status': 'error', 'message': 'CRON_SECRET is not configured'}, 503
+    if not is_authorized_cron_request():
+        return {'status': 'error', 'message': 'Unauthorized'}, 401
+    if push_queue is None:
+        return {'status': 'error', 'message': 'Push queue is disabled'}, 404
+    
+    try:
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        replayed = push_queue.replay(ids)
+        return {'status': 'success', 'replayed': len(replayed), 'idempotency_keys': replayed}, 200
+    except Exception as e:
+        logger.error(f"[PUSH QUEUE] ❌ Replay failed: {e}")
+        return {'status': 'error', 'message': str(e)}, 500
+
 @app.route("/webhook", methods=['POST'])
 def callback():
     """🔥 BULLETPROOF WEBHOOK HANDLER - NEVER RETURN 500"""
@@ -1128,7 +2715,10 @@ def callback():
     print(f"[WEBHOOK] Received request - Signature: {signature[:20]}... Body length: {len(body)}")
     
     try:
-        handler.handle(body, signature)
+        if push_queue is not None:
+            push_queue.start()  # No-op once this worker process runs its queue thread
+        with request_deadlines.scope():
+            handler.handle(body, signature)
         print("[WEBHOOK] ✅ Successfully handled webhook")
         return 'OK', 200
     except InvalidSignatureError as e:
@@ -1143,6 +2733,8 @@ def callback():
 # ===== MESSAGE HANDLER =====
 
 @handler.add(MessageEvent, message=TextMessageContent)
+@show_loading_when_slow('message')
+@one_event_per_user
 def handle_message(event):
     try:
         text = event.message.text.strip()
@@ -1164,8 +2756,7 @@ def handle_message(event):
                 date_str = text.replace("วันที่:", "").strip()
                 print(f"[PRIORITY DATE SEARCH] Date: '{date_str}'")
                 
-                events_response = supabase_client.table('events').select('*').eq('created_by', user_id).eq('event_date', date_str).order('event_date', desc=False).execute()
-                events = events_response.data if events_response.data else []
+                events = events_repo.list_on_date(user_id, date_str)
                 
                 if events:
                     flex_message = create_beautiful_flex_message_working(events, user_id, page=1, search_query="", context_type="date")
@@ -1177,6 +2768,7 @@ def handle_message(event):
                     }
                     if flex_message:
                         safe_reply(reply_token, [flex_message])
+                        prefetch_next_page('events', events, user_id, 1, context_type="date")
                     else:
                         thai_date = format_thai_date(date_str)
                         safe_reply(reply_token, [TextMessage(
@@ -1204,7 +2796,7 @@ def handle_message(event):
             return
 
         # Reset state if user types any main menu command while in a pending state
-        main_menu_commands = ["เพิ่มกิจกรรม", "เพิ่มโน๊ต", "ค้นหากิจกรรม", "ค้นหาโน๊ต", "ค้นหาตามวันที่", "ดูกิจกรรมทั้งหมด"]
+        main_menu_commands = ["เพิ่มกิจกรรม", "เพิ่มโน๊ต", "ค้นหากิจกรรม", "ค้นหาโน๊ต", "ค้นหาตามวันที่", "ดูกิจกรรมทั้งหมด", "ดูที่เก็บถาวร", "ลิงก์ปฏิทิน", "ส่งออกข้อมูล"]
         if text in main_menu_commands and user_id in user_states:
             user_states.pop(user_id, None)  # Clear any pending state
 
@@ -1249,14 +2841,8 @@ def handle_message(event):
                     user_states[user_id] = {}
                 user_states[user_id]["page"] = 1
                 
-                # Check if user is admin
-                if user_id in admin_ids:
-                    # Admin can see all events
-                    events_response = supabase_client.table('events').select('*').order('event_date', desc=False).execute()
-                else:
-                    # Regular user sees only their events
-                    events_response = supabase_client.table('events').select('*').eq('created_by', user_id).order('event_date', desc=False).execute()
-                events = events_response.data if events_response.data else []
+                # Admin can see all events, regular users only their own
+                events = events_repo.list_visible(user_id, user_id in admin_ids)
                 
                 if events:
                     # Show more events for better visibility
@@ -1292,6 +2878,7 @@ def handle_message(event):
                             ])
                         else:
                             safe_reply(reply_token, [flex_message])
+                        prefetch_next_page('events', events, user_id, 1, context_type="all")
                     else:
                         title_text = "📋 **กิจกรรมของคุณ**" if user_id not in admin_ids else "📋 **กิจกรรมทั้งหมด (Admin)**"
                         result_text = f"{title_text} ({len(events)} รายการ):\n\n"
@@ -1316,6 +2903,38 @@ def handle_message(event):
                 safe_reply(reply_token, [TextMessage(text="❌ เกิดข้อผิดพลาด", quick_reply=create_main_menu())])
             return
 
+        if text == "ดูที่เก็บถาวร":
+            try:
+                safe_reply(reply_token, [create_archive_page_message(user_id, page=1)])
+            except Exception as e:
+                print(f"[ERROR] View archive error: {e}")
+                safe_reply(reply_token, [TextMessage(text="❌ เกิดข้อผิดพลาด", quick_reply=create_main_menu())])
+            return
+
+        # Subscribe link for phone calendars (ICS feed of the user's own events)
+        if text == "ลิงก์ปฏิทิน":
+            try:
+                safe_reply(reply_token, [TextMessage(
+                    text=f"📆 **ปฏิทินกิจกรรมของคุณ**\n\n{calendar_feed_url(user_id)}\n\n💡 เพิ่มลิงก์นี้เป็นปฏิทินแบบสมัครรับ (Subscribe) ในแอปปฏิทินของโทรศัพท์ กิจกรรมใหม่จะอัปเดตเอง\n⚠️ อย่าแชร์ลิงก์นี้ให้ผู้อื่น",
+                    quick_reply=create_main_menu()
+                )])
+            except Exception as e:
+                print(f"[ERROR] Calendar link error: {e}")
+                safe_reply(reply_token, [TextMessage(text="❌ เกิดข้อผิดพลาด", quick_reply=create_main_menu())])
+            return
+
+        # Personal export links (CSV; the same links end in .json for JSON)
+        if text == "ส่งออกข้อมูล":
+            try:
+                safe_reply(reply_token, [TextMessage(
+                    text=f"📦 **ส่งออกข้อมูลของคุณ**\n\n📅 กิจกรรม:\n{bulk_data_url(user_id, 'events', 'csv')}\n\n📝 โน๊ต:\n{bulk_data_url(user_id, 'notes', 'csv')}\n\n💡 เปลี่ยน .csv เป็น .json เพื่อรับไฟล์ JSON\n⚠️ อย่าแชร์ลิงก์นี้ให้ผู้อื่น",
+                    quick_reply=create_main_menu()
+                )])
+            except Exception as e:
+                print(f"[ERROR] Export link error: {e}")
+                safe_reply(reply_token, [TextMessage(text="❌ เกิดข้อผิดพลาด", quick_reply=create_main_menu())])
+            return
+
         # Handle calendar date selection
         if text == "พิมพ์วันที่":
             safe_reply(reply_token, [TextMessage(
@@ -1391,15 +3010,8 @@ def handle_message(event):
                 # Calculate offset for pagination (12 items per page)
                 offset = (page - 1) * 12
                 
-                # Check if user is admin
-                if user_id in admin_ids:
-                    # Admin can see all events
-                    events_response = supabase_client.table('events').select('*').order('event_date', desc=False).execute()
-                else:
-                    # Regular users see only their events
-                    events_response = supabase_client.table('events').select('*').eq('created_by', user_id).order('event_date', desc=False).execute()
-                
-                events = events_response.data
+                # Admin can see all events, regular users only their own
+                events = events_repo.list_visible(user_id, user_id in admin_ids)
                 total_events = len(events)
                 
                 # Get events for current page
@@ -1467,12 +3079,15 @@ def handle_message(event):
             elif state["step"] == "add_event_date":
                 try:
                     date_text = text.strip()
-                    supabase_client.table('events').insert({
+                    inserted_events = events_repo.insert({
                         'event_title': state["title"],
                         'event_description': state["description"],
                         'event_date': date_text,
                         'created_by': user_id
-                    }).execute()
+                    })
+                    for inserted_event in inserted_events:
+                        reminder_index.schedule(inserted_event)
+                    calendar_feeds.invalidate(user_id)
                     
                     user_states.pop(user_id, None)
                     thai_date = format_thai_date(date_text)
@@ -1496,11 +3111,7 @@ def handle_message(event):
                 
             elif state["step"] == "add_note_content":
                 try:
-                    supabase_client.table('contacts').insert({
-                        'name': state["name"],
-                        'phone_number': text.strip(),
-                        'created_by': user_id
-                    }).execute()
+                    notes_repo.insert(state["name"], text.strip(), user_id)
                     
                     user_states.pop(user_id, None)
                     safe_reply(reply_token, [TextMessage(
@@ -1518,11 +3129,7 @@ def handle_message(event):
                     search_query = text.strip()
                     normalized_query = normalize_thai_text(search_query)
                     
-                    events_response = supabase_client.table('events').select('*').eq('created_by', user_id).or_(
-                        f"event_title.ilike.%{search_query}%,event_description.ilike.%{search_query}%"
-                    ).order('event_date', desc=False).limit(10).execute()
-                    
-                    events = events_response.data if events_response.data else []
+                    events = events_repo.search(user_id, search_query, limit=Config.MAX_SEARCH_RESULTS)
                     user_states.pop(user_id, None)
                     
                     if events:
@@ -1535,6 +3142,7 @@ def handle_message(event):
                         }
                         if flex_message:
                             safe_reply(reply_token, [flex_message])
+                            prefetch_next_page('events', events, user_id, 1, search_query, "search")
                         else:
                             result_text = f"🔎 **ผลการค้นหา: \"{search_query}\"**\n\n"
                             for i, event in enumerate(events[:10], 1):  # Show more in text format
@@ -1574,11 +3182,20 @@ def handle_message(event):
                     event_id = state["event_id"]
                     
                     # Update event in database
-                    supabase_client.table('events').update({
+                    # Ownership is re-checked by the update itself
+                    updated_events = events_repo.update_owned(event_id, user_id, user_id in admin_ids, {
                         'event_title': state["title"],
                         'event_description': state["description"],
                         'event_date': date_text
-                    }).eq('id', event_id).execute()
+                    })
+                    if not updated_events:
+                        user_states.pop(user_id, None)
+                        safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
+                        return
+                    for updated_event in updated_events:
+                        reminder_index.schedule(updated_event)
+                        render_cache.invalidate('event', updated_event.get('id'))
+                        calendar_feeds.invalidate(updated_event.get('created_by'))
                     
                     user_states.pop(user_id, None)
                     thai_date = format_thai_date(date_text)
@@ -1598,31 +3215,8 @@ def handle_message(event):
                 try:
                     search_query = text.strip()
                     
-                    # Enhanced search: Split query into words for better partial matching
-                    search_words = search_query.split()
-                    if len(search_words) > 1:
-                        # Multi-word search: create OR conditions for each word
-                        word_conditions = []
-                        for word in search_words[:3]:  # Limit to 3 words max
-                            word = word.strip()
-                            if len(word) >= 2:  # Only search words with 2+ characters
-                                word_conditions.extend([
-                                    f'name.ilike.%{word}%',
-                                    f'phone_number.ilike.%{word}%'
-                                ])
-                        
-                        if word_conditions:
-                            # Join all conditions with OR
-                            search_condition = ','.join(word_conditions)
-                            notes_response = supabase_client.table('contacts').select('*').eq('created_by', user_id).or_(search_condition).order('created_at', desc=True).limit(10).execute()
-                        else:
-                            # Fallback to original search
-                            notes_response = supabase_client.table('contacts').select('*').eq('created_by', user_id).or_(f'name.ilike.%{search_query}%,phone_number.ilike.%{search_query}%').order('created_at', desc=True).limit(10).execute()
-                    else:
-                        # Single word search
-                        notes_response = supabase_client.table('contacts').select('*').eq('created_by', user_id).or_(f'name.ilike.%{search_query}%,phone_number.ilike.%{search_query}%').order('created_at', desc=True).limit(10).execute()
-                    
-                    notes = notes_response.data if notes_response.data else []
+                    # Multi-word queries match any of the first 3 words (see NotesRepo.search_condition)
+                    notes = notes_repo.search(user_id, search_query, limit=Config.MAX_SEARCH_RESULTS)
                     user_states.pop(user_id, None)
                     
                     if not notes:
@@ -1640,39 +3234,30 @@ def handle_message(event):
                         safe_reply(reply_token, [flex_message])
                     else:
                         # Multiple notes - create carousel with pagination
-                        flex_message = create_notes_carousel_flex(notes, page=1, search_query=search_query)
+                        flex_message = create_notes_carousel_flex(notes, page=1, search_query=search_query, user_id=user_id)
                         # Store search results for pagination
                         user_states[user_id] = {
                             "notes_search_results": notes,
                             "notes_search_query": search_query
                         }
                         safe_reply(reply_token, [flex_message])
+                        prefetch_next_page('notes', notes, user_id, 1, search_query)
                 except Exception as e:
                     print(f"[ERROR] Search notes error: {e}")
                     safe_reply(reply_token, [TextMessage(text="❌ เกิดข้อผิดพลาดในการค้นหา")])
                 return
 
         # Text commands for event management
+        # Ownership (owner or admin) is part of every query, so each action is one DB call
         if text.startswith('แก้ไข '):
             try:
                 event_id = text.replace('แก้ไข ', '').strip()
-                event_check = supabase_client.table('events').select('created_by').eq('id', event_id).execute()
-                if not event_check.data:
-                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรมที่ต้องการ", quick_reply=create_main_menu())])
-                    return
-                
-                is_owner = event_check.data[0]['created_by'] == user_id
-                is_admin = user_id in admin_ids
-                
-                if not (is_owner or is_admin):
-                    safe_reply(reply_token, [TextMessage(text="❌ คุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
+                event_check = events_repo.get_owned(event_id, user_id, user_id in admin_ids, columns='id')
+                if not event_check:
+                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
                     return
                 
                 # Admin can edit all events (updated policy)
-                # if is_admin and not is_owner:
-                #     safe_reply(reply_token, [TextMessage(text="❌ Admin สามารถลบได้ แต่แก้ไขได้เฉพาะเจ้าของ", quick_reply=create_main_menu())])
-                #     return
-                
                 user_states[user_id] = {"step": "edit_event_title", "event_id": event_id}
                 safe_reply(reply_token, [TextMessage(text=f"✏️ **แก้ไขกิจกรรม ID: {event_id}**\n\nพิมพ์ชื่อกิจกรรมใหม่:", quick_reply=create_main_menu())])
             except Exception as e:
@@ -1683,20 +3268,14 @@ def handle_message(event):
         if text.startswith('ลบ '):
             try:
                 event_id = text.replace('ลบ ', '').strip()
-                event_check = supabase_client.table('events').select('created_by, event_title').eq('id', event_id).execute()
-                if not event_check.data:
-                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรมที่ต้องการ", quick_reply=create_main_menu())])
-                    return
-                
-                is_owner = event_check.data[0]['created_by'] == user_id
-                is_admin = user_id in admin_ids
-                event_title = event_check.data[0].get('event_title', 'กิจกรรม')
-                
-                if not (is_owner or is_admin):
-                    safe_reply(reply_token, [TextMessage(text="❌ คุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
+                event_check = events_repo.get_owned(event_id, user_id, user_id in admin_ids, columns='created_by, event_title')
+                if not event_check:
+                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
                     return
                 
-                admin_note = " (Admin Delete)" if is_admin and not is_owner else ""
+                is_owner = event_check['created_by'] == user_id
+                event_title = event_check.get('event_title', 'กิจกรรม')
+                admin_note = " (Admin Delete)" if not is_owner else ""
                 
                 # Create Quick Reply for delete confirmation
                 quick_reply = QuickReply(items=[
@@ -1716,23 +3295,18 @@ def handle_message(event):
         if text.startswith('เสร็จ '):
             try:
                 event_id = text.replace('เสร็จ ', '').strip()
-                event_check = supabase_client.table('events').select('created_by').eq('id', event_id).execute()
-                if not event_check.data:
-                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรมที่ต้องการ", quick_reply=create_main_menu())])
-                    return
-                
-                is_owner = event_check.data[0]['created_by'] == user_id
-                is_admin = user_id in admin_ids
-                
-                if not (is_owner or is_admin):
-                    safe_reply(reply_token, [TextMessage(text="❌ คุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
+                archived_events = events_repo.complete_owned(event_id, user_id, user_id in admin_ids)
+                if not archived_events:
+                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
                     return
                 
-                supabase_client.table('events').delete().eq('id', event_id).execute()
-                admin_note = " (Admin)" if is_admin and not is_owner else ""
+                reminder_index.cancel(event_id)
+                render_cache.invalidate('event', event_id)
+                calendar_feeds.invalidate(archived_events[0].get('created_by'))
+                admin_note = " (Admin)" if archived_events[0].get('created_by') != user_id else ""
                 safe_reply(reply_token, [TextMessage(
-                    text=f"✅ **กิจกรรมเสร็จแล้ว!**{admin_note}\n\n🆔 ID: {event_id}\n🎉 ลบออกจากรายการแล้ว",
-                    quick_reply=create_main_menu()
+                    text=f"✅ **กิจกรรมเสร็จแล้ว!**{admin_note}\n\n🆔 ID: {event_id}\n🗄️ ย้ายไปที่เก็บถาวรแล้ว",
+                    quick_reply=create_archive_quick_reply()
                 )])
             except Exception as e:
                 print(f"[ERROR] Complete command error: {e}")
@@ -1744,48 +3318,24 @@ def handle_message(event):
                 event_id = text.replace('ยืนยันลบ ', '').strip()
                 print(f"[DELETE] Confirming delete: event_id={event_id}, user_id={user_id}")
                 
-                # Get event details including title
-                event_check = supabase_client.table('events').select('*').eq('id', event_id).execute()
-                if not event_check.data:
-                    print(f"[DELETE] Event not found: {event_id}")
-                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรมที่ต้องการ", quick_reply=create_main_menu())])
+                # Delete filtered by ownership - the returned rows say whether it existed and was allowed
+                deleted_events = events_repo.delete_owned(event_id, user_id, user_id in admin_ids)
+                if not deleted_events:
+                    print(f"[DELETE] Not found or access denied: event_id={event_id}, user_id={user_id}")
+                    safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
                     return
                 
-                event_data = event_check.data[0]
-                is_owner = event_data['created_by'] == user_id
-                is_admin = user_id in admin_ids
+                event_data = deleted_events[0]
                 event_title = event_data.get('event_title', 'กิจกรรม')
-                
-                print(f"[DELETE] Ownership: is_owner={is_owner}, is_admin={is_admin}, title={event_title}")
-                
-                if not (is_owner or is_admin):
-                    print(f"[DELETE] Access denied for user {user_id}")
-                    safe_reply(reply_token, [TextMessage(text="❌ คุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
-                    return
-                
-                # Delete the event
-                delete_result = supabase_client.table('events').delete().eq('id', event_id).execute()
-                print(f"[DELETE] Delete result: {delete_result}")
-                
-                # Verify deletion was successful
-                verify_result = supabase_client.table('events').select('id').eq('id', event_id).execute()
-                print(f"[DELETE] Verification check: {verify_result}")
-                
-                if verify_result.data:
-                    # Still exists - deletion failed
-                    print(f"[DELETE] ❌ Deletion failed - record still exists")
-                    safe_reply(reply_token, [TextMessage(
-                        text=f"❌ **ไม่สามารถลบได้**\n\n📝 {event_title}\n🆔 ID: {event_id}\n\n⚠️ เกิดข้อผิดพลาดในฐานข้อมูล",
-                        quick_reply=create_main_menu()
-                    )])
-                else:
-                    # Successfully deleted
-                    print(f"[DELETE] ✅ Deletion successful - record removed")
-                    admin_note = " (Admin)" if is_admin and not is_owner else ""
-                    safe_reply(reply_token, [TextMessage(
-                        text=f"🗑️ **ลบกิจกรรมเรียบร้อย!**{admin_note}\n\n📝 {event_title}\n🆔 ID: {event_id}\n✅ ลบออกจากระบบแล้ว",
-                        quick_reply=create_main_menu()
-                    )])
+                print(f"[DELETE] ✅ Deletion successful - record removed")
+                reminder_index.cancel(event_id)
+                render_cache.invalidate('event', event_id)
+                calendar_feeds.invalidate(event_data.get('created_by'))
+                admin_note = " (Admin)" if event_data.get('created_by') != user_id else ""
+                safe_reply(reply_token, [TextMessage(
+                    text=f"🗑️ **ลบกิจกรรมเรียบร้อย!**{admin_note}\n\n📝 {event_title}\n🆔 ID: {event_id}\n✅ ลบออกจากระบบแล้ว",
+                    quick_reply=create_main_menu()
+                )])
             except Exception as e:
                 print(f"[ERROR] Confirm delete error: {e}")
                 traceback.print_exc()
@@ -1826,6 +3376,8 @@ def handle_message(event):
 # ===== POSTBACK HANDLER =====
 
 @handler.add(PostbackEvent)
+@show_loading_when_slow('postback')
+@one_event_per_user
 def handle_postback(event):
     """🎮 100% WORKING POSTBACK HANDLER WITH RATE LIMITING"""
     try:
@@ -1847,9 +3399,8 @@ def handle_postback(event):
         if data.startswith('view_note_'):
             note_id = data.replace('view_note_', '')
             try:
-                note_response = supabase_client.table('contacts').select('*').eq('id', note_id).execute()
-                if note_response.data:
-                    note = note_response.data[0]
+                note = notes_repo.get(note_id)
+                if note:
                     title = note.get('name', 'ไม่มีชื่อ')
                     content = note.get('phone_number', 'ไม่มีเนื้อหา')
                     
@@ -1876,9 +3427,10 @@ def handle_postback(event):
         elif data.startswith('delete_note_'):
             note_id = data.replace('delete_note_', '')
             try:
-                # Delete the note
-                delete_response = supabase_client.table('contacts').delete().eq('id', note_id).execute()
-                if delete_response.data:
+                # Delete the note (owner or admin only)
+                deleted_notes = notes_repo.delete_owned(note_id, user_id, user_id in admin_ids)
+                if deleted_notes:
+                    render_cache.invalidate('note', note_id)
                     safe_reply(reply_token, [TextMessage(
                         text="✅ **ลบโน๊ตเรียบร้อย!**",
                         quick_reply=create_main_menu()
@@ -1902,22 +3454,23 @@ def handle_postback(event):
                 stored_notes = user_state.get("notes_search_results", [])
                 
                 if stored_notes:
-                    flex_message = create_notes_carousel_flex(stored_notes, page=page, search_query=search_query)
+                    flex_message = create_notes_carousel_flex(stored_notes, page=page, search_query=search_query, user_id=user_id)
                     safe_reply(reply_token, [flex_message])
+                    prefetch_next_page('notes', stored_notes, user_id, page, search_query)
                 else:
                     # If no stored results, perform new search
                     if search_query:
-                        notes_response = supabase_client.table('contacts').select('*').eq('created_by', user_id).or_(f'name.ilike.%{search_query}%,phone_number.ilike.%{search_query}%').order('created_at', desc=True).execute()
-                        notes = notes_response.data if notes_response.data else []
+                        notes = notes_repo.search(user_id, search_query)
                         
                         if notes:
-                            flex_message = create_notes_carousel_flex(notes, page=page, search_query=search_query)
+                            flex_message = create_notes_carousel_flex(notes, page=page, search_query=search_query, user_id=user_id)
                             # Update stored results
                             user_states[user_id] = {
                                 "notes_search_results": notes,
                                 "notes_search_query": search_query
                             }
                             safe_reply(reply_token, [flex_message])
+                            prefetch_next_page('notes', notes, user_id, page, search_query)
                         else:
                             safe_reply(reply_token, [TextMessage(text="❌ ไม่พบโน๊ต", quick_reply=create_main_menu())])
                     else:
@@ -1927,6 +3480,15 @@ def handle_postback(event):
                 safe_reply(reply_token, [TextMessage(text="❌ เกิดข้อผิดพลาด", quick_reply=create_main_menu())])
             return
             
+        elif data.startswith('archive_page_'):
+            try:
+                page = max(int(data.replace('archive_page_', '')), 1)
+                safe_reply(reply_token, [create_archive_page_message(user_id, page=page)])
+            except Exception as e:
+                print(f"[ERROR] Archive pagination error: {e}")
+                safe_reply(reply_token, [TextMessage(text="❌ เกิดข้อผิดพลาด", quick_reply=create_main_menu())])
+            return
+            
         elif data.startswith('events_page_'):
             # Handle pagination for events search results
             try:
@@ -1948,26 +3510,21 @@ def handle_postback(event):
                         context_type=context_type
                     )
                     safe_reply(reply_token, [flex_message])
+                    prefetch_next_page('events', stored_events, user_id, page, search_query, context_type)
                 else:
                     # If no stored results, perform new search based on context
                     events = []
                     if context_type == "all":
                         # Get all events
-                        if user_id in admin_ids:
-                            events_response = supabase_client.table('events').select('*').order('event_date', desc=False).execute()
-                        else:
-                            events_response = supabase_client.table('events').select('*').eq('created_by', user_id).order('event_date', desc=False).execute()
-                        events = events_response.data if events_response.data else []
+                        events = events_repo.list_visible(user_id, user_id in admin_ids)
                     
                     elif context_type == "search" and search_query:
                         # Search events
-                        events_response = supabase_client.table('events').select('*').eq('created_by', user_id).or_(f'event_title.ilike.%{search_query}%,event_description.ilike.%{search_query}%').order('event_date', desc=False).execute()
-                        events = events_response.data if events_response.data else []
+                        events = events_repo.search(user_id, search_query)
                     
                     elif context_type == "date" and search_query:
                         # Date-based search
-                        events_response = supabase_client.table('events').select('*').eq('created_by', user_id).eq('event_date', search_query).order('event_date', desc=False).execute()
-                        events = events_response.data if events_response.data else []
+                        events = events_repo.list_on_date(user_id, search_query)
                     
                     if events:
                         flex_message = create_beautiful_flex_message_working(
@@ -1984,6 +3541,7 @@ def handle_postback(event):
                             "events_search_query": search_query
                         }
                         safe_reply(reply_token, [flex_message])
+                        prefetch_next_page('events', events, user_id, page, search_query, context_type)
                     else:
                         safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม", quick_reply=create_main_menu())])
             except Exception as e:
@@ -1994,71 +3552,36 @@ def handle_postback(event):
         if data.startswith('complete_'):
             event_id = data.replace('complete_', '')
             
-            # Check ownership or admin status
-            event_check = supabase_client.table('events').select('created_by, event_title').eq('id', event_id).execute()
-            if not event_check.data:
-                safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรมที่ต้องการ", quick_reply=create_main_menu())])
+            # Move to the archive filtered by ownership (owner or admin) - one round-trip answers "existed" and "allowed"
+            archived_events = events_repo.complete_owned(event_id, user_id, user_id in admin_ids)
+            if not archived_events:
+                safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
                 return
             
-            is_owner = event_check.data[0]['created_by'] == user_id
-            is_admin = user_id in admin_ids
-            
-            if not (is_owner or is_admin):
-                safe_reply(reply_token, [TextMessage(text="❌ คุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
-                return
-            
-            # Delete event
-            delete_result = supabase_client.table('events').delete().eq('id', event_id).execute()
-            print(f"[COMPLETE] Delete result: {delete_result}")
-            
-            # Verify deletion was successful
-            verify_result = supabase_client.table('events').select('id').eq('id', event_id).execute()
-            print(f"[COMPLETE] Verification check: {verify_result}")
-            
-            event_title = event_check.data[0].get('event_title', 'กิจกรรม')
-            admin_note = " (Admin)" if is_admin and not is_owner else ""
-            
-            if verify_result.data:
-                # Still exists - deletion failed
-                print(f"[COMPLETE] ❌ Deletion failed - record still exists")
-                safe_reply(reply_token, [TextMessage(
-                    text=f"❌ **ไม่สามารถทำเสร็จได้**\n\n📝 {event_title}\n🆔 ID: {event_id}\n\n⚠️ เกิดข้อผิดพลาดในฐานข้อมูล",
-                    quick_reply=create_main_menu()
-                )])
-            else:
-                # Successfully deleted
-                print(f"[COMPLETE] ✅ Deletion successful - record removed")
-                safe_reply(reply_token, [TextMessage(
-                    text=f"✅ **เสร็จแล้ว!** 🎉{admin_note}\n\n📝 {event_title}\n🆔 ID: {event_id}\n\n✨ ลบออกจากรายการแล้ว",
-                    quick_reply=create_main_menu()
-                )])
+            print(f"[COMPLETE] ✅ Event archived")
+            reminder_index.cancel(event_id)
+            render_cache.invalidate('event', event_id)
+            calendar_feeds.invalidate(archived_events[0].get('created_by'))
+            event_title = archived_events[0].get('event_title', 'กิจกรรม')
+            admin_note = " (Admin)" if archived_events[0].get('created_by') != user_id else ""
+            safe_reply(reply_token, [TextMessage(
+                text=f"✅ **เสร็จแล้ว!** 🎉{admin_note}\n\n📝 {event_title}\n🆔 ID: {event_id}\n\n🗄️ ย้ายไปที่เก็บถาวรแล้ว",
+                quick_reply=create_archive_quick_reply()
+            )])
             
         elif data.startswith('edit_') or data.startswith('admin_edit_'):
             if data.startswith('admin_edit_'):
                 event_id = data.replace('admin_edit_', '')
-                is_admin_edit = True
             else:
                 event_id = data.replace('edit_', '')
-                is_admin_edit = False
-            
-            # Check ownership or admin status
-            event_check = supabase_client.table('events').select('created_by').eq('id', event_id).execute()
-            if not event_check.data:
-                safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรมที่ต้องการ", quick_reply=create_main_menu())])
-                return
-            
-            is_owner = event_check.data[0]['created_by'] == user_id
-            is_admin = user_id in admin_ids
             
-            if not (is_owner or is_admin):
-                safe_reply(reply_token, [TextMessage(text="❌ คุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
+            # Check ownership or admin status in the same query
+            event_check = events_repo.get_owned(event_id, user_id, user_id in admin_ids, columns='id')
+            if not event_check:
+                safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
                 return
             
             # Admin can edit all events (updated policy)
-            # if is_admin_edit and not is_owner:
-            #     safe_reply(reply_token, [TextMessage(text="❌ Admin สามารถลบได้ แต่แก้ไขได้เฉพาะเจ้าของ", quick_reply=create_main_menu())])
-            #     return
-            
             # Start edit flow
             user_states[user_id] = {"step": "edit_event_title", "event_id": event_id}
             safe_reply(reply_token, [TextMessage(text=f"✏️ **แก้ไขกิจกรรม ID: {event_id}**\n\nพิมพ์ชื่อกิจกรรมใหม่:", quick_reply=create_main_menu())])
@@ -2066,21 +3589,15 @@ def handle_postback(event):
         elif data.startswith('delete_'):
             event_id = data.replace('delete_', '')
             
-            # Check ownership or admin status
-            event_check = supabase_client.table('events').select('created_by, event_title').eq('id', event_id).execute()
-            if not event_check.data:
-                safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรมที่ต้องการ", quick_reply=create_main_menu())])
-                return
-            
-            is_owner = event_check.data[0]['created_by'] == user_id
-            is_admin = user_id in admin_ids
-            event_title = event_check.data[0].get('event_title', 'กิจกรรม')
-            
-            if not (is_owner or is_admin):
-                safe_reply(reply_token, [TextMessage(text="❌ คุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
+            # Check ownership or admin status in the same query
+            event_check = events_repo.get_owned(event_id, user_id, user_id in admin_ids, columns='created_by, event_title')
+            if not event_check:
+                safe_reply(reply_token, [TextMessage(text="❌ ไม่พบกิจกรรม หรือคุณสามารถจัดการได้เฉพาะกิจกรรมของคุณเอง", quick_reply=create_main_menu())])
                 return
             
-            admin_note = " (Admin Delete)" if is_admin and not is_owner else ""
+            is_owner = event_check['created_by'] == user_id
+            event_title = event_check.get('event_title', 'กิจกรรม')
+            admin_note = " (Admin Delete)" if not is_owner else ""
             
             # Create Quick Reply for delete confirmation  
             quick_reply = QuickReply(items=[
@@ -2113,12 +3630,29 @@ app_handler = vercel_handler
 def application(environ, start_response):
     return app(environ, start_response)
 
-# Start notification system when app starts
+# Preload known subscribers so tracking answers from memory
 try:
-    start_notification_system()
-    logger.info("[INIT] 🔔 Notification system initialized")
+    load_known_subscribers()
 except Exception as e:
-    logger.error(f"[INIT] ⚠️ Notification system failed to start: {e}")
+    logger.error(f"[INIT] ⚠️ Subscriber preload failed: {e}")
+
+# Warm the read replicas before serving (inherited by workers with --preload)
+for replica in (events_replica, notes_replica):
+    if replica is not None:
+        try:
+            replica.load()
+        except Exception as e:
+            logger.error(f"[INIT] ⚠️ Replica load failed for {replica.name} (reads use the database): {e}")
+
+# Start notification system when app starts. Under gunicorn (--preload imports
+# this module in the master) the election must run in the worker, not before
+# the fork: gunicorn.conf.py starts it from post_fork.
+if 'gunicorn' not in sys.modules:
+    try:
+        start_notification_system()
+        logger.info("[INIT] 🔔 Notification system initialized")
+    except Exception as e:
+        logger.error(f"[INIT] ⚠️ Notification system failed to start: {e}")
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 10000))
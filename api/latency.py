@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+⏳ LATENCY WATCHDOG - act on operations that run past a latency threshold
+
+Handlers register an operation with watch(); one background thread holds the
+deadlines in a min-heap. Operations that finish before the threshold are just
+removed - nothing else happens on the fast path. Operations still running at
+their deadline trigger on_slow(label, context) once (the bot uses this to show
+the LINE loading animation while a slow search or admin view is running).
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyWatchdog:
+    """Deadline heap + one timer thread shared by all watched operations"""
+
+    def __init__(self, threshold_seconds, on_slow, name='latency-watchdog'):
+        self.threshold_seconds = threshold_seconds
+        self.on_slow = on_slow
+        self.name = name
+        self._heap = []  # (deadline, seq)
+        self._active = {}  # seq -> (label, context)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self.watched = 0
+        self.fired = 0
+        self.failed = 0
+        self.fired_by_label = {}
+
+    def _ensure_running(self):
+        # Lazily per process - gunicorn --preload forks after import
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    @contextmanager
+    def watch(self, label, context):
+        """Run the with-block; call on_slow(label, context) if it is still running after the threshold"""
+        seq = next(self._seq)
+        with self._cond:
+            self._ensure_running()
+            self._active[seq] = (label, context)
+            heapq.heappush(self._heap, (time.monotonic() + self.threshold_seconds, seq))
+            self.watched += 1
+            self._cond.notify()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active.pop(seq, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    # Finished operations are dropped lazily when they reach the top
+                    while self._heap and self._heap[0][1] not in self._active:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                _deadline, seq = heapq.heappop(self._heap)
+                label, context = self._active[seq]
+            # The callback may do network I/O - keep it off the timer thread
+            threading.Thread(target=self._fire, args=(seq, label, context), name=f'{self.name}-fire', daemon=True).start()
+
+    def _fire(self, seq, label, context):
+        with self._cond:
+            if seq not in self._active:
+                return  # Finished while the thread was starting
+            self.fired += 1
+            self.fired_by_label[label] = self.fired_by_label.get(label, 0) + 1
+        try:
+            self.on_slow(label, context)
+        except Exception as e:
+            with self._cond:
+                self.failed += 1
+            logger.warning(f"[LATENCY] ⚠️ Slow-operation callback failed for {label}: {e}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                'threshold_ms': int(self.threshold_seconds * 1000),
+                'watched': self.watched,
+                'fired': self.fired,
+                'fired_rate': round(self.fired / self.watched, 3) if self.watched else None,
+                'fired_by_label': dict(self.fired_by_label),
+                'failed': self.failed,
+                'in_flight': len(self._active)
+            }
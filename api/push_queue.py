@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+📮 PUSH QUEUE - durable local queue for outbound LINE pushes
+
+Reminder pushes are written to a small SQLite file before anything is sent,
+so a restart in the middle of a notification pass or a retry sequence loses
+nothing: the next process picks the jobs up again (at-least-once delivery).
+
+- enqueue() is idempotent per idempotency_key; every job also carries a
+  retry key (UUID) that the sender passes to LINE as X-Line-Retry-Key, so a
+  push that did go out before a crash is not delivered twice.
+- One worker thread per process claims due jobs with a lease; a job whose
+  lease ran out (worker died mid-send) is picked up again.
+- Failures are retried with exponential back-off + jitter; after
+  max_attempts, or on a PermanentPushError, the job moves to the dead-letter
+  table, from where replay() puts it back in the queue.
+- Per-kind callbacks (register()) run after a job is sent or dead-lettered -
+  the bot logs the notification / releases the reminder claim there.
+
+Request threads only ever do the local insert; sending and back-off sleeps
+happen on the worker thread.
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+create table if not exists push_jobs (
+    id integer primary key autoincrement,
+    idempotency_key text not null unique,
+    retry_key text not null,
+    kind text not null,
+    user_id text not null,
+    message text not null,
+    meta text,
+    status text not null default 'pending',
+    attempts integer not null default 0,
+    next_attempt_at real not null,
+    lease_until real,
+    last_error text,
+    created_at real not null,
+    sent_at real
+);
+create index if not exists push_jobs_due on push_jobs (status, next_attempt_at);
+
+create table if not exists push_dead_letters (
+    id integer primary key,
+    idempotency_key text not null unique,
+    retry_key text not null,
+    kind text not null,
+    user_id text not null,
+    message text not null,
+    meta text,
+    attempts integer not null,
+    last_error text,
+    created_at real not null,
+    died_at real not null
+);
+"""
+
+JOB_COLUMNS = 'id, idempotency_key, retry_key, kind, user_id, message, meta, attempts'
+
+
+class PermanentPushError(Exception):
+    """The push can never succeed as-is (e.g. rejected by LINE) - dead-letter it without retrying"""
+
+
+class PushQueue:
+    """SQLite-backed outbound push queue with retries, back-off and dead letters"""
+
+    def __init__(self, path, deliver, max_attempts=8, backoff_base_seconds=5.0, backoff_max_seconds=1800.0,
+                 lease_seconds=60.0, batch_size=20, poll_seconds=5.0, keep_sent_hours=48):
+        self.path = path
+        self.deliver = deliver  # deliver(job) -> None, raises on failure
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.keep_sent_hours = keep_sent_hours  # Sent rows keep their idempotency key this long
+        self._handlers = {}  # kind -> (on_sent, on_dead)
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._last_purge = 0.0
+        self.enqueued = 0
+        self.duplicates = 0
+        self.delivered = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.replayed = 0
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+        logger.info(f"[PUSH QUEUE] ✅ Queue ready at {path}")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('pragma journal_mode=wal')
+            conn.execute('pragma synchronous=full')  # An acknowledged enqueue survives a power cut
+            conn.execute('pragma busy_timeout=5000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def register(self, kind, on_sent=None, on_dead=None):
+        """Callbacks for one job kind: on_sent(job) after delivery, on_dead(job) when dead-lettered"""
+        self._handlers[kind] = (on_sent, on_dead)
+
+    # ----- producer side -----
+
+    def enqueue(self, idempotency_key, kind, user_id, message, meta=None):
+        """Queue one push; returns False if a job with this key is already queued, sent or dead"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('begin immediate')
+        try:
+            dead = conn.execute('select 1 from push_dead_letters where idempotency_key = ?', (idempotency_key,)).fetchone()
+            cursor = None if dead else conn.execute(
+                'insert or ignore into push_jobs (idempotency_key, retry_key, kind, user_id, message, meta, next_attempt_at, created_at) '
+                'values (?, ?, ?, ?, ?, ?, ?, ?)',
+                (idempotency_key, str(uuid.uuid4()), kind, user_id, message,
+                 json.dumps(meta, ensure_ascii=False) if meta is not None else None, now, now)
+            )
+            conn.execute('commit')
+        except Exception:
+            conn.execute('rollback')
+            raise
+        inserted = cursor is not None and cursor.rowcount == 1
+        with self._cond:
+            if inserted:
+                self.enqueued += 1
+            else:
+                self.duplicates += 1
+            self._ensure_running()
+            self._cond.notify()
+        return inserted
+
+    def start(self):
+        """Start the worker (also picks up jobs left behind by a previous process)"""
+        with self._cond:
+            self._ensure_running()
+
+    def _ensure_running(self):
+        # Lazily per process - gunicorn --preload forks after import
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='push-queue', daemon=True)
+            self._thread.start()
+
+    # ----- worker side -----
+
+    def _run(self):
+        while True:
+            try:
+                jobs = self._claim_due()
+                for job in jobs:
+                    self._attempt(job)
+                self._purge_sent()
+                if jobs:
+                    continue
+                wait = self._seconds_until_next_due()
+            except Exception as e:
+                logger.error(f"[PUSH QUEUE] ❌ Worker error: {e}")
+                wait = self.poll_seconds
+            with self._cond:
+                self._cond.wait(wait)
+
+    def _claim_due(self):
+        """Lease a batch of due jobs (and jobs whose lease ran out) to this worker"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('begin immediate')
+        try:
+            rows = conn.execute(
+                f"select {JOB_COLUMNS} from push_jobs "
+                "where (status = 'pending' and next_attempt_at <= ?) or (status = 'inflight' and lease_until < ?) "
+                "order by next_attempt_at limit ?",
+                (now, now, self.batch_size)
+            ).fetchall()
+            lease_until = now + self.lease_seconds
+            if rows:
+                conn.executemany(
+                    "update push_jobs set status = 'inflight', lease_until = ? where id = ?",
+                    [(lease_until, row['id']) for row in rows]
+                )
+            conn.execute('commit')
+        except Exception:
+            conn.execute('rollback')
+            raise
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['meta'] = json.loads(job['meta']) if job['meta'] else None
+            job['lease_until'] = lease_until  # Every update below only applies while this lease holds
+            jobs.append(job)
+        return jobs
+
+    def _attempt(self, job):
+        attempts = job['attempts'] + 1
+        try:
+            self.deliver(job)
+        except PermanentPushError as e:
+            self._dead_letter(job, attempts, str(e))
+            return
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                self._dead_letter(job, attempts, str(e))
+            else:
+                delay = self.backoff_delay(attempts)
+                cursor = self._connection().execute(
+                    "update push_jobs set status = 'pending', attempts = ?, next_attempt_at = ?, lease_until = null, last_error = ? "
+                    "where id = ? and lease_until = ?",
+                    (attempts, time.time() + delay, str(e)[:500], job['id'], job['lease_until'])
+                )
+                if cursor.rowcount != 1:
+                    self._lease_lost(job)
+                    return
+                with self._cond:
+                    self.retried += 1
+                logger.warning(f"[PUSH QUEUE] ⚠️ Push {job['idempotency_key']} failed (attempt {attempts}/{self.max_attempts}), "
+                               f"retrying in {delay:.0f}s: {e}")
+            return
+
+        cursor = self._connection().execute(
+            "update push_jobs set status = 'sent', attempts = ?, sent_at = ?, lease_until = null, last_error = null "
+            "where id = ? and lease_until = ?",
+            (attempts, time.time(), job['id'], job['lease_until'])
+        )
+        if cursor.rowcount != 1:
+            # The lease ran out mid-send and another worker took the job over: it owns the outcome
+            self._lease_lost(job)
+            return
+        with self._cond:
+            self.delivered += 1
+        self._callback(job, 0)
+
+    def backoff_delay(self, attempts):
+        """Exponential back-off with full jitter over the upper half"""
+        delay = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** (attempts - 1)))
+        return delay / 2 + random.random() * delay / 2
+
+    def _dead_letter(self, job, attempts, error):
+        conn = self._connection()
+        conn.execute('begin immediate')
+        try:
+            deleted = conn.execute(
+                'insert or replace into push_dead_letters '
+                '(id, idempotency_key, retry_key, kind, user_id, message, meta, attempts, last_error, created_at, died_at) '
+                'select id, idempotency_key, retry_key, kind, user_id, message, meta, ?, ?, created_at, ? from push_jobs '
+                'where id = ? and lease_until = ?',
+                (attempts, error[:500], time.time(), job['id'], job['lease_until'])
+            ).rowcount == 1
+            if deleted:
+                conn.execute('delete from push_jobs where id = ?', (job['id'],))
+            conn.execute('commit')
+        except Exception:
+            conn.execute('rollback')
+            raise
+        if not deleted:
+            self._lease_lost(job)
+            return
+        with self._cond:
+            self.dead_lettered += 1
+        logger.error(f"[PUSH QUEUE] ☠️ Push {job['idempotency_key']} dead-lettered after {attempts} attempts: {error}")
+        self._callback(job, 1)
+
+    def _lease_lost(self, job):
+        logger.warning(f"[PUSH QUEUE] ⚠️ Lease on {job['idempotency_key']} expired mid-attempt; "
+                       f"leaving the job to the worker that took it over")
+
+    def _callback(self, job, which):
+        callback = self._handlers.get(job['kind'], (None, None))[which]
+        if callback is None:
+            return
+        try:
+            callback(job)
+        except Exception as e:
+            logger.warning(f"[PUSH QUEUE] ⚠️ Callback for {job['idempotency_key']} failed: {e}")
+
+    def _seconds_until_next_due(self):
+        row = self._connection().execute(
+            "select min(case when status = 'pending' then next_attempt_at else lease_until end) as due "
+            "from push_jobs where status in ('pending', 'inflight')"
+        ).fetchone()
+        if row['due'] is None:
+            return self.poll_seconds * 12  # Idle; enqueue() wakes the worker
+        return min(self.poll_seconds * 12, max(0.05, row['due'] - time.time()))
+
+    def _purge_sent(self):
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        self._connection().execute(
+            "delete from push_jobs where status = 'sent' and sent_at < ?", (now - self.keep_sent_hours * 3600,)
+        )
+
+    # ----- admin -----
+
+    def dead_letters(self, limit=50):
+        rows = self._connection().execute(
+            'select id, idempotency_key, kind, user_id, attempts, last_error, created_at, died_at '
+            'from push_dead_letters order by died_at desc limit ?', (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def replay(self, ids=None):
+        """Move dead letters (all, or the given ids) back into the queue with a fresh attempt budget.
+
+        The original retry key is kept, so a push LINE did accept is not delivered twice.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute('begin immediate')
+        try:
+            where, params = ('', ()) if ids is None else (
+                f"where id in ({','.join('?' * len(ids))})", tuple(int(i) for i in ids)
+            )
+            rows = conn.execute(f'select id, idempotency_key from push_dead_letters {where}', params).fetchall()
+            for row in rows:
+                # A sent row with the same key can only be an expired duplicate - the dead letter wins
+                conn.execute('delete from push_jobs where idempotency_key = ?', (row['idempotency_key'],))
+                conn.execute(
+                    'insert into push_jobs (idempotency_key, retry_key, kind, user_id, message, meta, next_attempt_at, created_at) '
+                    'select idempotency_key, retry_key, kind, user_id, message, meta, ?, created_at from push_dead_letters where id = ?',
+                    (now, row['id'])
+                )
+                conn.execute('delete from push_dead_letters where id = ?', (row['id'],))
+            conn.execute('commit')
+        except Exception:
+            conn.execute('rollback')
+            raise
+        with self._cond:
+            self.replayed += len(rows)
+            if rows:
+                self._ensure_running()
+                self._cond.notify()
+        logger.info(f"[PUSH QUEUE] 🔁 Replayed {len(rows)} dead letters")
+        return [row['idempotency_key'] for row in rows]
+
+    def stats(self):
+        conn = self._connection()
+        counts = {row['status']: row['n'] for row in conn.execute('select status, count(*) as n from push_jobs group by status')}
+        oldest = conn.execute("select min(created_at) as oldest from push_jobs where status in ('pending', 'inflight')").fetchone()
+        dead = conn.execute('select count(*) as n from push_dead_letters').fetchone()
+        with self._cond:
+            return {
+                'pending': counts.get('pending', 0),
+                'inflight': counts.get('inflight', 0),
+                'sent_retained': counts.get('sent', 0),
+                'dead_letters': dead['n'],
+                'oldest_pending_seconds': round(time.time() - oldest['oldest'], 1) if oldest['oldest'] else None,
+                'enqueued': self.enqueued,
+                'duplicates': self.duplicates,
+                'delivered': self.delivered,
+                'retried': self.retried,
+                'dead_lettered': self.dead_lettered,
+                'replayed': self.replayed,
+                'worker_running': bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+            }
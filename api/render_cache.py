@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+🖼️ RENDER CACHE - rendered Flex carousels keyed by result fingerprint and page
+
+Paging back and forth through events_page_N_* / notes_page_N_* shows the same
+result set again and again. Each rendered page is kept here as serialized Flex
+JSON under (kind, viewer, fingerprint, page, context, is_admin, query), so a
+repeated page view skips building and re-validating the carousel.
+
+The fingerprint covers every render-relevant field of the whole result set,
+so any edit produces a new key by itself; invalidate() additionally drops
+every cached page that contains a changed/deleted item right away.
+
+CarouselPrefetcher renders page N+1 in the background right after page N is
+shown, so the usual next tap ("ถัดไป ▶") is answered from the cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Row fields that end up in the rendered bubbles
+EVENT_RENDER_FIELDS = ('id', 'event_title', 'event_description', 'event_date', 'created_by')
+NOTE_RENDER_FIELDS = ('id', 'name', 'content_preview', 'phone_number')
+
+
+def result_fingerprint(rows, fields):
+    """Stable hash of the render-relevant fields of a result set (order matters)"""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(json.dumps([row.get(field) for field in fields], ensure_ascii=False, default=str).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """LRU of rendered carousels with an item -> keys index for invalidation"""
+
+    def __init__(self, max_entries=256, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (alt_text, flex_json, items, stored_at)
+        self._prefetched = set()  # keys stored by the prefetcher and not yet shown
+        self._by_item = {}  # (kind, id) -> set(keys)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.prefetch_stored = 0
+        self.prefetch_hits = 0
+        self.prefetch_wasted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """(alt_text, flex_json) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[3] > self.ttl_seconds:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if key in self._prefetched:
+                self._prefetched.discard(key)
+                self.prefetch_hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, alt_text, flex_json, items, prefetched=False):
+        """Store a rendered page; items are the (kind, id) pairs of the whole result set"""
+        items = frozenset(items)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (alt_text, flex_json, items, time.monotonic())
+            if prefetched:
+                self._prefetched.add(key)
+                self.prefetch_stored += 1
+            for item in items:
+                self._by_item.setdefault(item, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, kind, item_id):
+        """Drop every cached page whose result set contains this item"""
+        with self._lock:
+            keys = self._by_item.pop((kind, str(item_id)), set())
+            for key in list(keys):
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_item.clear()
+            self._prefetched.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if key in self._prefetched:
+            self._prefetched.discard(key)
+            self.prefetch_wasted += 1
+        for item in entry[2]:
+            keys = self._by_item.get(item)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_item[item]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'json_chars': sum(len(entry[1]) for entry in self._entries.values()),
+                'prefetch': {
+                    'stored': self.prefetch_stored,
+                    'hits': self.prefetch_hits,
+                    'wasted': self.prefetch_wasted,
+                    'hit_rate': round(self.prefetch_hits / self.prefetch_stored, 3) if self.prefetch_stored else None
+                }
+            }
+
+
+class CarouselPrefetcher:
+    """Capped background renderer for the next carousel page.
+
+    At most max_pending prefetches are queued or running; when the cap is hit
+    new prefetches are dropped instead of queued, so prefetching never piles
+    up behind real requests. The worker pool is created lazily per process
+    (gunicorn --preload forks after import).
+    """
+
+    def __init__(self, max_workers=2, max_pending=8):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.skipped_busy = 0
+        self.skipped_duplicate = 0
+        self.failed = 0
+
+    def _pool(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='carousel-prefetch')
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, key, task):
+        """Run task() in the background unless the same key is pending or the cap is reached"""
+        with self._lock:
+            if key in self._pending:
+                self.skipped_duplicate += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.skipped_busy += 1
+                return False
+            self._pending.add(key)
+            self.submitted += 1
+            pool = self._pool()
+        try:
+            pool.submit(self._run, key, task)
+        except RuntimeError:  # interpreter shutting down
+            with self._lock:
+                self._pending.discard(key)
+            return False
+        return True
+
+    def _run(self, key, task):
+        try:
+            task()
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.warning(f"[PREFETCH] ⚠️ Prefetch failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': len(self._pending),
+                'submitted': self.submitted,
+                'skipped_busy': self.skipped_busy,
+                'skipped_duplicate': self.skipped_duplicate,
+                'failed': self.failed
+            }
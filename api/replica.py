@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+🪞 READ REPLICA - warm in-process copies of `events` and `contacts`
+
+Loaded once at boot, then kept current by polling the updated_at watermark
+(see supabase/migrations/*_updated_at_watermark.sql) with a periodic id
+reconcile to catch deletes made by other workers. Writes made through this
+process patch the replica immediately.
+
+ReplicatedEventsRepo / ReplicatedNotesRepo wrap the normal repositories:
+reads are answered from memory while the replica is fresh (last successful
+sync within max_staleness seconds) and fall through to the database
+otherwise; writes always go to the database first.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:
+    from api.repository import (
+        EVENT_LIST_COLUMNS, EVENT_REMINDER_COLUMNS, NOTE_LIST_COLUMNS, NOTE_DETAIL_COLUMNS
+    )
+except ImportError:
+    from repository import (
+        EVENT_LIST_COLUMNS, EVENT_REMINDER_COLUMNS, NOTE_LIST_COLUMNS, NOTE_DETAIL_COLUMNS
+    )
+
+logger = logging.getLogger(__name__)
+
+
+def parse_columns(columns):
+    return [name.strip() for name in columns.split(',') if name.strip()]
+
+
+def project(row, columns):
+    """Copy of the row with only the selected columns (like a PostgREST select)"""
+    names = parse_columns(columns)
+    if names == ['*']:
+        return dict(row)
+    return {name: row.get(name) for name in names}
+
+
+def contains(value, term):
+    """ilike '%term%' equivalent"""
+    return term.casefold() in (value or '').casefold()
+
+
+def date_key(value):
+    """Index key for a date column: 'YYYY-MM-DD' whether the row holds a date or a timestamp"""
+    return str(value)[:10] if value is not None else None
+
+
+def sort_id(row):
+    try:
+        return int(row.get('id'))
+    except (TypeError, ValueError):
+        return 0
+
+
+class TableReplica:
+    """In-memory copy of one table with secondary indexes.
+
+    rows: id (str) -> full row; indexes: field -> value -> set of ids.
+    """
+
+    def __init__(self, name, repo, index_fields, poll_seconds=5, reconcile_seconds=60,
+                 max_staleness=30, page_size=1000, overlap_seconds=5, index_keys=None):
+        self.name = name
+        self.repo = repo
+        self.index_fields = index_fields
+        self.index_keys = index_keys or {}  # field -> key function applied to stored and looked-up values
+        self.poll_seconds = poll_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.max_staleness = max_staleness
+        self.page_size = page_size
+        self.overlap_seconds = overlap_seconds
+
+        self._lock = threading.RLock()
+        self.rows = {}
+        self.indexes = {field: {} for field in index_fields}
+        self._touched = {}  # id -> time of last upsert (protects fresh rows from reconcile)
+        self._tombstones = {}  # id -> time of local delete (ignores stale poll results)
+        self.watermark = None
+        self.loaded = False
+        self.last_sync = 0.0
+        self.last_reconcile = 0.0
+        self.hits = 0
+        self.fallbacks = 0
+        self.sync_errors = 0
+
+        self._thread = None
+        self._thread_pid = None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ----- local mutations -----
+
+    def _index_value(self, field, value):
+        key_function = self.index_keys.get(field)
+        return key_function(value) if key_function else value
+
+    def _index_add(self, key, row):
+        for field in self.index_fields:
+            self.indexes[field].setdefault(self._index_value(field, row.get(field)), set()).add(key)
+
+    def _index_remove(self, key, row):
+        for field in self.index_fields:
+            value = self._index_value(field, row.get(field))
+            bucket = self.indexes[field].get(value)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.indexes[field][value]
+
+    def upsert(self, row, from_poll=False):
+        key = str(row.get('id'))
+        with self._lock:
+            if from_poll and key in self._tombstones:
+                return
+            self._tombstones.pop(key, None)
+            current = self.rows.get(key)
+            if current is not None:
+                self._index_remove(key, current)
+                row = {**current, **row}
+            self.rows[key] = row
+            self._index_add(key, row)
+            self._touched[key] = time.time()
+
+    def patch(self, key, values):
+        """Update fields of a row we already hold (no-op if missing)"""
+        key = str(key)
+        with self._lock:
+            if key in self.rows:
+                self.upsert({**self.rows[key], **values})
+
+    def remove(self, key):
+        key = str(key)
+        with self._lock:
+            row = self.rows.pop(key, None)
+            if row is not None:
+                self._index_remove(key, row)
+            self._touched.pop(key, None)
+            self._tombstones[key] = time.time()
+
+    # ----- sync -----
+
+    def load(self):
+        """Full load in id order; sets the watermark to the newest updated_at"""
+        rows = {}
+        after_id = 0
+        while True:
+            page = self.repo.list_page_after_id(after_id, self.page_size)
+            for row in page:
+                rows[str(row['id'])] = row
+            if len(page) < self.page_size:
+                break
+            after_id = page[-1]['id']
+
+        with self._lock:
+            self.rows = {}
+            self.indexes = {field: {} for field in self.index_fields}
+            self._touched = {}
+            for key, row in rows.items():
+                self.rows[key] = row
+                self._index_add(key, row)
+            self.watermark = max((row.get('updated_at') or '' for row in rows.values()), default=None) or None
+            self.loaded = True
+            self.last_sync = self.last_reconcile = time.time()
+        logger.info(f"[REPLICA] ✅ {self.name}: loaded {len(rows)} rows")
+        return len(rows)
+
+    def _poll_since(self):
+        """Watermark minus an overlap so rows committed slightly out of order are not missed"""
+        if not self.watermark:
+            return '1970-01-01T00:00:00+00:00'
+        try:
+            moment = datetime.fromisoformat(self.watermark.replace('Z', '+00:00'))
+            return (moment - timedelta(seconds=self.overlap_seconds)).isoformat()
+        except ValueError:
+            return self.watermark
+
+    def poll(self):
+        """Apply rows changed since the watermark, paging on the (updated_at, id) keyset"""
+        since, after_id = self._poll_since(), None
+        changed = 0
+        while True:
+            page = self.repo.list_updated_since(since, self.page_size, after_id=after_id)
+            for row in page:
+                self.upsert(row, from_poll=True)
+            changed += len(page)
+            if page:
+                newest = page[-1].get('updated_at')
+                with self._lock:
+                    if newest and (not self.watermark or newest > self.watermark):
+                        self.watermark = newest
+            if len(page) < self.page_size or not page[-1].get('updated_at'):
+                break
+            # Continue after the last row, so a page sharing one timestamp (bulk write) still advances
+            since, after_id = page[-1]['updated_at'], page[-1]['id']
+        self.last_sync = time.time()
+        return changed
+
+    def reconcile(self):
+        """Drop rows deleted elsewhere (id scan only)"""
+        started = time.time()
+        remote_ids = set()
+        after_id = 0
+        while True:
+            page = self.repo.list_page_after_id(after_id, self.page_size, columns='id')
+            remote_ids.update(str(row['id']) for row in page)
+            if len(page) < self.page_size:
+                break
+            after_id = page[-1]['id']
+
+        removed = 0
+        with self._lock:
+            for key in list(self.rows):
+                if key not in remote_ids and self._touched.get(key, 0) < started:
+                    self.remove(key)
+                    removed += 1
+            # Tombstones only need to outlive in-flight polls
+            cutoff = started - self.reconcile_seconds
+            self._tombstones = {key: at for key, at in self._tombstones.items() if at >= cutoff}
+            self.last_reconcile = started
+        if removed:
+            logger.info(f"[REPLICA] 🧹 {self.name}: reconcile removed {removed} rows")
+        return removed
+
+    def is_fresh(self):
+        return self.loaded and time.time() - self.last_sync <= self.max_staleness
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                if not self.loaded:
+                    self.load()
+                    continue
+                self.poll()
+                if time.time() - self.last_reconcile >= self.reconcile_seconds:
+                    self.reconcile()
+            except Exception as e:
+                with self._lock:
+                    self.sync_errors += 1
+                logger.warning(f"[REPLICA] ⚠️ {self.name}: sync failed: {e}")
+
+    def ensure_running(self):
+        """Start the sync thread in this process (lazily - threads do not survive a preload fork)"""
+        if self._thread_pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f'replica-{self.name}', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def serve(self):
+        """True if reads may be answered locally right now"""
+        self.ensure_running()
+        fresh = self.is_fresh()
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.fallbacks += 1
+        return fresh
+
+    # ----- reads -----
+
+    def select(self, field=None, value=None):
+        """Rows matching an indexed field (or all rows)"""
+        with self._lock:
+            if field is None:
+                return list(self.rows.values())
+            return [self.rows[key] for key in self.indexes[field].get(self._index_value(field, value), ())]
+
+    def get(self, key):
+        with self._lock:
+            return self.rows.get(str(key))
+
+    def stats(self):
+        return {
+            'rows': len(self.rows),
+            'loaded': self.loaded,
+            'fresh': self.is_fresh(),
+            'staleness_seconds': round(time.time() - self.last_sync, 1) if self.loaded else None,
+            'watermark': self.watermark,
+            'hits': self.hits,
+            'fallbacks': self.fallbacks,
+            'sync_errors': self.sync_errors
+        }
+
+
+def event_order(row):
+    return (str(row.get('event_date') or ''), sort_id(row))
+
+
+class ReplicatedEventsRepo:
+    """EventsRepo with reads served from the replica; writes go through and patch it"""
+
+    def __init__(self, repo, replica):
+        self.repo = repo
+        self.replica = replica
+
+    def __getattr__(self, name):
+        return getattr(self.repo, name)
+
+    def _rows(self, rows, columns, limit=None):
+        rows = sorted(rows, key=event_order)
+        if limit:
+            rows = rows[:limit]
+        return [project(row, columns) for row in rows]
+
+    # ----- reads -----
+
+    def list_for_user(self, user_id, columns=EVENT_LIST_COLUMNS):
+        if not self.replica.serve():
+            return self.repo.list_for_user(user_id, columns)
+        return self._rows(self.replica.select('created_by', user_id), columns)
+
+    def list_all(self, columns=EVENT_LIST_COLUMNS):
+        if not self.replica.serve():
+            return self.repo.list_all(columns)
+        return self._rows(self.replica.select(), columns)
+
+    def list_visible(self, user_id, is_admin):
+        """Admins see every event, users only their own"""
+        return self.list_all() if is_admin else self.list_for_user(user_id)
+
+    def list_on_date(self, user_id, event_date):
+        if not self.replica.serve():
+            return self.repo.list_on_date(user_id, event_date)
+        rows = [row for row in self.replica.select('event_date', event_date) if row.get('created_by') == user_id]
+        return self._rows(rows, EVENT_LIST_COLUMNS)
+
+    def search(self, user_id, query, limit=None):
+        if not self.replica.serve():
+            return self.repo.search(user_id, query, limit)
+        rows = [row for row in self.replica.select('created_by', user_id)
+                if contains(row.get('event_title'), query) or contains(row.get('event_description'), query)]
+        return self._rows(rows, EVENT_LIST_COLUMNS, limit)
+
+    def get(self, event_id, columns='id, created_by, event_title'):
+        if not self.replica.serve():
+            return self.repo.get(event_id, columns)
+        row = self.replica.get(event_id)
+        return project(row, columns) if row else None
+
+    def get_many(self, event_ids, columns=EVENT_REMINDER_COLUMNS):
+        if not event_ids:
+            return []
+        if not self.replica.serve():
+            return self.repo.get_many(event_ids, columns)
+        return [project(row, columns) for row in (self.replica.get(i) for i in event_ids) if row]
+
+    def list_from_date(self, start_date, columns=EVENT_REMINDER_COLUMNS):
+        if not self.replica.serve():
+            return self.repo.list_from_date(start_date, columns)
+        start = str(start_date)
+        return self._rows([row for row in self.replica.select() if str(row.get('event_date')) >= start], columns)
+
+    def list_between(self, start_date, end_date, columns=EVENT_REMINDER_COLUMNS):
+        if not self.replica.serve():
+            return self.repo.list_between(start_date, end_date, columns)
+        start, end = str(start_date), str(end_date)
+        return self._rows([row for row in self.replica.select() if start <= str(row.get('event_date')) <= end], columns)
+
+    def list_after_cursor(self, cursor_date, cursor_id, last_date, limit, columns=EVENT_REMINDER_COLUMNS):
+        if not self.replica.serve():
+            return self.repo.list_after_cursor(cursor_date, cursor_id, last_date, limit, columns)
+        cursor = (str(cursor_date), int(cursor_id) if cursor_id is not None else float('inf'))
+        rows = [row for row in self.replica.select()
+                if not row.get('reminder_sent_at') and str(row.get('event_date')) <= str(last_date)
+                and event_order(row) > cursor]
+        return self._rows(rows, columns, limit)
+
+    def get_owned(self, event_id, user_id, is_admin, columns='id, created_by, event_title'):
+        if not self.replica.serve():
+            return self.repo.get_owned(event_id, user_id, is_admin, columns)
+        row = self.replica.get(event_id)
+        if not row or (not is_admin and row.get('created_by') != user_id):
+            return None
+        return project(row, columns)
+
+    # ----- writes (database first, then patch) -----
+
+    def insert(self, values):
+        rows = self.repo.insert(values)
+        for row in rows:
+            self.replica.upsert(row)
+        return rows
+
+    def insert_many(self, rows):
+        inserted = self.repo.insert_many(rows)
+        for row in inserted:
+            self.replica.upsert(row)
+        return inserted
+
+    def update_owned(self, event_id, user_id, is_admin, values):
+        rows = self.repo.update_owned(event_id, user_id, is_admin, values)
+        for row in rows:
+            self.replica.upsert(row)
+        return rows
+
+    def delete_owned(self, event_id, user_id, is_admin):
+        rows = self.repo.delete_owned(event_id, user_id, is_admin)
+        for row in rows:
+            self.replica.remove(row.get('id'))
+        return rows
+
+    def complete_owned(self, event_id, user_id, is_admin):
+        rows = self.repo.complete_owned(event_id, user_id, is_admin)
+        for row in rows:
+            self.replica.remove(row.get('id'))
+        return rows
+
+    def archive_past(self, before_date, limit):
+        rows = self.repo.archive_past(before_date, limit)
+        for row in rows:
+            self.replica.remove(row.get('id'))
+        return rows
+
+    def claim_reminders(self, event_ids, sent_at):
+        claimed = self.repo.claim_reminders(event_ids, sent_at)
+        for event_id in claimed:
+            self.replica.patch(event_id, {'reminder_sent_at': sent_at})
+        return claimed
+
+    def release_reminders(self, event_ids):
+        rows = self.repo.release_reminders(event_ids)
+        for event_id in event_ids:
+            self.replica.patch(event_id, {'reminder_sent_at': None})
+        return rows
+
+
+class ReplicatedNotesRepo:
+    """NotesRepo with search/get served from the replica; writes go through and patch it"""
+
+    def __init__(self, repo, replica):
+        self.repo = repo
+        self.replica = replica
+
+    def __getattr__(self, name):
+        return getattr(self.repo, name)
+
+    @staticmethod
+    def search_terms(query):
+        """Same word rule as NotesRepo.search_condition"""
+        words = [word.strip() for word in query.split()[:3] if len(word.strip()) >= 2] if len(query.split()) > 1 else []
+        return words or [query]
+
+    def search(self, user_id, query, limit=None):
+        if not self.replica.serve():
+            return self.repo.search(user_id, query, limit)
+        terms = self.search_terms(query)
+        rows = [row for row in self.replica.select('created_by', user_id)
+                if any(contains(row.get('name'), term) or contains(row.get('phone_number'), term) for term in terms)]
+        rows.sort(key=lambda row: (str(row.get('created_at') or ''), sort_id(row)), reverse=True)
+        if limit:
+            rows = rows[:limit]
+        return [project(row, NOTE_LIST_COLUMNS) for row in rows]
+
+    def get(self, note_id, columns=NOTE_DETAIL_COLUMNS):
+        if not self.replica.serve():
+            return self.repo.get(note_id, columns)
+        row = self.replica.get(note_id)
+        return project(row, columns) if row else None
+
+    def insert(self, name, content, created_by):
+        rows = self.repo.insert(name, content, created_by)
+        for row in rows:
+            self.replica.upsert(row)
+        return rows
+
+    def insert_many(self, notes):
+        rows = self.repo.insert_many(notes)
+        for row in rows:
+            self.replica.upsert(row)
+        return rows
+
+    def delete_owned(self, note_id, user_id, is_admin):
+        rows = self.repo.delete_owned(note_id, user_id, is_admin)
+        for row in rows:
+            self.replica.remove(row.get('id'))
+        return rows
@@ -0,0 +1,821 @@
+# -*- coding: utf-8 -*-
+"""
+🗄️ REPOSITORY LAYER - every Supabase query shape lives here exactly once
+
+Each query shape (e.g. 'events.list_for_user') carries its own metrics:
+call count, errors, latency histogram and result-size stats. Cross-cutting
+behaviour such as caching, batching or coalescing plugs in as a shape
+plugin, so it applies to every code path that uses the shape
+(e.g. SingleFlight below).
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+try:
+    from api.deadline import DeadlineExceeded, current_deadline
+except ImportError:
+    from deadline import DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+# Column projections per view - never select('*') on the hot paths.
+# Notes keep their body in contacts.phone_number; list views read the stored
+# contacts.content_preview (text) and only "ดูเต็ม" loads the full body.
+# Schema, backfill and indexes: supabase/migrations/
+EVENT_LIST_COLUMNS = 'id, event_title, event_description, event_date, created_by'
+EVENT_REMINDER_COLUMNS = 'id, event_title, event_date, created_by, reminder_sent_at'
+EVENT_ARCHIVE_COLUMNS = 'id, event_title, event_date, created_by, archive_reason, archived_at'
+# Full rows held by the in-process read replica (api/replica.py)
+EVENT_REPLICA_COLUMNS = 'id, event_title, event_description, event_date, created_by, created_at, reminder_sent_at, updated_at'
+NOTE_REPLICA_COLUMNS = 'id, name, phone_number, content_preview, created_by, created_at, updated_at'
+NOTIFICATION_LOG_COLUMNS = 'id, event_id, user_id, notification_time, message, sent, created_at'
+NOTE_LIST_COLUMNS = 'id, name, content_preview, created_at'
+NOTE_DETAIL_COLUMNS = 'id, name, phone_number, created_by'
+# Bulk export (/data/...): everything a user typed, plus ids for resuming
+EVENT_EXPORT_COLUMNS = 'id, event_title, event_description, event_date, created_by, created_at'
+NOTE_EXPORT_COLUMNS = 'id, name, phone_number, created_by, created_at'
+
+# Latency histogram bucket upper bounds (ms)
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf')]
+
+
+class QueryStats:
+    """Thread-safe counters, latency histogram and result-size stats for one shape"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.rows_total = 0
+        self.rows_max = 0
+
+    def record(self, elapsed_ms, rows=0, error=False):
+        with self._lock:
+            self.calls += 1
+            if error:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    self.buckets[i] += 1
+                    break
+            self.rows_total += rows
+            self.rows_max = max(self.rows_max, rows)
+
+    def percentile(self, pct):
+        """Estimate a latency percentile (ms) from the histogram bucket bounds"""
+        with self._lock:
+            if not self.calls:
+                return None
+            target = self.calls * pct / 100.0
+            seen = 0
+            for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+                seen += count
+                if seen >= target:
+                    return self.max_ms if bound == float('inf') else bound
+        return self.max_ms
+
+    def to_dict(self):
+        with self._lock:
+            calls = self.calls
+            data = {
+                'calls': calls,
+                'errors': self.errors,
+                'avg_ms': round(self.total_ms / calls, 2) if calls else 0,
+                'max_ms': round(self.max_ms, 2),
+                'histogram_ms': {
+                    ('inf' if bound == float('inf') else str(bound)): count
+                    for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)
+                },
+                'rows_avg': round(self.rows_total / calls, 2) if calls else 0,
+                'rows_max': self.rows_max
+            }
+        data['p50_ms'] = self.percentile(50)
+        data['p95_ms'] = self.percentile(95)
+        return data
+
+
+class QueryShape:
+    """One named query shape with metrics and an optional plugin chain.
+
+    Plugins expose wrap(shape, key, fetch) and return a new zero-argument
+    fetch callable; they are applied in registration order (first = outermost).
+    """
+
+    def __init__(self, name, idempotent=True):
+        self.name = name
+        self.idempotent = idempotent
+        self.stats = QueryStats()
+        self.plugins = []
+
+    def add_plugin(self, plugin):
+        self.plugins.append(plugin)
+
+    def execute(self, build, key=()):
+        """Run build() -> PostgREST builder and return the result rows"""
+        def fetch():
+            started = time.perf_counter()
+            try:
+                response = build().execute()
+            except Exception:
+                self.stats.record((time.perf_counter() - started) * 1000, error=True)
+                raise
+            rows = response.data or []
+            self.stats.record((time.perf_counter() - started) * 1000, rows=len(rows))
+            return rows
+
+        for plugin in reversed(self.plugins):
+            fetch = plugin.wrap(self, key, fetch)
+        return fetch()
+
+
+class QueryRegistry:
+    """All query shapes by name - the source for /metrics"""
+
+    def __init__(self):
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def shape(self, name, idempotent=True):
+        with self._lock:
+            if name not in self._shapes:
+                self._shapes[name] = QueryShape(name, idempotent=idempotent)
+            return self._shapes[name]
+
+    def shapes(self):
+        with self._lock:
+            return list(self._shapes.values())
+
+    def add_plugin(self, plugin, idempotent_only=True):
+        """Attach a plugin to every shape (optionally only idempotent reads)"""
+        for shape in self.shapes():
+            if shape.idempotent or not idempotent_only:
+                shape.add_plugin(plugin)
+
+    def snapshot(self):
+        return {shape.name: shape.stats.to_dict() for shape in self.shapes()}
+
+
+class _Flight:
+    """One in-progress upstream call that later identical calls wait on"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.rows = None
+        self.error = None
+
+
+def _wait_timeout():
+    """How long a caller may block on a query another thread runs: its request's work budget (None = no request)"""
+    deadline = current_deadline()
+    return deadline.work_remaining() if deadline is not None else None
+
+
+def _deadline_exceeded(shape):
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.exceeded = True
+    return DeadlineExceeded(f'{shape.name}: request deadline exceeded waiting for an in-flight query')
+
+
+class SingleFlight:
+    """Shape plugin: identical concurrent reads (same shape + key) share one upstream query.
+
+    The first caller runs the query; callers arriving while it is in flight
+    wait and get a copy of its rows (or its exception). Writes through a shape
+    of the same table bump that table's generation, and a read never joins a
+    flight that started before the latest write - so a reader still sees its
+    own preceding write. Register with idempotent_only=False so writes are seen.
+    A waiting caller inside a request scope waits no longer than its deadline's
+    work budget and then gets DeadlineExceeded, like a query it ran itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # (shape name, key) -> _Flight
+        self._generations = {}  # table -> write generation
+        self._stats = {}  # shape name -> [upstream calls, coalesced calls]
+
+    def wrap(self, shape, key, fetch):
+        table = shape.name.split('.', 1)[0]
+        if not shape.idempotent:
+            def write():
+                try:
+                    return fetch()
+                finally:
+                    with self._lock:
+                        self._generations[table] = self._generations.get(table, 0) + 1
+            return write
+
+        def coalesced():
+            flight_key = (shape.name, key)
+            with self._lock:
+                generation = self._generations.get(table, 0)
+                flight = self._flights.get(flight_key)
+                stats = self._stats.setdefault(shape.name, [0, 0])
+                if flight is not None and flight.generation == generation:
+                    stats[1] += 1
+                    leader = False
+                else:
+                    flight = _Flight(generation)
+                    self._flights[flight_key] = flight
+                    stats[0] += 1
+                    leader = True
+
+            if not leader:
+                if not flight.done.wait(_wait_timeout()):
+                    raise _deadline_exceeded(shape)
+                if flight.error is not None:
+                    raise flight.error
+                return [dict(row) for row in flight.rows]
+
+            try:
+                flight.rows = fetch()  # Private to the flight: the leader gets a copy like every follower
+                return [dict(row) for row in flight.rows]
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    if self._flights.get(flight_key) is flight:
+                        del self._flights[flight_key]
+                flight.done.set()
+        return coalesced
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {'upstream': upstream, 'coalesced': coalesced}
+                for name, (upstream, coalesced) in self._stats.items()
+            }
+
+
+class HedgedReads:
+    """Shape plugin: hedge slow reads of selected shapes with a second identical query.
+
+    The query runs on a worker; if it has not answered within the shape's own
+    tracked p95 latency, an identical backup query is sent and whichever
+    answers first wins. A running HTTP call cannot be interrupted, so the
+    loser is cancelled if it has not started and its result is discarded
+    otherwise. Hedges draw from a token bucket refilled by budget_ratio per
+    call, so they add at most that fraction of extra upstream load.
+    Inside a request scope the caller waits no longer than the deadline's
+    work budget for either query and then gets DeadlineExceeded.
+    """
+
+    def __init__(self, shape_names, budget_ratio=0.05, burst=10, min_samples=20, min_delay_ms=20, max_workers=8):
+        self.shape_names = set(shape_names)
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay_ms = min_delay_ms
+        self.max_workers = max_workers
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._stats = {}  # shape name -> counters
+
+    def _pool(self):
+        # Lazily per process - gunicorn --preload forks after import
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='hedged-read')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _delay_seconds(self, shape):
+        """Hedge delay = the shape's p95, once it has enough samples"""
+        if shape.stats.calls < self.min_samples:
+            return None
+        p95 = shape.stats.percentile(95)
+        return max(self.min_delay_ms, p95) / 1000.0 if p95 is not None else None
+
+    def _count(self, shape, field):
+        stats = self._stats.setdefault(shape.name, {'calls': 0, 'hedged': 0, 'backup_wins': 0, 'over_budget': 0})
+        stats[field] += 1
+
+    def wrap(self, shape, key, fetch):
+        if not shape.idempotent or shape.name not in self.shape_names:
+            return fetch
+
+        def submit(pool):
+            # Own context copy per task: workers see the caller's request deadline
+            return pool.submit(contextvars.copy_context().run, fetch)
+
+        def hedged():
+            delay = self._delay_seconds(shape)
+            with self._lock:
+                self._tokens = min(self.burst, self._tokens + self.budget_ratio)
+                self._count(shape, 'calls')
+            if delay is None:
+                return fetch()
+
+            pool = self._pool()
+            primary = submit(pool)
+            try:
+                return primary.result(timeout=delay)
+            except FutureTimeout:
+                pass
+
+            with self._lock:
+                allowed = self._tokens >= 1
+                if allowed:
+                    self._tokens -= 1
+                    self._count(shape, 'hedged')
+                else:
+                    self._count(shape, 'over_budget')
+            if not allowed:
+                try:
+                    return primary.result(timeout=_wait_timeout())
+                except FutureTimeout:
+                    raise _deadline_exceeded(shape)
+
+            backup = submit(pool)
+            pending = {primary, backup}
+            error = None
+            while pending:
+                done, pending = wait(pending, timeout=_wait_timeout(), return_when=FIRST_COMPLETED)
+                if not done:
+                    for loser in pending:
+                        loser.cancel()
+                    raise _deadline_exceeded(shape)
+                for future in done:
+                    if future.exception() is None:
+                        for loser in pending:
+                            loser.cancel()
+                        if future is backup:
+                            with self._lock:
+                                self._count(shape, 'backup_wins')
+                        return future.result()
+                    error = error or future.exception()
+            raise error
+        return hedged
+
+    def stats(self):
+        with self._lock:
+            return {
+                'budget_ratio': self.budget_ratio,
+                'tokens': round(self._tokens, 2),
+                'shapes': {name: dict(counters) for name, counters in self._stats.items()}
+            }
+
+
+query_registry = QueryRegistry()
+
+
+class BaseRepo:
+    """Shared plumbing: the client and shape registration"""
+
+    table_name = None
+
+    def __init__(self, client, registry=None):
+        self.client = client
+        self.registry = registry or query_registry
+
+    def table(self):
+        """PostgREST query builder for this table (Supabase client only)"""
+        return self.client.table(self.table_name)
+
+    def shape(self, name, idempotent=True):
+        return self.registry.shape(f"{self.table_name}.{name}", idempotent=idempotent)
+
+
+class EventsRepo(BaseRepo):
+    """📅 events table"""
+
+    table_name = 'events'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._list_for_user = self.shape('list_for_user')
+        self._list_all = self.shape('list_all')
+        self._list_on_date = self.shape('list_on_date')
+        self._search = self.shape('search')
+        self._get = self.shape('get')
+        self._get_many = self.shape('get_many')
+        self._list_from_date = self.shape('list_from_date')
+        self._list_between = self.shape('list_between')
+        self._list_after_cursor = self.shape('list_after_cursor')
+        self._get_owned = self.shape('get_owned')
+        self._list_page_after_id = self.shape('list_page_after_id')
+        self._list_updated_since = self.shape('list_updated_since')
+        self._export_page = self.shape('export_page')
+        self._insert = self.shape('insert', idempotent=False)
+        self._insert_many = self.shape('insert_many', idempotent=False)
+        self._update_owned = self.shape('update_owned', idempotent=False)
+        self._delete_owned = self.shape('delete_owned', idempotent=False)
+        self._claim_reminders = self.shape('claim_reminders', idempotent=False)
+        self._release_reminders = self.shape('release_reminders', idempotent=False)
+        self._complete_owned = self.shape('complete_owned', idempotent=False)
+        self._archive_past = self.shape('archive_past', idempotent=False)
+
+    def list_for_user(self, user_id, columns=EVENT_LIST_COLUMNS):
+        return self._list_for_user.execute(
+            lambda: self.table().select(columns).eq('created_by', user_id).order('event_date', desc=False),
+            key=(user_id, columns)
+        )
+
+    def list_all(self, columns=EVENT_LIST_COLUMNS):
+        return self._list_all.execute(
+            lambda: self.table().select(columns).order('event_date', desc=False),
+            key=(columns,)
+        )
+
+    def list_visible(self, user_id, is_admin):
+        """Admins see every event, users only their own"""
+        return self.list_all() if is_admin else self.list_for_user(user_id)
+
+    def list_on_date(self, user_id, event_date):
+        return self._list_on_date.execute(
+            lambda: self.table().select(EVENT_LIST_COLUMNS).eq('created_by', user_id).eq('event_date', event_date).order('event_date', desc=False),
+            key=(user_id, event_date)
+        )
+
+    def search(self, user_id, query, limit=None):
+        def build():
+            builder = self.table().select(EVENT_LIST_COLUMNS).eq('created_by', user_id).or_(
+                f"event_title.ilike.%{query}%,event_description.ilike.%{query}%"
+            ).order('event_date', desc=False)
+            return builder.limit(limit) if limit else builder
+        return self._search.execute(build, key=(user_id, query, limit))
+
+    def get(self, event_id, columns='id, created_by, event_title'):
+        rows = self._get.execute(
+            lambda: self.table().select(columns).eq('id', event_id),
+            key=(str(event_id), columns)
+        )
+        return rows[0] if rows else None
+
+    def get_many(self, event_ids, columns=EVENT_REMINDER_COLUMNS):
+        if not event_ids:
+            return []
+        return self._get_many.execute(
+            lambda: self.table().select(columns).in_('id', event_ids),
+            key=(tuple(sorted(str(i) for i in event_ids)), columns)
+        )
+
+    def list_from_date(self, start_date, columns=EVENT_REMINDER_COLUMNS):
+        return self._list_from_date.execute(
+            lambda: self.table().select(columns).gte('event_date', start_date),
+            key=(str(start_date), columns)
+        )
+
+    def list_between(self, start_date, end_date, columns=EVENT_REMINDER_COLUMNS):
+        return self._list_between.execute(
+            lambda: self.table().select(columns).gte('event_date', start_date).lte('event_date', end_date),
+            key=(str(start_date), str(end_date), columns)
+        )
+
+    def list_after_cursor(self, cursor_date, cursor_id, last_date, limit, columns=EVENT_REMINDER_COLUMNS):
+        """Keyset page of unsent reminders in (event_date, id) order after the cursor, up to last_date"""
+        def build():
+            builder = self.table().select(columns).lte('event_date', last_date).is_('reminder_sent_at', 'null')
+            if cursor_id is None:
+                builder = builder.gt('event_date', cursor_date)
+            else:
+                builder = builder.or_(f"event_date.gt.{cursor_date},and(event_date.eq.{cursor_date},id.gt.{cursor_id})")
+            return builder.order('event_date', desc=False).order('id', desc=False).limit(limit)
+        return self._list_after_cursor.execute(build, key=(cursor_date, cursor_id, last_date, limit, columns))
+
+    def get_owned(self, event_id, user_id, is_admin, columns='id, created_by, event_title'):
+        """Event row if it exists and the user may manage it (owner or admin), else None"""
+        def build():
+            builder = self.table().select(columns).eq('id', event_id)
+            return builder if is_admin else builder.eq('created_by', user_id)
+        rows = self._get_owned.execute(build, key=(str(event_id), user_id, is_admin, columns))
+        return rows[0] if rows else None
+
+    def list_page_after_id(self, after_id, limit, columns=EVENT_REPLICA_COLUMNS):
+        """Keyset page in id order (replica load / delete reconcile)"""
+        return self._list_page_after_id.execute(
+            lambda: self.table().select(columns).gt('id', after_id).order('id', desc=False).limit(limit),
+            key=(after_id, limit, columns)
+        )
+
+    def list_updated_since(self, since, limit, columns=EVENT_REPLICA_COLUMNS, after_id=None):
+        """Rows stamped at or after the updated_at watermark (replica change feed).
+
+        With after_id the page continues a (updated_at, id) keyset: rows stamped
+        exactly `since` are only returned above that id.
+        """
+        def build():
+            builder = self.table().select(columns)
+            if after_id is None:
+                builder = builder.gte('updated_at', since)
+            else:
+                builder = builder.or_(f'updated_at.gt."{since}",and(updated_at.eq."{since}",id.gt.{int(after_id)})')
+            return builder.order('updated_at', desc=False).order('id', desc=False).limit(limit)
+        return self._list_updated_since.execute(build, key=(since, limit, columns, after_id))
+
+    def export_page(self, user_id, after_id, limit, columns=EVENT_EXPORT_COLUMNS):
+        """Keyset page in id order for bulk export; user_id None = every user's events"""
+        def build():
+            builder = self.table().select(columns).gt('id', after_id)
+            if user_id is not None:
+                builder = builder.eq('created_by', user_id)
+            return builder.order('id', desc=False).limit(limit)
+        return self._export_page.execute(build, key=(user_id, after_id, limit, columns))
+
+    def insert(self, values):
+        return self._insert.execute(lambda: self.table().insert(values))
+
+    def insert_many(self, rows):
+        """One multi-row insert (bulk import); returns the inserted rows"""
+        return self._insert_many.execute(lambda: self.table().insert(rows))
+
+    def update_owned(self, event_id, user_id, is_admin, values):
+        """Ownership-checked update in one round-trip; returns the updated rows (empty = missing or not allowed)"""
+        def build():
+            builder = self.table().update(values).eq('id', event_id)
+            return builder if is_admin else builder.eq('created_by', user_id)
+        return self._update_owned.execute(build)
+
+    def delete_owned(self, event_id, user_id, is_admin):
+        """Ownership-checked delete in one round-trip; returns the deleted rows (empty = missing or not allowed)"""
+        def build():
+            builder = self.table().delete().eq('id', event_id)
+            return builder if is_admin else builder.eq('created_by', user_id)
+        return self._delete_owned.execute(build)
+
+    def claim_reminders(self, event_ids, sent_at):
+        """Set reminder_sent_at on events that have none yet; returns the IDs (as str) this call claimed"""
+        if not event_ids:
+            return set()
+        rows = self._claim_reminders.execute(
+            lambda: self.table().update({'reminder_sent_at': sent_at}).in_('id', event_ids).is_('reminder_sent_at', 'null')
+        )
+        return {str(row['id']) for row in rows}
+
+    def release_reminders(self, event_ids):
+        """Undo a claim when the push failed so the next pass retries"""
+        if not event_ids:
+            return []
+        return self._release_reminders.execute(
+            lambda: self.table().update({'reminder_sent_at': None}).in_('id', event_ids)
+        )
+
+    def complete_owned(self, event_id, user_id, is_admin):
+        """Ownership-checked move to events_archive in one round-trip (rpc complete_event); returns the archived rows"""
+        return self._complete_owned.execute(lambda: self.client.rpc('complete_event', {
+            'p_event_id': int(event_id),
+            'p_user_id': user_id,
+            'p_is_admin': bool(is_admin)
+        }))
+
+    def archive_past(self, before_date, limit):
+        """Move up to `limit` events dated before before_date to events_archive (rpc archive_past_events); returns moved rows"""
+        return self._archive_past.execute(lambda: self.client.rpc('archive_past_events', {
+            'p_before': before_date,
+            'p_limit': limit
+        }))
+
+
+class EventsArchiveRepo(BaseRepo):
+    """🗄️ events_archive - completed and long-past events, browsed page by page"""
+
+    table_name = 'events_archive'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._list_page = self.shape('list_page')
+
+    def list_page(self, user_id, is_admin, page, page_size, columns=EVENT_ARCHIVE_COLUMNS):
+        """One page (newest event_date first) plus one extra row to tell whether a next page exists"""
+        start = (page - 1) * page_size
+
+        def build():
+            builder = self.table().select(columns)
+            if not is_admin:
+                builder = builder.eq('created_by', user_id)
+            return builder.order('event_date', desc=True).order('id', desc=True).range(start, start + page_size)
+        return self._list_page.execute(build, key=(user_id, is_admin, page, page_size, columns))
+
+
+class NotesRepo(BaseRepo):
+    """📝 Notes (stored in the contacts table; body lives in phone_number)"""
+
+    table_name = 'contacts'
+
+    def __init__(self, client, registry=None, preview_length=201):
+        super().__init__(client, registry)
+        self.preview_length = preview_length
+        self._search = self.shape('search')
+        self._get = self.shape('get')
+        self._list_page_after_id = self.shape('list_page_after_id')
+        self._list_updated_since = self.shape('list_updated_since')
+        self._export_page = self.shape('export_page')
+        self._insert = self.shape('insert', idempotent=False)
+        self._insert_many = self.shape('insert_many', idempotent=False)
+        self._delete_owned = self.shape('delete_owned', idempotent=False)
+
+    def make_preview(self, content):
+        """Preview stored alongside the note body (contacts.content_preview)"""
+        return (content or '')[:self.preview_length]
+
+    @staticmethod
+    def search_condition(query):
+        """OR filter over name/body; multi-word queries match any word (max 3, 2+ chars)"""
+        words = [word.strip() for word in query.split()[:3] if len(word.strip()) >= 2] if len(query.split()) > 1 else []
+        if words:
+            return ','.join(f'name.ilike.%{word}%,phone_number.ilike.%{word}%' for word in words)
+        return f'name.ilike.%{query}%,phone_number.ilike.%{query}%'
+
+    def search(self, user_id, query, limit=None):
+        condition = self.search_condition(query)
+
+        def build():
+            builder = self.table().select(NOTE_LIST_COLUMNS).eq('created_by', user_id).or_(condition).order('created_at', desc=True)
+            return builder.limit(limit) if limit else builder
+        return self._search.execute(build, key=(user_id, query, limit))
+
+    def get(self, note_id, columns=NOTE_DETAIL_COLUMNS):
+        rows = self._get.execute(
+            lambda: self.table().select(columns).eq('id', note_id),
+            key=(str(note_id), columns)
+        )
+        return rows[0] if rows else None
+
+    def list_page_after_id(self, after_id, limit, columns=NOTE_REPLICA_COLUMNS):
+        """Keyset page in id order (replica load / delete reconcile)"""
+        return self._list_page_after_id.execute(
+            lambda: self.table().select(columns).gt('id', after_id).order('id', desc=False).limit(limit),
+            key=(after_id, limit, columns)
+        )
+
+    def list_updated_since(self, since, limit, columns=NOTE_REPLICA_COLUMNS, after_id=None):
+        """Rows stamped at or after the updated_at watermark (replica change feed).
+
+        With after_id the page continues a (updated_at, id) keyset: rows stamped
+        exactly `since` are only returned above that id.
+        """
+        def build():
+            builder = self.table().select(columns)
+            if after_id is None:
+                builder = builder.gte('updated_at', since)
+            else:
+                builder = builder.or_(f'updated_at.gt."{since}",and(updated_at.eq."{since}",id.gt.{int(after_id)})')
+            return builder.order('updated_at', desc=False).order('id', desc=False).limit(limit)
+        return self._list_updated_since.execute(build, key=(since, limit, columns, after_id))
+
+    def export_page(self, user_id, after_id, limit, columns=NOTE_EXPORT_COLUMNS):
+        """Keyset page in id order for bulk export; user_id None = every user's notes"""
+        def build():
+            builder = self.table().select(columns).gt('id', after_id)
+            if user_id is not None:
+                builder = builder.eq('created_by', user_id)
+            return builder.order('id', desc=False).limit(limit)
+        return self._export_page.execute(build, key=(user_id, after_id, limit, columns))
+
+    def insert(self, name, content, created_by):
+        return self._insert.execute(lambda: self.table().insert({
+            'name': name,
+            'phone_number': content,
+            'content_preview': self.make_preview(content),
+            'created_by': created_by
+        }))
+
+    def insert_many(self, notes):
+        """One multi-row insert of {'name', 'content', 'created_by'} dicts (bulk import)"""
+        return self._insert_many.execute(lambda: self.table().insert([{
+            'name': note['name'],
+            'phone_number': note['content'],
+            'content_preview': self.make_preview(note['content']),
+            'created_by': note['created_by']
+        } for note in notes]))
+
+    def delete_owned(self, note_id, user_id, is_admin):
+        """Ownership-checked delete in one round-trip; returns the deleted rows"""
+        def build():
+            builder = self.table().delete().eq('id', note_id)
+            return builder if is_admin else builder.eq('created_by', user_id)
+        return self._delete_owned.execute(build)
+
+
+class NotificationsRepo(BaseRepo):
+    """🔔 notifications log (history only - the hot path reads events.reminder_sent_at)"""
+
+    table_name = 'notifications'
+    archive_table_name = 'notifications_archive'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._probe = self.shape('probe')
+        self._log_sent = self.shape('log_sent', idempotent=False)
+        self._list_before = self.shape('list_before')
+        self._archive = self.registry.shape(f"{self.archive_table_name}.upsert", idempotent=False)
+        self._delete_ids = self.shape('delete_ids', idempotent=False)
+
+    def probe(self):
+        """Raises if the table is missing"""
+        return self._probe.execute(lambda: self.table().select('id').limit(1))
+
+    def log_sent(self, rows):
+        """One row per event (unique notifications.event_id) - a repeat send is a no-op"""
+        return self._log_sent.execute(
+            lambda: self.table().upsert(rows, on_conflict='event_id', ignore_duplicates=True)
+        )
+
+    def list_before(self, cutoff, limit, columns=NOTIFICATION_LOG_COLUMNS):
+        """Oldest log rows created before cutoff, in id order"""
+        return self._list_before.execute(
+            lambda: self.table().select(columns).lt('created_at', cutoff).order('id', desc=False).limit(limit),
+            key=(cutoff, limit, columns)
+        )
+
+    def archive(self, rows):
+        """Copy rows to notifications_archive; re-copying after a crash is a no-op"""
+        return self._archive.execute(
+            lambda: self.client.table(self.archive_table_name).upsert(rows, on_conflict='id', ignore_duplicates=True)
+        )
+
+    def delete_ids(self, ids):
+        if not ids:
+            return []
+        return self._delete_ids.execute(lambda: self.table().delete().in_('id', ids))
+
+
+class SubscribersRepo(BaseRepo):
+    """👥 subscribers"""
+
+    table_name = 'subscribers'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._list_ids_page = self.shape('list_ids_page')
+        self._upsert_new = self.shape('upsert_new', idempotent=False)
+
+    def list_ids_page(self, start, page_size):
+        rows = self._list_ids_page.execute(
+            lambda: self.table().select('user_id').range(start, start + page_size - 1),
+            key=(start, page_size)
+        )
+        return [row['user_id'] for row in rows if row.get('user_id')]
+
+    def upsert_new(self, rows):
+        """Insert new subscribers; ignore_duplicates keeps the original subscribed_at"""
+        return self._upsert_new.execute(
+            lambda: self.table().upsert(rows, on_conflict='user_id', ignore_duplicates=True)
+        )
+
+
+class JobStateRepo(BaseRepo):
+    """⏱️ job_state (name text primary key, value jsonb, updated_at timestamptz)"""
+
+    table_name = 'job_state'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._get = self.shape('get')
+        self._save = self.shape('save', idempotent=False)
+
+    def get(self, name):
+        rows = self._get.execute(lambda: self.table().select('value').eq('name', name).limit(1), key=(name,))
+        return (rows[0].get('value') or {}) if rows else {}
+
+    def save(self, name, value, updated_at):
+        return self._save.execute(lambda: self.table().upsert({
+            'name': name,
+            'value': value,
+            'updated_at': updated_at
+        }, on_conflict='name'))
+
+
+class LeasesRepo(BaseRepo):
+    """👑 scheduler_leases (name text primary key, holder text, expires_at timestamptz)"""
+
+    table_name = 'scheduler_leases'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._renew = self.shape('renew', idempotent=False)
+        self._create = self.shape('create', idempotent=False)
+        self._release = self.shape('release', idempotent=False)
+
+    def renew_or_take_over(self, name, holder, now_str, expires_str):
+        """Renew our own lease or take over an expired one in one conditional update"""
+        return self._renew.execute(lambda: self.table().update({
+            'holder': holder,
+            'expires_at': expires_str
+        }).eq('name', name).or_(f'holder.eq.{holder},expires_at.lt.{now_str}'))
+
+    def create(self, name, holder, expires_str):
+        """First holder - the primary key makes this race-safe"""
+        return self._create.execute(lambda: self.table().insert({
+            'name': name,
+            'holder': holder,
+            'expires_at': expires_str
+        }))
+
+    def release(self, name, holder):
+        return self._release.execute(lambda: self.table().delete().eq('name', name).eq('holder', holder))
@@ -0,0 +1,842 @@
+# -*- coding: utf-8 -*-
+"""
+🪶 SQLITE STORAGE BACKEND - the repository interface on an embedded database
+
+Drop-in replacement for the Supabase repositories in api/repository.py for
+single-node deployments (STORAGE_BACKEND=sqlite): same classes' methods, same
+return shapes (lists of row dicts), same query shape names and metrics.
+The database runs in WAL mode so readers never block the writer, and event
+/ note search uses FTS5 trigram indexes (substring match like ilike).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+try:
+    from api.repository import (
+        BaseRepo, EVENT_LIST_COLUMNS, EVENT_REMINDER_COLUMNS, EVENT_ARCHIVE_COLUMNS, EVENT_REPLICA_COLUMNS,
+        EVENT_EXPORT_COLUMNS, NOTE_LIST_COLUMNS, NOTE_DETAIL_COLUMNS, NOTE_REPLICA_COLUMNS, NOTE_EXPORT_COLUMNS,
+        NOTIFICATION_LOG_COLUMNS
+    )
+except ImportError:
+    from repository import (
+        BaseRepo, EVENT_LIST_COLUMNS, EVENT_REMINDER_COLUMNS, EVENT_ARCHIVE_COLUMNS, EVENT_REPLICA_COLUMNS,
+        EVENT_EXPORT_COLUMNS, NOTE_LIST_COLUMNS, NOTE_DETAIL_COLUMNS, NOTE_REPLICA_COLUMNS, NOTE_EXPORT_COLUMNS,
+        NOTIFICATION_LOG_COLUMNS
+    )
+
+try:
+    from api.deadline import call_timeout
+except ImportError:
+    from deadline import call_timeout
+
+logger = logging.getLogger(__name__)
+
+# Columns per table - select strings are validated against these
+TABLE_COLUMNS = {
+    'events': ['id', 'event_title', 'event_description', 'event_date', 'created_by', 'created_at', 'reminder_sent_at',
+               'updated_at'],
+    'events_archive': ['id', 'event_title', 'event_description', 'event_date', 'created_by', 'created_at',
+                       'reminder_sent_at', 'archive_reason', 'archived_by', 'archived_at'],
+    'contacts': ['id', 'name', 'phone_number', 'content_preview', 'created_by', 'created_at', 'updated_at'],
+    'notifications': ['id', 'event_id', 'user_id', 'notification_time', 'message', 'sent', 'created_at'],
+    'notifications_archive': ['id', 'event_id', 'user_id', 'notification_time', 'message', 'sent', 'created_at',
+                              'archived_at'],
+    'subscribers': ['user_id', 'subscribed_at'],
+    'job_state': ['name', 'value', 'updated_at'],
+    'scheduler_leases': ['name', 'holder', 'expires_at'],
+}
+
+# Primary key per table (export/import)
+TABLE_KEYS = {
+    'events': 'id', 'events_archive': 'id', 'contacts': 'id', 'notifications': 'id',
+    'notifications_archive': 'id', 'subscribers': 'user_id', 'job_state': 'name', 'scheduler_leases': 'name',
+}
+
+SCHEMA = """
+create table if not exists events (
+    id integer primary key autoincrement,
+    event_title text not null,
+    event_description text,
+    event_date text not null,
+    created_by text not null,
+    created_at text not null,
+    reminder_sent_at text,
+    updated_at text
+);
+create index if not exists events_created_by_event_date_idx on events (created_by, event_date, id);
+create index if not exists events_event_date_id_idx on events (event_date, id);
+
+create table if not exists events_archive (
+    id integer primary key,
+    event_title text not null,
+    event_description text,
+    event_date text not null,
+    created_by text not null,
+    created_at text,
+    reminder_sent_at text,
+    archive_reason text not null,
+    archived_by text,
+    archived_at text not null
+);
+create index if not exists events_archive_created_by_event_date_idx on events_archive (created_by, event_date desc, id desc);
+create index if not exists events_archive_event_date_idx on events_archive (event_date desc, id desc);
+
+create table if not exists contacts (
+    id integer primary key autoincrement,
+    name text not null,
+    phone_number text,
+    content_preview text,
+    created_by text not null,
+    created_at text not null,
+    updated_at text
+);
+create index if not exists contacts_created_by_created_at_idx on contacts (created_by, created_at desc);
+
+create table if not exists notifications (
+    id integer primary key autoincrement,
+    event_id integer not null unique,
+    user_id text not null,
+    notification_time text not null,
+    message text,
+    sent integer not null default 0,
+    created_at text not null
+);
+create index if not exists notifications_created_at_idx on notifications (created_at, id);
+
+create table if not exists notifications_archive (
+    id integer primary key,
+    event_id integer,
+    user_id text,
+    notification_time text,
+    message text,
+    sent integer,
+    created_at text,
+    archived_at text not null
+);
+
+create table if not exists subscribers (
+    user_id text primary key,
+    subscribed_at text not null
+);
+
+create table if not exists job_state (
+    name text primary key,
+    value text not null default '{}',
+    updated_at text not null
+);
+
+create table if not exists scheduler_leases (
+    name text primary key,
+    holder text not null,
+    expires_at text not null
+);
+"""
+
+# External-content FTS5 tables kept in sync by triggers
+FTS_SCHEMA = """
+create virtual table if not exists events_fts using fts5(
+    event_title, event_description, content='events', content_rowid='id', tokenize='trigram'
+);
+create trigger if not exists events_fts_ai after insert on events begin
+    insert into events_fts(rowid, event_title, event_description) values (new.id, new.event_title, new.event_description);
+end;
+create trigger if not exists events_fts_ad after delete on events begin
+    insert into events_fts(events_fts, rowid, event_title, event_description) values ('delete', old.id, old.event_title, old.event_description);
+end;
+create trigger if not exists events_fts_au after update of event_title, event_description on events begin
+    insert into events_fts(events_fts, rowid, event_title, event_description) values ('delete', old.id, old.event_title, old.event_description);
+    insert into events_fts(rowid, event_title, event_description) values (new.id, new.event_title, new.event_description);
+end;
+
+create virtual table if not exists contacts_fts using fts5(
+    name, phone_number, content='contacts', content_rowid='id', tokenize='trigram'
+);
+create trigger if not exists contacts_fts_ai after insert on contacts begin
+    insert into contacts_fts(rowid, name, phone_number) values (new.id, new.name, new.phone_number);
+end;
+create trigger if not exists contacts_fts_ad after delete on contacts begin
+    insert into contacts_fts(contacts_fts, rowid, name, phone_number) values ('delete', old.id, old.name, old.phone_number);
+end;
+create trigger if not exists contacts_fts_au after update of name, phone_number on contacts begin
+    insert into contacts_fts(contacts_fts, rowid, name, phone_number) values ('delete', old.id, old.name, old.phone_number);
+    insert into contacts_fts(rowid, name, phone_number) values (new.id, new.name, new.phone_number);
+end;
+"""
+
+# Stored as fixed-width UTC text (see utc_timestamp)
+TIMESTAMP_COLUMNS = {'created_at', 'reminder_sent_at', 'archived_at', 'notification_time', 'subscribed_at',
+                     'updated_at', 'expires_at'}
+
+# Columns added after the first release: (table, column, definition)
+SCHEMA_UPGRADES = [
+    ('events', 'updated_at', 'text'),
+    ('contacts', 'updated_at', 'text'),
+]
+# Created after SCHEMA_UPGRADES so the columns exist on upgraded files
+INDEXES_AFTER_UPGRADE = """
+create index if not exists events_updated_at_idx on events (updated_at, id);
+create index if not exists contacts_updated_at_idx on contacts (updated_at, id);
+"""
+
+FTS_MIN_TERM_LENGTH = 3  # trigram tokenizer cannot match shorter terms
+
+
+def date_value(value):
+    """'YYYY-MM-DD' for a date column; ValueError on anything that is not a date (as Postgres rejects it)"""
+    if value is None:
+        return None  # Left to the not null constraint
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        value = date.fromisoformat(str(value).strip())
+    return value.isoformat()
+
+
+def utc_timestamp(value=None):
+    """Fixed-width UTC ISO string so timestamps compare correctly as text"""
+    if value is None:
+        moment = datetime.now(timezone.utc)
+    elif isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def column_list(table, columns):
+    """Validate a PostgREST-style select string ('id, name') against the table"""
+    names = [name.strip() for name in columns.split(',') if name.strip()]
+    if names == ['*']:
+        return ', '.join(TABLE_COLUMNS[table])
+    unknown = [name for name in names if name not in TABLE_COLUMNS[table]]
+    if unknown:
+        raise ValueError(f"Unknown column(s) for {table}: {', '.join(unknown)}")
+    return ', '.join(names)
+
+
+def like_pattern(term):
+    """ilike-style substring pattern with LIKE wildcards escaped"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+class SqliteResult:
+    """Mimics a PostgREST response so QueryShape metrics/plugins apply unchanged"""
+
+    def __init__(self, data):
+        self.data = data
+
+
+class SqliteStatement:
+    """Deferred call: QueryShape runs build().execute()"""
+
+    def __init__(self, database, fn):
+        self.database = database
+        self.fn = fn
+
+    def execute(self):
+        conn = self.database.connection()
+        self.database.apply_call_timeout(conn)
+        return SqliteResult(self.fn(conn))
+
+
+class SqliteDatabase:
+    """One SQLite file; a connection per thread (WAL: concurrent readers, one writer)"""
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self.fts_enabled = False
+        directory = os.path.dirname(os.path.abspath(path))
+        if path != ':memory:':
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection must not cross a fork (gunicorn --preload): the child opens its own
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('pragma journal_mode=wal')
+            conn.execute('pragma synchronous=normal')
+            conn.execute(f'pragma busy_timeout={int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.busy_timeout_ms = int(self.busy_timeout_ms)
+        return conn
+
+    def apply_call_timeout(self, conn):
+        """Lock wait for this call: busy_timeout_ms, shortened to the current request's deadline"""
+        timeout_ms = int(call_timeout(self.busy_timeout_ms / 1000.0) * 1000)
+        if timeout_ms != self._local.busy_timeout_ms:
+            conn.execute(f'pragma busy_timeout={timeout_ms}')
+            self._local.busy_timeout_ms = timeout_ms
+
+    def _init_schema(self):
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        for table, column, definition in SCHEMA_UPGRADES:
+            existing = {row['name'] for row in conn.execute(f'pragma table_info({table})')}
+            if column not in existing:
+                conn.execute(f'alter table {table} add column {column} {definition}')
+                conn.execute(f'update {table} set {column} = created_at where {column} is null')
+        conn.executescript(INDEXES_AFTER_UPGRADE)
+        try:
+            conn.executescript(FTS_SCHEMA)
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            # Older SQLite builds without FTS5/trigram - search falls back to LIKE
+            logger.warning(f"[SQLITE] ⚠️ FTS5 trigram unavailable, using LIKE search: {e}")
+        logger.info(f"[SQLITE] ✅ Database ready at {self.path} (WAL, FTS5: {'on' if self.fts_enabled else 'off'})")
+
+    def call(self, fn):
+        return SqliteStatement(self, fn)
+
+    @contextmanager
+    def transaction(self, conn):
+        """BEGIN IMMEDIATE so read-then-write steps cannot interleave with another writer"""
+        conn.execute('begin immediate')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('rollback')
+            raise
+        conn.execute('commit')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+def rows_to_dicts(cursor):
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def placeholders(values):
+    return ', '.join('?' for _ in values)
+
+
+class SqliteRepo(BaseRepo):
+    """Shared plumbing: `client` is the SqliteDatabase (SQL runs directly - no table() builder)"""
+
+    def run(self, shape, fn, key=()):
+        return shape.execute(lambda: self.client.call(fn), key=key)
+
+    def columns(self, columns):
+        return column_list(self.table_name, columns)
+
+
+class SqliteEventsRepo(SqliteRepo):
+    """📅 events table"""
+
+    table_name = 'events'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        for name in ('list_for_user', 'list_all', 'list_on_date', 'search', 'get', 'get_many',
+                     'list_from_date', 'list_between', 'list_after_cursor', 'get_owned',
+                     'list_page_after_id', 'list_updated_since', 'export_page'):
+            setattr(self, f'_{name}', self.shape(name))
+        for name in ('insert', 'insert_many', 'update_owned', 'delete_owned', 'claim_reminders', 'release_reminders',
+                     'complete_owned', 'archive_past'):
+            setattr(self, f'_{name}', self.shape(name, idempotent=False))
+
+    def _select(self, shape, columns, where, params, order='event_date, id', limit=None, key=()):
+        sql = f"select {self.columns(columns)} from events where {where} order by {order}"
+        if limit:
+            sql += f" limit {int(limit)}"
+        return self.run(shape, lambda conn: rows_to_dicts(conn.execute(sql, params)), key=key)
+
+    def list_for_user(self, user_id, columns=EVENT_LIST_COLUMNS):
+        return self._select(self._list_for_user, columns, 'created_by = ?', (user_id,), key=(user_id, columns))
+
+    def list_all(self, columns=EVENT_LIST_COLUMNS):
+        return self._select(self._list_all, columns, '1 = 1', (), key=(columns,))
+
+    def list_visible(self, user_id, is_admin):
+        """Admins see every event, users only their own"""
+        return self.list_all() if is_admin else self.list_for_user(user_id)
+
+    def list_on_date(self, user_id, event_date):
+        return self._select(self._list_on_date, EVENT_LIST_COLUMNS, 'created_by = ? and event_date = ?',
+                            (user_id, event_date), key=(user_id, event_date))
+
+    def search(self, user_id, query, limit=None):
+        if self.client.fts_enabled and len(query) >= FTS_MIN_TERM_LENGTH:
+            where = 'created_by = ? and id in (select rowid from events_fts where events_fts match ?)'
+            params = (user_id, fts_phrase(query))
+        else:
+            where = "created_by = ? and (event_title like ? escape '\\' or event_description like ? escape '\\')"
+            params = (user_id, like_pattern(query), like_pattern(query))
+        return self._select(self._search, EVENT_LIST_COLUMNS, where, params, limit=limit, key=(user_id, query, limit))
+
+    def get(self, event_id, columns='id, created_by, event_title'):
+        rows = self._select(self._get, columns, 'id = ?', (int(event_id),), key=(str(event_id), columns))
+        return rows[0] if rows else None
+
+    def get_many(self, event_ids, columns=EVENT_REMINDER_COLUMNS):
+        if not event_ids:
+            return []
+        ids = [int(i) for i in event_ids]
+        return self._select(self._get_many, columns, f'id in ({placeholders(ids)})', ids,
+                            key=(tuple(sorted(str(i) for i in event_ids)), columns))
+
+    def list_from_date(self, start_date, columns=EVENT_REMINDER_COLUMNS):
+        return self._select(self._list_from_date, columns, 'event_date >= ?', (str(start_date),),
+                            key=(str(start_date), columns))
+
+    def list_between(self, start_date, end_date, columns=EVENT_REMINDER_COLUMNS):
+        return self._select(self._list_between, columns, 'event_date >= ? and event_date <= ?',
+                            (str(start_date), str(end_date)), key=(str(start_date), str(end_date), columns))
+
+    def list_after_cursor(self, cursor_date, cursor_id, last_date, limit, columns=EVENT_REMINDER_COLUMNS):
+        """Keyset page of unsent reminders in (event_date, id) order after the cursor, up to last_date"""
+        if cursor_id is None:
+            where, params = 'reminder_sent_at is null and event_date <= ? and event_date > ?', (last_date, cursor_date)
+        else:
+            where = 'reminder_sent_at is null and event_date <= ? and (event_date > ? or (event_date = ? and id > ?))'
+            params = (last_date, cursor_date, cursor_date, int(cursor_id))
+        return self._select(self._list_after_cursor, columns, where, params, limit=limit,
+                            key=(cursor_date, cursor_id, last_date, limit, columns))
+
+    def get_owned(self, event_id, user_id, is_admin, columns='id, created_by, event_title'):
+        """Event row if it exists and the user may manage it (owner or admin), else None"""
+        where, params = ('id = ?', (int(event_id),)) if is_admin else ('id = ? and created_by = ?', (int(event_id), user_id))
+        rows = self._select(self._get_owned, columns, where, params, key=(str(event_id), user_id, is_admin, columns))
+        return rows[0] if rows else None
+
+    def list_page_after_id(self, after_id, limit, columns=EVENT_REPLICA_COLUMNS):
+        """Keyset page in id order"""
+        return self._select(self._list_page_after_id, columns, 'id > ?', (int(after_id),), order='id', limit=limit,
+                            key=(after_id, limit, columns))
+
+    def list_updated_since(self, since, limit, columns=EVENT_REPLICA_COLUMNS, after_id=None):
+        """Rows stamped at or after the updated_at watermark; after_id continues a (updated_at, id) keyset"""
+        if after_id is None:
+            where, params = 'updated_at >= ?', (utc_timestamp(since),)
+        else:
+            where = 'updated_at > ? or (updated_at = ? and id > ?)'
+            params = (utc_timestamp(since), utc_timestamp(since), int(after_id))
+        return self._select(self._list_updated_since, columns, where, params,
+                            order='updated_at, id', limit=limit, key=(since, limit, columns, after_id))
+
+    def export_page(self, user_id, after_id, limit, columns=EVENT_EXPORT_COLUMNS):
+        """Keyset page in id order for bulk export; user_id None = every user's events"""
+        where, params = ('id > ?', (int(after_id),)) if user_id is None else ('id > ? and created_by = ?', (int(after_id), user_id))
+        return self._select(self._export_page, columns, where, params, order='id', limit=limit,
+                            key=(user_id, after_id, limit, columns))
+
+    def _insert_row(self, conn, values, now):
+        return rows_to_dicts(conn.execute(
+            "insert into events (event_title, event_description, event_date, created_by, created_at, updated_at) "
+            "values (?, ?, ?, ?, ?, ?) returning *",
+            (values.get('event_title'), values.get('event_description'), date_value(values.get('event_date')),
+             values.get('created_by'), utc_timestamp(values.get('created_at')) if values.get('created_at') else now, now)
+        ))
+
+    def insert(self, values):
+        return self.run(self._insert, lambda conn: self._insert_row(conn, values, utc_timestamp()))
+
+    def insert_many(self, rows):
+        """All rows in one transaction (bulk import); returns the inserted rows"""
+        def fn(conn):
+            now = utc_timestamp()
+            with self.client.transaction(conn):
+                return [inserted for values in rows for inserted in self._insert_row(conn, values, now)]
+        return self.run(self._insert_many, fn)
+
+    def update_owned(self, event_id, user_id, is_admin, values):
+        """Ownership-checked update; returns the updated rows (empty = missing or not allowed)"""
+        values = dict(values, updated_at=utc_timestamp())
+        if 'event_date' in values:
+            values['event_date'] = date_value(values['event_date'])
+        names = [name for name in values if name in TABLE_COLUMNS['events'] and name != 'id']
+        assignments = ', '.join(f'{name} = ?' for name in names)
+        params = [values[name] for name in names] + [int(event_id)]
+        where = 'id = ?'
+        if not is_admin:
+            where += ' and created_by = ?'
+            params.append(user_id)
+        return self.run(self._update_owned, lambda conn: rows_to_dicts(
+            conn.execute(f"update events set {assignments} where {where} returning *", params)
+        ))
+
+    def delete_owned(self, event_id, user_id, is_admin):
+        """Ownership-checked delete; returns the deleted rows (empty = missing or not allowed)"""
+        where, params = ('id = ?', (int(event_id),)) if is_admin else ('id = ? and created_by = ?', (int(event_id), user_id))
+        return self.run(self._delete_owned, lambda conn: rows_to_dicts(
+            conn.execute(f"delete from events where {where} returning *", params)
+        ))
+
+    def claim_reminders(self, event_ids, sent_at):
+        """Set reminder_sent_at on events that have none yet; returns the IDs (as str) this call claimed"""
+        if not event_ids:
+            return set()
+        ids = [int(i) for i in event_ids]
+        rows = self.run(self._claim_reminders, lambda conn: rows_to_dicts(conn.execute(
+            f"update events set reminder_sent_at = ?, updated_at = ? where id in ({placeholders(ids)}) and reminder_sent_at is null returning id",
+            [utc_timestamp(sent_at), utc_timestamp()] + ids
+        )))
+        return {str(row['id']) for row in rows}
+
+    def release_reminders(self, event_ids):
+        """Undo a claim when the push failed so the next pass retries"""
+        if not event_ids:
+            return []
+        ids = [int(i) for i in event_ids]
+        return self.run(self._release_reminders, lambda conn: rows_to_dicts(conn.execute(
+            f"update events set reminder_sent_at = null, updated_at = ? where id in ({placeholders(ids)}) returning id",
+            [utc_timestamp()] + ids
+        )))
+
+    def _move_to_archive(self, conn, where, params, reason, archived_by=None):
+        """Copy matching events to events_archive and delete them, in one transaction"""
+        with self.client.transaction(conn):
+            moved = rows_to_dicts(conn.execute(f"delete from events where {where} returning *", params))
+            archived_at = utc_timestamp()
+            conn.executemany(
+                "insert or ignore into events_archive (id, event_title, event_description, event_date, created_by, "
+                "created_at, reminder_sent_at, archive_reason, archived_by, archived_at) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row['id'], row['event_title'], row['event_description'], row['event_date'], row['created_by'],
+                  row['created_at'], row['reminder_sent_at'], reason, archived_by, archived_at) for row in moved]
+            )
+        return [dict(row, archive_reason=reason, archived_by=archived_by, archived_at=archived_at) for row in moved]
+
+    def complete_owned(self, event_id, user_id, is_admin):
+        """Ownership-checked move to events_archive; returns the archived rows"""
+        where, params = ('id = ?', (int(event_id),)) if is_admin else ('id = ? and created_by = ?', (int(event_id), user_id))
+        return self.run(self._complete_owned, lambda conn: self._move_to_archive(conn, where, params, 'completed', user_id))
+
+    def archive_past(self, before_date, limit):
+        """Move up to `limit` events dated before before_date to events_archive; returns moved rows"""
+        where = 'id in (select id from events where event_date < ? order by event_date, id limit ?)'
+        return self.run(self._archive_past, lambda conn: [
+            {'id': row['id']} for row in self._move_to_archive(conn, where, (str(before_date), int(limit)), 'past')
+        ])
+
+
+class SqliteEventsArchiveRepo(SqliteRepo):
+    """🗄️ events_archive - completed and long-past events, browsed page by page"""
+
+    table_name = 'events_archive'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._list_page = self.shape('list_page')
+
+    def list_page(self, user_id, is_admin, page, page_size, columns=EVENT_ARCHIVE_COLUMNS):
+        """One page (newest event_date first) plus one extra row to tell whether a next page exists"""
+        where, params = ('1 = 1', []) if is_admin else ('created_by = ?', [user_id])
+        sql = (f"select {self.columns(columns)} from events_archive where {where} "
+               f"order by event_date desc, id desc limit ? offset ?")
+        params = params + [page_size + 1, (page - 1) * page_size]
+        return self.run(self._list_page, lambda conn: rows_to_dicts(conn.execute(sql, params)),
+                        key=(user_id, is_admin, page, page_size, columns))
+
+
+class SqliteNotesRepo(SqliteRepo):
+    """📝 Notes (contacts table; body lives in phone_number)"""
+
+    table_name = 'contacts'
+
+    def __init__(self, client, registry=None, preview_length=201):
+        super().__init__(client, registry)
+        self.preview_length = preview_length
+        self._search = self.shape('search')
+        self._get = self.shape('get')
+        self._list_page_after_id = self.shape('list_page_after_id')
+        self._list_updated_since = self.shape('list_updated_since')
+        self._export_page = self.shape('export_page')
+        self._insert = self.shape('insert', idempotent=False)
+        self._insert_many = self.shape('insert_many', idempotent=False)
+        self._delete_owned = self.shape('delete_owned', idempotent=False)
+
+    def make_preview(self, content):
+        return (content or '')[:self.preview_length]
+
+    @staticmethod
+    def search_terms(query):
+        """Same word rule as NotesRepo.search_condition: multi-word queries match any word (max 3, 2+ chars)"""
+        words = [word.strip() for word in query.split()[:3] if len(word.strip()) >= 2] if len(query.split()) > 1 else []
+        return words or [query]
+
+    def search(self, user_id, query, limit=None):
+        terms = self.search_terms(query)
+        if self.client.fts_enabled and all(len(term) >= FTS_MIN_TERM_LENGTH for term in terms):
+            where = 'created_by = ? and id in (select rowid from contacts_fts where contacts_fts match ?)'
+            params = [user_id, ' OR '.join(fts_phrase(term) for term in terms)]
+        else:
+            where = 'created_by = ? and (' + ' or '.join(
+                "name like ? escape '\\' or phone_number like ? escape '\\'" for _ in terms) + ')'
+            params = [user_id]
+            for term in terms:
+                params += [like_pattern(term), like_pattern(term)]
+        sql = f"select {self.columns(NOTE_LIST_COLUMNS)} from contacts where {where} order by created_at desc, id desc"
+        if limit:
+            sql += f" limit {int(limit)}"
+        return self.run(self._search, lambda conn: rows_to_dicts(conn.execute(sql, params)), key=(user_id, query, limit))
+
+    def get(self, note_id, columns=NOTE_DETAIL_COLUMNS):
+        rows = self.run(self._get, lambda conn: rows_to_dicts(conn.execute(
+            f"select {self.columns(columns)} from contacts where id = ?", (int(note_id),)
+        )), key=(str(note_id), columns))
+        return rows[0] if rows else None
+
+    def list_page_after_id(self, after_id, limit, columns=NOTE_REPLICA_COLUMNS):
+        """Keyset page in id order"""
+        return self.run(self._list_page_after_id, lambda conn: rows_to_dicts(conn.execute(
+            f"select {self.columns(columns)} from contacts where id > ? order by id limit ?", (int(after_id), int(limit))
+        )), key=(after_id, limit, columns))
+
+    def list_updated_since(self, since, limit, columns=NOTE_REPLICA_COLUMNS, after_id=None):
+        """Rows stamped at or after the updated_at watermark; after_id continues a (updated_at, id) keyset"""
+        if after_id is None:
+            where, params = 'updated_at >= ?', [utc_timestamp(since)]
+        else:
+            where = 'updated_at > ? or (updated_at = ? and id > ?)'
+            params = [utc_timestamp(since), utc_timestamp(since), int(after_id)]
+        return self.run(self._list_updated_since, lambda conn: rows_to_dicts(conn.execute(
+            f"select {self.columns(columns)} from contacts where {where} order by updated_at, id limit ?",
+            params + [int(limit)]
+        )), key=(since, limit, columns, after_id))
+
+    def export_page(self, user_id, after_id, limit, columns=NOTE_EXPORT_COLUMNS):
+        """Keyset page in id order for bulk export; user_id None = every user's notes"""
+        where, params = ('id > ?', [int(after_id)]) if user_id is None else ('id > ? and created_by = ?', [int(after_id), user_id])
+        return self.run(self._export_page, lambda conn: rows_to_dicts(conn.execute(
+            f"select {self.columns(columns)} from contacts where {where} order by id limit ?", params + [int(limit)]
+        )), key=(user_id, after_id, limit, columns))
+
+    def _insert_row(self, conn, name, content, created_by, now):
+        return rows_to_dicts(conn.execute(
+            "insert into contacts (name, phone_number, content_preview, created_by, created_at, updated_at) "
+            "values (?, ?, ?, ?, ?, ?) returning *",
+            (name, content, self.make_preview(content), created_by, now, now)
+        ))
+
+    def insert(self, name, content, created_by):
+        return self.run(self._insert, lambda conn: self._insert_row(conn, name, content, created_by, utc_timestamp()))
+
+    def insert_many(self, notes):
+        """All {'name', 'content', 'created_by'} dicts in one transaction (bulk import)"""
+        def fn(conn):
+            now = utc_timestamp()
+            with self.client.transaction(conn):
+                return [inserted for note in notes
+                        for inserted in self._insert_row(conn, note['name'], note['content'], note['created_by'], now)]
+        return self.run(self._insert_many, fn)
+
+    def delete_owned(self, note_id, user_id, is_admin):
+        """Ownership-checked delete; returns the deleted rows"""
+        where, params = ('id = ?', (int(note_id),)) if is_admin else ('id = ? and created_by = ?', (int(note_id), user_id))
+        return self.run(self._delete_owned, lambda conn: rows_to_dicts(
+            conn.execute(f"delete from contacts where {where} returning *", params)
+        ))
+
+
+class SqliteNotificationsRepo(SqliteRepo):
+    """🔔 notifications log (history only - the hot path reads events.reminder_sent_at)"""
+
+    table_name = 'notifications'
+    archive_table_name = 'notifications_archive'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._probe = self.shape('probe')
+        self._log_sent = self.shape('log_sent', idempotent=False)
+        self._list_before = self.shape('list_before')
+        self._archive = self.registry.shape(f"{self.archive_table_name}.upsert", idempotent=False)
+        self._delete_ids = self.shape('delete_ids', idempotent=False)
+
+    def probe(self):
+        return self.run(self._probe, lambda conn: rows_to_dicts(conn.execute("select id from notifications limit 1")))
+
+    def log_sent(self, rows):
+        """One row per event (unique event_id) - a repeat send is a no-op"""
+        def fn(conn):
+            created_at = utc_timestamp()
+            conn.executemany(
+                "insert or ignore into notifications (event_id, user_id, notification_time, message, sent, created_at) "
+                "values (?, ?, ?, ?, ?, ?)",
+                [(int(row['event_id']), row['user_id'], utc_timestamp(row.get('notification_time')), row.get('message'),
+                  1 if row.get('sent') else 0, created_at) for row in rows]
+            )
+            return []
+        return self.run(self._log_sent, fn)
+
+    def list_before(self, cutoff, limit, columns=NOTIFICATION_LOG_COLUMNS):
+        """Oldest log rows created before cutoff, in id order"""
+        return self.run(self._list_before, lambda conn: rows_to_dicts(conn.execute(
+            f"select {self.columns(columns)} from notifications where created_at < ? order by id limit ?",
+            (utc_timestamp(cutoff), int(limit))
+        )), key=(cutoff, limit, columns))
+
+    def archive(self, rows):
+        """Copy rows to notifications_archive; re-copying after a crash is a no-op"""
+        def fn(conn):
+            archived_at = utc_timestamp()
+            conn.executemany(
+                "insert or ignore into notifications_archive (id, event_id, user_id, notification_time, message, sent, "
+                "created_at, archived_at) values (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row['id'], row.get('event_id'), row.get('user_id'), row.get('notification_time'), row.get('message'),
+                  row.get('sent'), row.get('created_at'), archived_at) for row in rows]
+            )
+            return []
+        return self.run(self._archive, fn)
+
+    def delete_ids(self, ids):
+        if not ids:
+            return []
+        ids = [int(i) for i in ids]
+        return self.run(self._delete_ids, lambda conn: rows_to_dicts(conn.execute(
+            f"delete from notifications where id in ({placeholders(ids)}) returning id", ids
+        )))
+
+
+class SqliteSubscribersRepo(SqliteRepo):
+    """👥 subscribers"""
+
+    table_name = 'subscribers'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._list_ids_page = self.shape('list_ids_page')
+        self._upsert_new = self.shape('upsert_new', idempotent=False)
+
+    def list_ids_page(self, start, page_size):
+        rows = self.run(self._list_ids_page, lambda conn: rows_to_dicts(conn.execute(
+            "select user_id from subscribers order by user_id limit ? offset ?", (int(page_size), int(start))
+        )), key=(start, page_size))
+        return [row['user_id'] for row in rows if row.get('user_id')]
+
+    def upsert_new(self, rows):
+        """Insert new subscribers; existing rows keep their original subscribed_at"""
+        def fn(conn):
+            conn.executemany(
+                "insert or ignore into subscribers (user_id, subscribed_at) values (?, ?)",
+                [(row['user_id'], utc_timestamp(row.get('subscribed_at'))) for row in rows]
+            )
+            return []
+        return self.run(self._upsert_new, fn)
+
+
+class SqliteJobStateRepo(SqliteRepo):
+    """⏱️ job_state (value stored as JSON text)"""
+
+    table_name = 'job_state'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._get = self.shape('get')
+        self._save = self.shape('save', idempotent=False)
+
+    def get(self, name):
+        rows = self.run(self._get, lambda conn: rows_to_dicts(conn.execute(
+            "select value from job_state where name = ?", (name,)
+        )), key=(name,))
+        return json.loads(rows[0]['value'] or '{}') if rows else {}
+
+    def save(self, name, value, updated_at):
+        return self.run(self._save, lambda conn: rows_to_dicts(conn.execute(
+            "insert into job_state (name, value, updated_at) values (?, ?, ?) "
+            "on conflict(name) do update set value = excluded.value, updated_at = excluded.updated_at returning name",
+            (name, json.dumps(value, ensure_ascii=False), utc_timestamp(updated_at))
+        )))
+
+
+class SqliteLeasesRepo(SqliteRepo):
+    """👑 scheduler_leases"""
+
+    table_name = 'scheduler_leases'
+
+    def __init__(self, client, registry=None):
+        super().__init__(client, registry)
+        self._renew = self.shape('renew', idempotent=False)
+        self._create = self.shape('create', idempotent=False)
+        self._release = self.shape('release', idempotent=False)
+
+    def renew_or_take_over(self, name, holder, now_str, expires_str):
+        """Renew our own lease or take over an expired one in one conditional update"""
+        return self.run(self._renew, lambda conn: rows_to_dicts(conn.execute(
+            "update scheduler_leases set holder = ?, expires_at = ? where name = ? and (holder = ? or expires_at < ?) returning name",
+            (holder, utc_timestamp(expires_str), name, holder, utc_timestamp(now_str))
+        )))
+
+    def create(self, name, holder, expires_str):
+        """First holder - the primary key makes this race-safe (raises if taken)"""
+        return self.run(self._create, lambda conn: rows_to_dicts(conn.execute(
+            "insert into scheduler_leases (name, holder, expires_at) values (?, ?, ?) returning name",
+            (name, holder, utc_timestamp(expires_str))
+        )))
+
+    def release(self, name, holder):
+        return self.run(self._release, lambda conn: rows_to_dicts(conn.execute(
+            "delete from scheduler_leases where name = ? and holder = ? returning name", (name, holder)
+        )))
+
+
+def export_rows(database, table, batch_size=500):
+    """Yield every row of a table in primary-key order (export tool)"""
+    key = TABLE_KEYS[table]
+    conn = database.connection()
+    last = None
+    while True:
+        if last is None:
+            cursor = conn.execute(f"select * from {table} order by {key} limit ?", (batch_size,))
+        else:
+            cursor = conn.execute(f"select * from {table} where {key} > ? order by {key} limit ?", (last, batch_size))
+        rows = rows_to_dicts(cursor)
+        for row in rows:
+            if table == 'job_state':
+                row['value'] = json.loads(row['value'] or '{}')
+            if 'sent' in row and row['sent'] is not None:
+                row['sent'] = bool(row['sent'])
+            yield row
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][key]
+
+
+def import_rows(database, table, rows):
+    """Upsert rows keeping their IDs (import tool); returns the count.
+    
+    Uses on conflict do update rather than insert or replace so the FTS
+    update triggers keep the search index in step.
+    """
+    if not rows:
+        return 0
+    key = TABLE_KEYS[table]
+    columns = [name for name in TABLE_COLUMNS[table] if any(name in row for row in rows)]
+    values = []
+    for row in rows:
+        row = dict(row)
+        if table == 'job_state':
+            row['value'] = json.dumps(row.get('value') or {}, ensure_ascii=False)
+        for name in TIMESTAMP_COLUMNS.intersection(columns):
+            if row.get(name):
+                row[name] = utc_timestamp(row[name])
+        values.append(tuple(row.get(name) for name in columns))
+    updates = ', '.join(f'{name} = excluded.{name}' for name in columns if name != key)
+    conn = database.connection()
+    with database.transaction(conn):
+        conn.executemany(
+            f"insert into {table} ({', '.join(columns)}) values ({placeholders(columns)}) "
+            f"on conflict({key}) do {'update set ' + updates if updates else 'nothing'}", values
+        )
+    return len(rows)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""gunicorn hooks (see Procfile)"""
+
+
+def post_fork(server, worker):
+    """Start leader election + notification jobs inside each worker.
+
+    With --preload the app is imported in the master; anything started there
+    (file lock, reminder heap, scheduler threads) would live in a process that
+    serves no requests, so the notification system starts after the fork.
+    """
+    from api.index import start_notification_system, logger
+    start_notification_system()
+    logger.info(f"[INIT] 🔔 Notification system initialized in worker {worker.pid}")
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+🔁 STORAGE TRANSFER - export/import all bot data between storage backends
+
+Data moves through a JSON Lines dump ({"table": ..., "row": {...}} per line),
+so either side can be Supabase or SQLite and the dump doubles as a backup.
+Rows keep their IDs; importing the same dump twice is an upsert, not a duplicate.
+
+    # Supabase -> SQLite
+    python scripts/storage_transfer.py export --backend supabase --file dump.jsonl
+    python scripts/storage_transfer.py import --backend sqlite --sqlite-path data/linebot.db --file dump.jsonl
+
+    # SQLite -> Supabase (then reset the id sequences, see the printed SQL)
+    python scripts/storage_transfer.py export --backend sqlite --sqlite-path data/linebot.db --file dump.jsonl
+    python scripts/storage_transfer.py import --backend supabase --file dump.jsonl
+
+Supabase credentials come from SUPABASE_URL / SUPABASE_SERVICE_KEY (.env is loaded).
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.sqlite_repository import SqliteDatabase, TABLE_KEYS, export_rows, import_rows  # noqa: E402
+
+# Export order; import follows the same order (scheduler_leases is transient and not copied)
+TABLES = ['events', 'events_archive', 'contacts', 'notifications', 'notifications_archive',
+          'subscribers', 'job_state']
+# Tables with bigserial ids whose sequence must move past imported ids
+SERIAL_TABLES = ['events', 'contacts', 'notifications']
+BATCH_SIZE = 500
+
+
+def supabase_client():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    from supabase import create_client
+    url, key = os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY')
+    if not url or not key:
+        raise SystemExit('❌ SUPABASE_URL and SUPABASE_SERVICE_KEY are required')
+    return create_client(url, key)
+
+
+def supabase_export_rows(client, table):
+    """Keyset pages in primary-key order"""
+    key = TABLE_KEYS[table]
+    last = None
+    while True:
+        query = client.table(table).select('*').order(key, desc=False).limit(BATCH_SIZE)
+        if last is not None:
+            query = query.gt(key, last)
+        rows = query.execute().data or []
+        yield from rows
+        if len(rows) < BATCH_SIZE:
+            return
+        last = rows[-1][key]
+
+
+def supabase_import_rows(client, table, rows):
+    if rows:
+        client.table(table).upsert(rows, on_conflict=TABLE_KEYS[table]).execute()
+    return len(rows)
+
+
+def open_backend(args):
+    if args.backend == 'sqlite':
+        database = SqliteDatabase(args.sqlite_path)
+        return (lambda table: export_rows(database, table, BATCH_SIZE)), (lambda table, rows: import_rows(database, table, rows))
+    client = supabase_client()
+    return (lambda table: supabase_export_rows(client, table)), (lambda table, rows: supabase_import_rows(client, table, rows))
+
+
+def run_export(args, export):
+    counts = {}
+    with open(args.file, 'w', encoding='utf-8') as out:
+        for table in args.tables:
+            counts[table] = 0
+            try:
+                for row in export(table):
+                    out.write(json.dumps({'table': table, 'row': row}, ensure_ascii=False, default=str) + '\n')
+                    counts[table] += 1
+            except Exception as e:
+                print(f'⚠️ {table}: skipped ({e})')
+            print(f'📤 {table}: {counts[table]} rows')
+    return counts
+
+
+def run_import(args, load):
+    counts = {table: 0 for table in args.tables}
+    pending = {table: [] for table in args.tables}
+
+    def flush(table):
+        counts[table] += load(table, pending[table])
+        pending[table] = []
+
+    with open(args.file, encoding='utf-8') as dump:
+        for line in dump:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            table = record['table']
+            if table not in pending:
+                continue
+            pending[table].append(record['row'])
+            if len(pending[table]) >= BATCH_SIZE:
+                flush(table)
+    for table in args.tables:
+        flush(table)
+        print(f'📥 {table}: {counts[table]} rows')
+
+    if args.backend == 'supabase':
+        print('\n💡 Move the id sequences past the imported rows (SQL editor):')
+        for table in SERIAL_TABLES:
+            print(f"   select setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 1)) from {table};")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export/import LINE bot data between storage backends')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('--backend', choices=['supabase', 'sqlite'], required=True)
+    parser.add_argument('--sqlite-path', default=os.getenv('SQLITE_PATH', 'data/linebot.db'))
+    parser.add_argument('--file', required=True, help='JSON Lines dump to write (export) or read (import)')
+    parser.add_argument('--tables', nargs='+', default=TABLES, choices=TABLES)
+    args = parser.parse_args()
+
+    export, load = open_backend(args)
+    if args.command == 'export':
+        run_export(args, export)
+    else:
+        run_import(args, load)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
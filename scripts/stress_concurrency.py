@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+🧵 CONCURRENCY STRESS TEST - many users, many threads, one worker process
+
+Drives the real webhook handlers from a thread pool the way a gthread worker
+would: every simulated user runs complete add-event / add-note flows while
+also double-tapping postbacks, with many users in parallel. Runs in-process
+against a throwaway SQLite database; LINE API calls are recorded instead of
+sent. Afterwards it checks the invariants of the concurrency model
+(see "CONCURRENCY" in api/index.py):
+
+- every flow step got exactly one reply, none of them an error
+- every user's saved events/notes are exactly the ones that user typed
+- a burst of identical postbacks from one user is processed once
+
+    pip install -r requirements.txt
+    python scripts/stress_concurrency.py --users 200 --threads 32 --rounds 5
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class RecordingLineApi:
+    """Stands in for MessagingApi: records replies per reply token, sends nothing"""
+
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+        self.lock = threading.Lock()
+        self.replies = defaultdict(list)  # reply_token -> [texts]
+
+    def reply_message(self, request, **kwargs):
+        time.sleep(self.latency_seconds)
+        texts = [getattr(message, 'text', None) or getattr(message, 'alt_text', '') for message in request.messages]
+        with self.lock:
+            self.replies[request.reply_token].append(texts)
+
+    def push_message(self, request, **kwargs):
+        time.sleep(self.latency_seconds)
+
+    def show_loading_animation(self, request, **kwargs):
+        pass
+
+
+def boot(args):
+    """Import the app against a fresh SQLite file with LINE calls recorded"""
+    workdir = tempfile.mkdtemp(prefix='linebot-stress-')
+    os.environ.update({
+        'STORAGE_BACKEND': 'sqlite',
+        'SQLITE_PATH': os.path.join(workdir, 'stress.db'),
+        'LINE_ACCESS_TOKEN': os.getenv('LINE_ACCESS_TOKEN', 'stress-test'),
+        'LINE_CHANNEL_SECRET': os.getenv('LINE_CHANNEL_SECRET', 'stress-test'),
+        'NOTIFICATION_MODE': 'cron',  # no scheduler threads during the run
+        'READ_REPLICA': 'false',
+    })
+    from api import index
+    index.line_bot_api = RecordingLineApi(args.reply_latency_ms / 1000.0)
+    return index
+
+
+def message_event(user_id, text, token):
+    return SimpleNamespace(
+        source=SimpleNamespace(type='user', user_id=user_id),
+        message=SimpleNamespace(text=text),
+        reply_token=token
+    )
+
+
+def postback_event(user_id, data, token):
+    return SimpleNamespace(
+        source=SimpleNamespace(type='user', user_id=user_id),
+        postback=SimpleNamespace(data=data),
+        reply_token=token
+    )
+
+
+def run_user(index, user_id, rounds, burst, rng, tokens):
+    """One user's session: sequential flows (like a person typing) plus postback bursts"""
+    expected = {'events': [], 'notes': []}
+    bursts = []
+
+    def send(handler, event_factory, payload):
+        token = f'{user_id}-{next(tokens)}'
+        handler(event_factory(user_id, payload, token))
+        return token
+
+    flow_tokens = []
+    for n in range(rounds):
+        title, description = f'{user_id}-event-{n}', f'desc-{n}-{rng.random():.6f}'
+        event_date = f'2030-01-{(n % 28) + 1:02d}'
+        for text in ('เพิ่มกิจกรรม', title, description, event_date):
+            flow_tokens.append(send(index.handle_message, message_event, text))
+        expected['events'].append((title, description, event_date))
+
+        name, content = f'{user_id}-note-{n}', f'body-{n}-{rng.random():.6f}'
+        for text in ('เพิ่มโน๊ต', name, content):
+            flow_tokens.append(send(index.handle_message, message_event, text))
+        expected['notes'].append((name, content))
+
+        # Double/triple tap: identical postbacks fired at once from several threads
+        index.last_postback_time.pop(user_id, None)
+        burst_tokens = [f'{user_id}-{next(tokens)}' for _ in range(burst)]
+        threads = [
+            threading.Thread(target=index.handle_postback, args=(postback_event(user_id, 'archive_page_1', token),))
+            for token in burst_tokens
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        bursts.append(burst_tokens)
+    return expected, flow_tokens, bursts
+
+
+def check(index, results):
+    api = index.line_bot_api
+    failures = Counter()
+    for user_id, (expected, flow_tokens, bursts) in results.items():
+        for token in flow_tokens:
+            replies = api.replies.get(token, [])
+            if len(replies) != 1:
+                failures['flow step without exactly one reply'] += 1
+            elif any(text.startswith('❌') for text in replies[0]):
+                failures['flow step replied with an error'] += 1
+
+        events = index.events_repo.list_for_user(user_id)
+        saved_events = sorted((e['event_title'], e['event_description'], str(e['event_date'])[:10]) for e in events)
+        if saved_events != sorted(expected['events']):
+            failures['events differ from what the user typed'] += 1
+
+        notes = index.notes_repo.search(user_id, f'{user_id}-note')
+        saved_notes = sorted(note['name'] for note in notes)
+        if saved_notes != sorted(name for name, _content in expected['notes']):
+            failures['notes differ from what the user typed'] += 1
+
+        for burst_tokens in bursts:
+            processed = sum(1 for token in burst_tokens if api.replies.get(token))
+            if processed != 1:
+                failures['postback burst processed %d times' % processed] += 1
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress the webhook handlers with concurrent users')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=32, help='concurrent users (request threads)')
+    parser.add_argument('--rounds', type=int, default=3, help='add-event + add-note flows per user')
+    parser.add_argument('--burst', type=int, default=3, help='identical postbacks per double-tap burst')
+    parser.add_argument('--reply-latency-ms', type=float, default=5.0, help='simulated LINE API latency')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    index = boot(args)
+    rng = random.Random(args.seed)
+    tokens = itertools.count()  # reply tokens; next() on a count is atomic
+    users = [f'Ustress{n:05d}' for n in range(args.users)]
+    seeds = {user_id: random.Random(rng.random()) for user_id in users}
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        futures = {
+            user_id: pool.submit(run_user, index, user_id, args.rounds, args.burst, seeds[user_id], tokens)
+            for user_id in users
+        }
+        results = {user_id: future.result() for user_id, future in futures.items()}
+    elapsed = time.time() - started
+
+    failures = check(index, results)
+    steps = sum(len(flow_tokens) for _expected, flow_tokens, _bursts in results.values())
+    print(f'🧵 {args.users} users x {args.rounds} rounds on {args.threads} threads: '
+          f'{steps} flow steps in {elapsed:.1f}s ({steps / elapsed:.0f} steps/s)')
+    if failures:
+        for reason, count in failures.most_common():
+            print(f'❌ {reason}: {count}')
+        return 1
+    print('✅ All invariants held')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+-- ========================================
+-- LINE Bot - baseline schema
+-- Tables the bot reads and writes, written so it is safe to run against an
+-- existing Supabase project (create/add only if missing).
+-- Apply with: supabase db push   (or psql -f, in filename order)
+-- ========================================
+
+-- Events (กิจกรรม)
+create table if not exists events (
+    id bigserial primary key,
+    event_title text not null,
+    event_description text,
+    event_date date not null,
+    created_by text not null,
+    created_at timestamptz not null default now()
+);
+
+-- Notes (โน๊ต) - stored in contacts; the note body lives in phone_number
+create table if not exists contacts (
+    id bigserial primary key,
+    name text not null,
+    phone_number text,
+    created_by text not null,
+    created_at timestamptz not null default now()
+);
+
+-- Short preview read by list views; only "ดูเต็ม" loads phone_number
+alter table contacts add column if not exists content_preview text;
+update contacts set content_preview = left(phone_number, 201) where content_preview is null;
+
+-- Reminder log
+create table if not exists notifications (
+    id bigserial primary key,
+    event_id bigint not null,
+    user_id text not null,
+    notification_time timestamptz not null default now(),
+    message text,
+    sent boolean not null default false,
+    created_at timestamptz not null default now()
+);
+
+-- Every user that has talked to the bot
+create table if not exists subscribers (
+    user_id text primary key,
+    subscribed_at timestamptz not null default now()
+);
+
+-- Persisted job watermarks/cursors (cron notification pass)
+create table if not exists job_state (
+    name text primary key,
+    value jsonb not null default '{}'::jsonb,
+    updated_at timestamptz not null default now()
+);
+
+-- Scheduler leader lease (SCHEDULER_LEADER_MODE=lease)
+create table if not exists scheduler_leases (
+    name text primary key,
+    holder text not null,
+    expires_at timestamptz not null
+);
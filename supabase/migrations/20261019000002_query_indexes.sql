@@ -0,0 +1,36 @@
+-- ========================================
+-- Indexes matching the repository query shapes (api/repository.py)
+-- ========================================
+
+create extension if not exists pg_trgm;
+
+-- events.list_for_user / list_on_date / search: created_by = ? [and event_date = ?] order by event_date
+create index if not exists events_created_by_event_date_idx
+    on events (created_by, event_date, id);
+
+-- events.list_all (admin), list_between / list_from_date (reminders), list_after_cursor (cron keyset)
+create index if not exists events_event_date_id_idx
+    on events (event_date, id);
+
+-- events.search: event_title/event_description ilike '%q%'
+create index if not exists events_event_title_trgm_idx
+    on events using gin (event_title gin_trgm_ops);
+create index if not exists events_event_description_trgm_idx
+    on events using gin (event_description gin_trgm_ops);
+
+-- notes.search: created_by = ? ... order by created_at desc
+create index if not exists contacts_created_by_created_at_idx
+    on contacts (created_by, created_at desc);
+
+-- notes.search: name/phone_number ilike '%q%'
+create index if not exists contacts_name_trgm_idx
+    on contacts using gin (name gin_trgm_ops);
+create index if not exists contacts_phone_number_trgm_idx
+    on contacts using gin (phone_number gin_trgm_ops);
+
+-- notifications.log_sent (upsert on_conflict event_id): unique index in
+-- 20261019000006_notifications_one_row_per_event.sql, after its dedupe
+
+-- subscribers: upsert on_conflict user_id (no-op when user_id is already the primary key)
+create unique index if not exists subscribers_user_id_key
+    on subscribers (user_id);
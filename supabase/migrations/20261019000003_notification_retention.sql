@@ -0,0 +1,30 @@
+-- ========================================
+-- Notification retention
+-- The reminder hot path reads a per-event marker instead of the log, and old
+-- log rows move to notifications_archive (purge job: /cron/retention or the
+-- daily scheduler job).
+-- ========================================
+
+-- Last reminder sent for this event (null = not reminded yet)
+alter table events add column if not exists reminder_sent_at timestamptz;
+
+update events e
+    set reminder_sent_at = n.notification_time
+    from notifications n
+    where n.event_id = e.id and n.sent and e.reminder_sent_at is null;
+
+-- Archive of log rows past NOTIFICATION_RETENTION_DAYS
+create table if not exists notifications_archive (
+    id bigint primary key,
+    event_id bigint,
+    user_id text,
+    notification_time timestamptz,
+    message text,
+    sent boolean,
+    created_at timestamptz,
+    archived_at timestamptz not null default now()
+);
+
+-- notifications.list_before: created_at < cutoff order by id
+create index if not exists notifications_created_at_idx
+    on notifications (created_at, id);
@@ -0,0 +1,73 @@
+-- ========================================
+-- Events archive
+-- Completed events and events long past their date move out of the hot
+-- events table, so list views and the reminder scheduler only ever scan
+-- current events. Moves are done by the functions below (delete + insert in
+-- one statement), called through PostgREST rpc.
+-- ========================================
+
+create table if not exists events_archive (
+    id bigint primary key,
+    event_title text not null,
+    event_description text,
+    event_date date not null,
+    created_by text not null,
+    created_at timestamptz,
+    reminder_sent_at timestamptz,
+    archive_reason text not null,  -- 'completed' | 'past'
+    archived_by text,
+    archived_at timestamptz not null default now()
+);
+
+-- events_archive.list_page: created_by = ? order by event_date desc, id desc
+create index if not exists events_archive_created_by_event_date_idx
+    on events_archive (created_by, event_date desc, id desc);
+create index if not exists events_archive_event_date_idx
+    on events_archive (event_date desc, id desc);
+
+-- Complete an event: ownership-checked move to the archive, one round-trip.
+-- Returns the archived row (none = missing or not allowed).
+create or replace function complete_event(p_event_id bigint, p_user_id text, p_is_admin boolean)
+returns setof events_archive
+language sql
+as $$
+    with moved as (
+        delete from events
+        where id = p_event_id and (p_is_admin or created_by = p_user_id)
+        returning *
+    )
+    insert into events_archive (id, event_title, event_description, event_date, created_by,
+                                created_at, reminder_sent_at, archive_reason, archived_by)
+    select id, event_title, event_description, event_date, created_by,
+           created_at, reminder_sent_at, 'completed', p_user_id
+    from moved
+    on conflict (id) do nothing
+    returning *;
+$$;
+
+-- Move up to p_limit events dated before p_before to the archive.
+-- Returns the moved IDs; call repeatedly until fewer than p_limit come back.
+create or replace function archive_past_events(p_before date, p_limit integer)
+returns table (id bigint)
+language sql
+as $$
+    with batch as (
+        select e.id from events e
+        where e.event_date < p_before
+        order by e.event_date, e.id
+        limit p_limit
+        for update skip locked
+    ), moved as (
+        delete from events e
+        using batch
+        where e.id = batch.id
+        returning e.*
+    )
+    insert into events_archive (id, event_title, event_description, event_date, created_by,
+                                created_at, reminder_sent_at, archive_reason)
+    select m.id, m.event_title, m.event_description, m.event_date, m.created_by,
+           m.created_at, m.reminder_sent_at, 'past'
+    from moved m
+    on conflict (id) do nothing
+    returning events_archive.id;
+$$;
@@ -0,0 +1,33 @@
+-- ========================================
+-- updated_at watermark for the in-process read replica (READ_REPLICA=true)
+-- Every insert/update stamps updated_at, so replicas poll
+-- "updated_at >= watermark" for changes. Deletes are found by a periodic
+-- id reconcile.
+-- ========================================
+
+alter table events add column if not exists updated_at timestamptz not null default now();
+alter table contacts add column if not exists updated_at timestamptz not null default now();
+
+create or replace function set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+drop trigger if exists events_set_updated_at on events;
+create trigger events_set_updated_at
+    before update on events
+    for each row execute function set_updated_at();
+
+drop trigger if exists contacts_set_updated_at on contacts;
+create trigger contacts_set_updated_at
+    before update on contacts
+    for each row execute function set_updated_at();
+
+-- replica poll: updated_at >= ? order by updated_at, id
+create index if not exists events_updated_at_idx on events (updated_at, id);
+create index if not exists contacts_updated_at_idx on contacts (updated_at, id);
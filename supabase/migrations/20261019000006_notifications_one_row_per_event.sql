@@ -0,0 +1,19 @@
+-- ========================================
+-- One notification log row per event
+-- notifications.log_sent writes the log with
+-- upsert on_conflict (event_id) ignore duplicates
+-- (insert ... on conflict (event_id) do nothing), which needs a unique index
+-- on notifications.event_id.
+--
+-- DATA-DESTRUCTIVE: before the index can be built, duplicate log rows are
+-- DELETED - for every event_id only the oldest row (lowest id) is kept.
+-- Take a backup of notifications first if the duplicate history matters
+-- (e.g. create table notifications_backup as select * from notifications).
+-- ========================================
+
+delete from notifications n
+    using notifications d
+    where n.event_id = d.event_id and n.id > d.id;
+
+create unique index if not exists notifications_event_id_key
+    on notifications (event_id);
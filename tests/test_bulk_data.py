@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Streaming JSON import (bulk_data.read_json_records)"""
+
+import io
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import bulk_data
+from api.bulk_data import ImportFormatError, read_json_records, validate_event
+
+
+class CountingStream(io.BytesIO):
+    """Request stream stand-in that records how many bytes were read"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def event_record(number):
+    return {'event_title': f'งาน {number}', 'event_description': 'x' * (number % 50),
+            'event_date': '2026-10-19', 'created_by': 'U0001'}
+
+
+def as_array(records):
+    return ('[\n' + ',\n'.join(json.dumps(record, ensure_ascii=False) for record in records) + '\n]\n').encode()
+
+
+def as_lines(records):
+    return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode()
+
+
+@pytest.mark.parametrize('encode', [as_array, as_lines])
+def test_records_spanning_chunks(monkeypatch, encode):
+    # Tiny chunks cut through strings, numbers, literals and multi-byte characters
+    monkeypatch.setattr(bulk_data, 'READ_CHUNK_BYTES', 7)
+    records = [dict(event_record(number), n=-12.5e3, ok=True, none=None) for number in range(40)]
+    assert list(read_json_records(io.BytesIO(encode(records)))) == records
+
+
+def test_malformed_record_mid_file_fails_fast():
+    records = [event_record(number) for number in range(50000)]
+    data = as_lines(records[:10]) + b'{"event_title": "broken" "event_date": "2026-10-19"}\n' + as_lines(records)
+    stream = CountingStream(data)
+    parsed = []
+    with pytest.raises(ImportFormatError, match="Expecting ',' delimiter"):
+        for record in read_json_records(stream):
+            parsed.append(record)
+    assert parsed == records[:10]
+    # Raised from the first chunk, not after buffering the rest of the upload
+    assert stream.bytes_read <= bulk_data.READ_CHUNK_BYTES
+
+
+def test_unterminated_record_is_bounded(monkeypatch):
+    monkeypatch.setattr(bulk_data, 'MAX_JSON_RECORD_CHARS', 1000)
+    stream = CountingStream(b'{"event_title": "' + b'x' * 10 * bulk_data.READ_CHUNK_BYTES)
+    with pytest.raises(ImportFormatError, match='longer than 1000'):
+        list(read_json_records(stream))
+    assert stream.bytes_read <= 2 * bulk_data.READ_CHUNK_BYTES
+
+
+def test_large_input_is_linear():
+    records = [event_record(number) for number in range(100000)]
+    data = as_array(records)
+    started = time.monotonic()
+    count = sum(1 for _record in read_json_records(io.BytesIO(data)))
+    assert count == len(records)
+    # Re-slicing the buffer per record copied up to a chunk per record
+    assert time.monotonic() - started < 10
+
+
+@pytest.mark.parametrize('event_date', ['2026-1-5', '2026-01-05garbage', '2026-02-30', 'hello', ''])
+def test_event_dates_are_validated_in_full(event_date):
+    values, error = validate_event(dict(event_record(1), event_date=event_date), None)
+    assert values is None and 'event_date' in error
+
+
+def test_event_dates_are_normalized():
+    values, error = validate_event(dict(event_record(1), event_date=' 2026-01-05 '), None)
+    assert error is None and values['event_date'] == '2026-01-05'
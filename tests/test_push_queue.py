@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Push queue leases (api/push_queue.py)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.push_queue import PushQueue
+
+
+def test_sent_once_after_lease_takeover(tmp_path):
+    sent = []
+    queue = PushQueue(str(tmp_path / 'queue.db'), deliver=lambda job: None, lease_seconds=-1)
+    queue._ensure_running = lambda: None  # The test plays both workers; no background thread
+    queue.register('reminder', on_sent=lambda job: sent.append(job['id']))
+    queue.enqueue('reminder:U1:1', 'reminder', 'U1', 'hello')
+
+    # The first worker's lease runs out while it is still sending; a second worker takes the job over
+    slow_worker = queue._claim_due()
+    queue.lease_seconds = 60
+    takeover = queue._claim_due()
+    assert slow_worker and [job['id'] for job in slow_worker] == [job['id'] for job in takeover]
+
+    queue._attempt(takeover[0])
+    queue._attempt(slow_worker[0])
+    assert sent == [takeover[0]['id']]
+    assert queue.delivered == 1
+
+
+def test_stale_lease_cannot_dead_letter(tmp_path):
+    dead = []
+
+    def deliver(job):
+        raise RuntimeError('LINE unavailable')
+
+    queue = PushQueue(str(tmp_path / 'queue.db'), deliver=deliver, max_attempts=1, lease_seconds=-1)
+    queue._ensure_running = lambda: None
+    queue.register('reminder', on_dead=lambda job: dead.append(job['id']))
+    queue.enqueue('reminder:U1:1', 'reminder', 'U1', 'hello')
+
+    slow_worker = queue._claim_due()
+    queue.lease_seconds = 60
+    takeover = queue._claim_due()
+    queue._attempt(slow_worker[0])
+    assert dead == [] and queue.dead_lettered == 0
+    queue._attempt(takeover[0])
+    assert dead == [takeover[0]['id']]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Reminders for events created outside the leader process (ReminderIndex change scan)"""
+
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+for module in ('flask', 'linebot', 'pytz', 'supabase', 'dotenv'):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RecordingPushApi:
+    def __init__(self):
+        self.pushes = []
+
+    def push_message(self, request, **kwargs):
+        self.pushes.append((request.to, [message.text for message in request.messages]))
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('reminders')
+    os.environ.update({
+        'STORAGE_BACKEND': 'sqlite',
+        'SQLITE_PATH': str(workdir / 'test.db'),
+        'LINE_ACCESS_TOKEN': 'test',
+        'LINE_CHANNEL_SECRET': 'test',
+        'NOTIFICATION_MODE': 'cron',  # No election / scheduler threads
+        'PUSH_QUEUE': 'false',
+        'READ_REPLICA': 'false',
+        'KEEP_ALIVE_URL': '',
+    })
+    from api import index
+    return index
+
+
+def test_event_created_in_another_process_is_reminded(index, monkeypatch):
+    line_api = RecordingPushApi()
+    monkeypatch.setattr(index, 'line_bot_api', line_api)
+    event_date = index.get_current_thai_time().date() + timedelta(days=1)
+    due_time = index.get_reminder_due_time(event_date.isoformat())
+
+    # The leader loaded its heap before the event existed
+    leader = index.ReminderIndex()
+    leader.load()
+
+    # A worker that is not the leader handles the add-event flow: its own index does nothing
+    worker_index = index.ReminderIndex()
+    event = index.events_repo.insert({
+        'event_title': 'created by another worker',
+        'event_description': '',
+        'event_date': event_date.isoformat(),
+        'created_by': 'Utestreminder0001'
+    })[0]
+    assert worker_index.schedule(event) is False
+    assert str(event['id']) not in leader._entries
+
+    # The leader's next tick picks it up through the change scan ...
+    assert leader.sync_changes() >= 1
+    assert str(event['id']) in leader._entries
+
+    # ... and the reminder goes out at its due time
+    monkeypatch.setattr(index, 'get_current_thai_time', lambda: due_time + timedelta(minutes=1))
+    leader._fire([leader._entries[str(event['id'])][2]])
+    assert any(user_id == 'Utestreminder0001' and 'created by another worker' in texts[0]
+               for user_id, texts in line_api.pushes)
+
+
+def test_edit_in_another_process_moves_the_reminder(index, monkeypatch):
+    now = index.get_current_thai_time()
+    leader = index.ReminderIndex()
+    event = index.events_repo.insert({
+        'event_title': 'moved later',
+        'event_description': '',
+        'event_date': (now.date() + timedelta(days=2)).isoformat(),
+        'created_by': 'Utestreminder0002'
+    })[0]
+    leader.load()
+    before = leader._entries[str(event['id'])][0]
+
+    index.events_repo.update_owned(event['id'], 'Utestreminder0002', False,
+                                   {'event_date': (now.date() + timedelta(days=5)).isoformat()})
+    leader.sync_changes()
+    assert leader._entries[str(event['id'])][0] - before == pytest.approx(3 * 24 * 3600)
+
+
+def test_cron_pass_starts_inside_the_catchup_window(index, monkeypatch):
+    monkeypatch.setattr(index, 'line_bot_api', RecordingPushApi())
+    monkeypatch.setattr(index.Config, 'CRON_BATCH_SIZE', 5)
+    event_date = index.get_current_thai_time().date() + timedelta(days=10)
+    # Unsent events whose reminders were due before the catch-up window started
+    for _ in range(10):
+        index.events_repo.insert({'event_title': 'missed', 'event_description': '',
+                                  'event_date': event_date.isoformat(), 'created_by': 'Utestreminder0003'})
+    due_time = index.get_reminder_due_time(event_date.isoformat())
+    later = due_time + timedelta(hours=index.Config.CRON_CATCHUP_HOURS, minutes=30)
+    monkeypatch.setattr(index, 'get_current_thai_time', lambda: later)
+
+    # They are skipped for good, so the walk does not read them again on every pass
+    result = index.run_notification_pass()
+    assert result['processed'] == 0 and result['sent'] == 0
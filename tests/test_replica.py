@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Read replica change polling (api/replica.py)"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.replica import TableReplica, date_key
+from api.repository import QueryRegistry
+from api.sqlite_repository import SqliteDatabase, SqliteEventsRepo, SqliteNotesRepo
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SqliteDatabase(str(tmp_path / 'test.db'))
+    yield database
+    database.close()
+
+
+def test_poll_pages_through_a_bulk_write_without_reloading(database, monkeypatch):
+    events = SqliteEventsRepo(database, QueryRegistry())
+    replica = TableReplica('events', events, ['created_by', 'event_date'], page_size=10,
+                           index_keys={'event_date': date_key})
+    replica.load()
+    monkeypatch.setattr(replica, 'load', lambda: pytest.fail('poll fell back to a full reload'))
+
+    # insert_many stamps every row with the same updated_at
+    events.insert_many([{'event_title': f'event {number}', 'event_description': '', 'event_date': '2026-10-19',
+                         'created_by': 'U0001'} for number in range(25)])
+    assert replica.poll() == 25
+    assert len(replica.select('event_date', '2026-10-19')) == 25
+
+
+def test_notes_poll_pages_on_the_keyset(database, monkeypatch):
+    notes = SqliteNotesRepo(database, QueryRegistry())
+    replica = TableReplica('contacts', notes, ['created_by'], page_size=10)
+    replica.load()
+    monkeypatch.setattr(replica, 'load', lambda: pytest.fail('poll fell back to a full reload'))
+
+    notes.insert_many([{'name': f'note {number}', 'content': 'x', 'created_by': 'U0001'} for number in range(25)])
+    assert replica.poll() == 25
+    assert len(replica.select('created_by', 'U0001')) == 25
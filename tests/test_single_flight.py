@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Coalesced and hedged reads (repository.SingleFlight, HedgedReads) under a request deadline"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.deadline import DeadlineExceeded, RequestDeadlines
+from api.repository import HedgedReads, QueryShape, SingleFlight
+
+
+class SlowQuery:
+    """build() result whose execute() blocks until released"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.rows = [{'id': 1}]
+
+    def execute(self):
+        self.started.set()
+        self.release.wait(5)
+        return type('Response', (), {'data': self.rows})()
+
+
+def test_follower_gives_up_at_its_deadline():
+    shape = QueryShape('events.list_for_user')
+    shape.add_plugin(SingleFlight())
+    query = SlowQuery()
+    leader = threading.Thread(target=shape.execute, args=(lambda: query, ('U1',)))
+    leader.start()
+    assert query.started.wait(5)
+
+    deadlines = RequestDeadlines(budget_seconds=0.2, reply_reserve_seconds=0.1)
+    started = time.monotonic()
+    with deadlines.scope() as deadline:
+        with pytest.raises(DeadlineExceeded):
+            shape.execute(lambda: query, ('U1',))
+    assert time.monotonic() - started < 1
+    assert deadline.exceeded
+
+    query.release.set()
+    leader.join(5)
+
+
+def test_follower_without_deadline_gets_the_rows():
+    shape = QueryShape('events.list_for_user')
+    shape.add_plugin(SingleFlight())
+    query = SlowQuery()
+    results = []
+    leader = threading.Thread(target=lambda: results.append(shape.execute(lambda: query, ('U1',))))
+    leader.start()
+    assert query.started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(shape.execute(lambda: query, ('U1',))))
+    follower.start()
+    time.sleep(0.05)
+    query.release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == [[{'id': 1}], [{'id': 1}]]
+
+
+def test_leader_mutation_is_not_seen_by_followers():
+    shape = QueryShape('events.list_for_user')
+    shape.add_plugin(SingleFlight())
+    query = SlowQuery()
+    results = {}
+
+    def leader_call():
+        rows = shape.execute(lambda: query, ('U1',))
+        rows[0]['id'] = 'changed by the leader'
+        rows.append({'id': 2})
+        results['leader'] = rows
+
+    leader = threading.Thread(target=leader_call)
+    leader.start()
+    assert query.started.wait(5)
+    follower = threading.Thread(target=lambda: results.setdefault('follower', shape.execute(lambda: query, ('U1',))))
+    follower.start()
+    time.sleep(0.05)
+    query.release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results['follower'] == [{'id': 1}]
+    assert query.rows == [{'id': 1}]
+
+
+@pytest.mark.parametrize('burst', [0, 1])  # Over the hedge budget / hedged
+def test_hedged_read_gives_up_at_its_deadline(burst):
+    shape = QueryShape('events.list_for_user')
+    shape.add_plugin(HedgedReads(['events.list_for_user'], burst=burst, min_samples=1, min_delay_ms=10))
+    shape.stats.record(1.0, rows=1)
+    query = SlowQuery()
+
+    deadlines = RequestDeadlines(budget_seconds=0.3, reply_reserve_seconds=0.1)
+    started = time.monotonic()
+    with deadlines.scope() as deadline:
+        with pytest.raises(DeadlineExceeded):
+            shape.execute(lambda: query, ('U1',))
+    assert time.monotonic() - started < 1
+    assert deadline.exceeded
+    query.release.set()
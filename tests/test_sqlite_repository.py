@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""SQLite backend: event dates and per-process connections (api/sqlite_repository.py)"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.repository import QueryRegistry
+from api.sqlite_repository import SqliteDatabase, SqliteEventsRepo
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SqliteDatabase(str(tmp_path / 'test.db'))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def events(database):
+    return SqliteEventsRepo(database, QueryRegistry())
+
+
+def event(event_date):
+    return {'event_title': 'title', 'event_description': '', 'event_date': event_date, 'created_by': 'U0001'}
+
+
+@pytest.mark.parametrize('event_date', ['hello', '2026-1-5', '2026-01-05garbage', '2026-02-30'])
+def test_insert_rejects_invalid_dates(events, event_date):
+    with pytest.raises(ValueError):
+        events.insert(event(event_date))
+    assert events.list_all() == []
+
+
+def test_insert_and_update_store_iso_dates(events):
+    inserted = events.insert(event(' 2026-01-05 '))[0]
+    assert inserted['event_date'] == '2026-01-05'
+
+    with pytest.raises(ValueError):
+        events.update_owned(inserted['id'], 'U0001', False, {'event_date': '2026-1-6'})
+    updated = events.update_owned(inserted['id'], 'U0001', False, {'event_date': '2026-01-06'})
+    assert updated[0]['event_date'] == '2026-01-06'
+    assert [row['id'] for row in events.list_on_date('U0001', '2026-01-06')] == [inserted['id']]
+
+
+def test_connection_is_reopened_after_fork(database, monkeypatch):
+    parent = database.connection()
+    assert database.connection() is parent
+    monkeypatch.setattr(os, 'getpid', lambda: -1)  # As seen from a forked child
+    child = database.connection()
+    assert child is not parent
+    assert database.connection() is child